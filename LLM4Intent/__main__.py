@@ -1,115 +1,118 @@
 # %%
 import os
 import json
+import time
+import asyncio
+import contextlib
+import contextvars
+import glob
+import multiprocessing
 import concurrent.futures
-from typing import Any, Dict, List, Mapping, Optional, Tuple
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
 from dotenv import load_dotenv
-from openai import Client, OpenAI
+from openai import AsyncClient, AsyncOpenAI, Client, OpenAI
 import argparse
 
+from LLM4Intent.common.results_store import ResultsStore, Stage
+from LLM4Intent.common.stages import amemoize, artifact_key, memoize
+from LLM4Intent.common.tokens import current_transaction, usage_tracker
 from LLM4Intent.common.utils import get_logger
-from LLM4Intent.roles.main_analyzer import MetaControlAnalyzer
-from LLM4Intent.roles.stateless_checker import StatelessChecker
+from LLM4Intent.roles.main_analyzer import MetaControlAnalyzer, Plan
+from LLM4Intent.roles.stateless_checker import CheckReport, StatelessChecker
 from LLM4Intent.roles.sub_analyzer import DomainExpertAnalyzer
-from LLM4Intent.roles.stateless_scorer import StatelessScorer
+from LLM4Intent.roles.stateless_scorer import FinalReport, StatelessScorer
 
 from LLM4Intent.tools.annotated import *
+from LLM4Intent.tools.jsonrpc import (
+    aget_transaction_facts_from_jsonrpc,
+    get_transaction_facts_from_jsonrpc,
+)
+from LLM4Intent.tools.labels import refresh_label_dataset
 
 # 加载环境变量
 load_dotenv()
 
 # 初始化 OpenAI 客户端
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # 默认模型配置
 DEFAULT_MODEL_NAME = "openai/gpt-4o-mini"  # 根据需要替换为实际模型，例如 "gpt-4o"
 SUMMARIZING_MODEL_NAME = "gpt-4o-mini"
 THINKING_MODEL_NAME = "gpt-4o-mini"
-TOKEN_LIMIT = 128000  # 根据模型调整
 
-
-# %%
-logger = get_logger("Workflow")
-
-
-def collect_fact(transaction_hash: str):
-    transaction = get_transaction_from_jsonrpc(transaction_hash)
-    receipt = get_transaction_receipt_from_jsonrpc(transaction_hash)
-    to_address = transaction["to"]
-    from_address = transaction["from"]
-    fact = {
-        **transaction,
-        **receipt,
-        "from_label": get_address_label(from_address),
-        "to_label": get_address_label(to_address),
-    }
-
-    return fact
+# bump whenever collect_fact changes what it returns, to invalidate memoized facts
+FACTS_VERSION = 4
 
 
 # %%
-def workflow(transaction_hash: str, hierarchical_intents: Mapping):
-    fake_chat_history = [
-        {
-            "role": "user",
-            "content": f"Please analyze the transaction {transaction_hash}.",
-        },
-        {
-            "role": "assistant",
-            "content": """
-Sure,
-To analyze the transaction, I would break down the analysis into several parts:
-1. analyze the contract definition and its functions, finding the intent behind each function
-2. analyze the context of the transaction, finding the intent behind the sender and receiver
-3. analyze the market situation, finding the intent behind the transaction"
-""",
-        },
-    ]
-
-    all_available_tools = [
-        get_transaction,
-        get_transaction_receipt,
-        get_transaction_trace,
-        get_address_label,
-        get_address_transactions_within_block_number_range,
-        get_address_eth_balance_at_block_number,
-        get_address_token_balance_at_block_number,
-        get_address_token_transfers_within_block_number_range,
-        get_contract_code_at_block_number,
-        get_contract_storage_at_block_number,
-        get_token_transfers_within_block_number_range,
-        get_contract_creation,
-        get_contract_ABI,
-        get_contract_basic_info,
-        get_contract_source_code,
-        get_contract_code_at_block_number,
-        get_function_signature,
-        get_event_signature,
-        get_transaction_time,
-        search_webpages,
-        extract_webpage_info_by_urls,
-    ]
+logger = get_logger("Workflow")
 
+ALL_AVAILABLE_TOOLS = [
+    get_transaction,
+    get_transaction_receipt,
+    get_transaction_trace,
+    get_address_label,
+    get_address_labels,
+    get_address_transactions_within_block_number_range,
+    get_address_eth_balance_at_block_number,
+    get_address_token_balance_at_block_number,
+    get_balances_at_block_numbers,
+    get_address_token_transfers_within_block_number_range,
+    get_contract_code_at_block_number,
+    get_contract_storage_at_block_number,
+    get_token_transfers_within_block_number_range,
+    get_contract_creation,
+    get_contract_ABI,
+    get_contract_basic_info,
+    get_contracts_basic_info,
+    get_contract_source_overview,
+    get_contract_function_source,
+    search_contract_source,
+    get_contract_code_at_block_number,
+    get_function_signature,
+    get_event_signature,
+    get_transaction_time,
+    get_block_timestamp,
+    get_block_number_at_time,
+    search_webpages,
+    extract_webpage_info_by_urls,
+    get_webpage_content,
+    page_tool_result,
+    filter_tool_result,
+    project_tool_result,
+    aggregate_tool_result,
+]
+
+
+def build_perspective_analyzers(
+    llm_client: Union[Client, AsyncClient],
+) -> List[MetaControlAnalyzer]:
     defi_contract_analyzer = MetaControlAnalyzer(
         "grok-2-latest",
-        client,
+        llm_client,
         perspective="DeFi Contract Analysis",
         tips="""
 To analyze the contract, you must understand its functions and the events it emits.
+The input of the transaction is already decoded in decoded_input of the facts (function, signature, named arguments and the nested calls of multicalls and routers), and its logs in decoded_logs (event name, signature and named arguments), start from them.
 You can use the following tools (not limited) to analyze the contract:
 - get_contract_basic_info: to get the basic information of the contract, if the contract is a proxy, try analyzing the implementation contract
+- get_contracts_basic_info: to get the basic information of several contracts at once, e.g. all the tokens in the receipt logs
 - get_contract_ABI: to get the contract's functions and events
-- get_function_signature: to get the signature of a specific function
-- get_event_signature: to decode the hex signature of a specific event in the logs
-- get_contract_source_code: to get the source code of the contract, if available
+- get_function_signature: to get the signature of a specific function that is not in decoded_input
+- get_event_signature: to decode the hex signature of an event in the logs that is not in decoded_logs
+- get_contract_source_overview: to list the contracts, functions, modifiers and events of the verified source code, if available
+- get_contract_function_source: to read the code of a function (by name or selector), modifier or event of the verified source
+- search_contract_source: to find where a variable, call or address appears in the verified source
 - get_address_label: to get the label of the contract creator, token addresses etc.
+- get_address_labels: to get the labels of many addresses at once, e.g. all the addresses in the receipt logs
 - get_contract_creation: to get the creator address of the contract, maybe it has a special meaning
 NEVER try decoding the raw data directly by yourself, ALWAYS use the tools provided.
 """,
     )
     context_analyzer = MetaControlAnalyzer(
         "grok-2-latest",
-        client,
+        llm_client,
         perspective="Transaction Contextual Information",
         tips="""
 To analyze the context, you must understand the sender, receiver, and the purpose of the transaction.
@@ -117,47 +120,195 @@ You can use the following tools (not limited) to analyze the context:
 - get_address_transactions_within_block_number_range: to get the transactions of an address within a block number range
 - get_address_token_balance_at_block_number: to get the token balance of an address at a specific block number
 - get_address_eth_balance_at_block_number: to get the ETH balance of an address at a specific block number
+- get_balances_at_block_numbers: to get the ETH and token balances of all participants before (block_number - 1) and after (block_number) the transaction in one call
 - get_address_token_transfers_within_block_number_range: to get the token transfers of an address within a block number range
 - get_token_transfers_within_block_number_range: to get the token transfers of a contract within a block number range
+- filter_tool_result, aggregate_tool_result: to query a large result returned as an artifact (e.g. find the transfers above an amount, sum the transfers per token) instead of paging through it with page_tool_result
 NEVER try decoding the transaction data or logs directly yourself, ALWAYS use the tools provided.
 """,
     )
     market_analyzer = MetaControlAnalyzer(
         "grok-2-latest",
-        client,
+        llm_client,
         perspective="Market Analysis",
         tips=""""
 To analyze the market situation, you must understand the market conditions and the impact on the transaction.
 You can use the following tools  (not limited) to analyze the market:
 - get_transaction_time: to get the time of the transaction
+- get_block_timestamp: to get the time of any block
+- get_block_number_at_time: to turn a date into a block number, e.g. to query what happened in the days or weeks around the transaction
 - search_webpages: to search for relevant webpages related to the transaction, contract, or addresses
-- extract_webpage_info_by_urls: to extract information from the webpages found
+- extract_webpage_info_by_urls: to extract the passages of the webpages found that are relevant to the question, optionally focused by a query
+- get_webpage_content: to read a whole extracted webpage by its handle, when the passages are not enough
 NEVER try decoding the raw data directly by yourself, ALWAYS use the tools provided.
 """,
     )
     abnormality_analyzer = MetaControlAnalyzer(
         "grok-2-latest",
-        client,
+        llm_client,
         perspective="Abnormality Detection",
         tips="""
 To detect abnormalities, you must understand the normal behavior and patterns in the transaction, trying to compare the transaction with the normal ones.
 You can use the following tools (not limited) to detect abnormalities:
 - get_transaction_trace: to get the trace of the transaction, checking whether it is an exploit
 - get_contract_storage_at_block_number: to get the contract storage at the transaction block number and the previous block number, checking for any changes
+- get_balances_at_block_numbers: to get the balance changes of all participants and tokens around the transaction, checking who gained and who lost
 - get_contract_code_at_block_number: to get the contract code at a specific block number, checking whether it's a specific contract for exploiting
 - get_address_transactions_within_block_number_range: to get the transactions of an address within a block number range, checking the money laundering pattern
 - get_address_token_transfers_within_block_number_range: to get the token transfers of an address within a block number range, checking the money laundering pattern
 - get_token_transfers_within_block_number_range: to get the ERC20 token transfers(swaps) within a block number range, checking whether it's a rugpull etc.
+- filter_tool_result, aggregate_tool_result: to query a large result returned as an artifact (e.g. find the transfers above an amount, sum the transfers per token) instead of paging through it with page_tool_result
 NEVER try decoding the raw data directly by yourself, ALWAYS use the tools provided.
 """,
     )
 
-    transaction_fact = collect_fact(transaction_hash)
+    return [
+        defi_contract_analyzer,
+        context_analyzer,
+        market_analyzer,
+        abnormality_analyzer,
+    ]
+
+
+
+def facts_cache_key(transaction_hash: str) -> str:
+    return artifact_key(Stage.FACTS, transaction_hash.lower(), FACTS_VERSION)
+
+
+def _build_fact(facts, from_label, to_label, decoded_input, decoded_logs):
+    return {
+        **facts["transaction"],
+        **facts["receipt"],
+        "decoded_input": decoded_input,
+        "decoded_logs": decoded_logs,
+        "blockTimestamp": facts["block_timestamp"],
+        "from_address_type": facts["from_address_type"],
+        "to_address_type": facts["to_address_type"],
+        "from_label": from_label,
+        "to_label": to_label,
+    }
+
+
+def _endpoint_labels(transaction) -> Tuple[list, list]:
+    # the labels of the sender and the receiver in one batch lookup
+    labels = get_address_labels(
+        [address for address in (transaction["from"], transaction["to"]) if address]
+    )
+    return labels[transaction["from"]], labels.get(transaction["to"], [])
+
+
+def collect_fact(transaction_hash: str):
+    # transaction, receipt, block timestamp and address types in two batched round trips
+    facts = get_transaction_facts_from_jsonrpc(transaction_hash)
+    transaction = facts["transaction"]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        labels = executor.submit(_endpoint_labels, transaction)
+        decoded_input = executor.submit(call_decoder.decode_transaction, transaction)
+        decoded_logs = executor.submit(
+            log_decoder.decode_logs, facts["receipt"]["logs"]
+        )
+        return _build_fact(
+            facts, *labels.result(), decoded_input.result(), decoded_logs.result()
+        )
+
+
+async def acollect_fact(transaction_hash: str):
+    """Async variant of `collect_fact`, independent lookups are issued concurrently"""
+    facts = await aget_transaction_facts_from_jsonrpc(transaction_hash)
+    transaction = facts["transaction"]
+    labels, decoded_input, decoded_logs = await asyncio.gather(
+        asyncio.to_thread(_endpoint_labels, transaction),
+        asyncio.to_thread(call_decoder.decode_transaction, transaction),
+        asyncio.to_thread(log_decoder.decode_logs, facts["receipt"]["logs"]),
+    )
+    return _build_fact(facts, *labels, decoded_input, decoded_logs)
+
+
+def _persist(
+    store: Optional[ResultsStore],
+    transaction_hash: str,
+    stage: str,
+    payload: Any,
+    name: str = "",
+):
+    if store is not None:
+        store.append(transaction_hash, stage, payload, name=name)
+
+
+@contextlib.contextmanager
+def _token_accounting(store: Optional[ResultsStore], transaction_hash: str):
+    # attribute the LLM calls made inside to the transaction, and store their
+    # token usage per role once it is analyzed (or failed)
+    token = current_transaction.set(transaction_hash)
+    try:
+        yield
+    finally:
+        current_transaction.reset(token)
+        usage = usage_tracker.pop(transaction_hash)
+        if usage:
+            logger.info("Token usage of {}: {}".format(transaction_hash, usage))
+            _persist(store, transaction_hash, Stage.TOKEN_USAGE, usage)
+
+
+# %%
+def workflow(
+    transaction_hash: str,
+    hierarchical_intents: Mapping,
+    store: Optional[ResultsStore] = None,
+) -> FinalReport:
+    """Analyze the intent of one transaction
+
+    Each stage output is memoized in the store under a key covering its inputs,
+    prompts and model, so a re-run only recomputes the stages that changed.
+    """
+    with _token_accounting(store, transaction_hash):
+        return _workflow(transaction_hash, hierarchical_intents, store)
+
+
+def _workflow(
+    transaction_hash: str,
+    hierarchical_intents: Mapping,
+    store: Optional[ResultsStore],
+) -> FinalReport:
+    print(f"Analyzing transaction: {transaction_hash}")
+
+    fake_chat_history = [
+        {
+            "role": "user",
+            "content": f"Please analyze the transaction {transaction_hash}.",
+        },
+        {
+            "role": "assistant",
+            "content": """
+Sure,
+To analyze the transaction, I would break down the analysis into several parts:
+1. analyze the contract definition and its functions, finding the intent behind each function
+2. analyze the context of the transaction, finding the intent behind the sender and receiver
+3. analyze the market situation, finding the intent behind the transaction"
+""",
+        },
+    ]
+
+    transaction_fact = memoize(
+        store,
+        Stage.FACTS,
+        facts_cache_key(transaction_hash),
+        lambda: collect_fact(transaction_hash),
+    )
+    _persist(store, transaction_hash, Stage.FACTS, transaction_fact)
 
     main_analyzer_reports = {}
 
     def run_analyzer(analyzer: MetaControlAnalyzer) -> Tuple[str, str]:
-        plan = analyzer.breakdown(transaction_hash)
+        plan = memoize(
+            store,
+            Stage.PLAN,
+            analyzer.breakdown_cache_key(transaction_hash),
+            lambda: analyzer.breakdown(transaction_hash),
+            load=Plan.model_validate,
+        )
+        analyzer.plan = plan
+        _persist(store, transaction_hash, Stage.PLAN, plan, name=analyzer.perspective)
 
         chat_histories = []
         for todo in plan.items:
@@ -167,27 +318,52 @@ NEVER try decoding the raw data directly by yourself, ALWAYS use the tools provi
                 client,
                 known_facts=transaction_fact,
                 main_perspective=analyzer.perspective,
-                tools=all_available_tools,
+                tools=ALL_AVAILABLE_TOOLS,
             )
 
-            chat_histories = sub_analyzer.analyze(
-                chat_histories, breakdown_question, prompt=item_prompt
+            chat_histories = memoize(
+                store,
+                Stage.SUB_ANALYSIS,
+                sub_analyzer.analyze_cache_key(
+                    chat_histories, breakdown_question, item_prompt
+                ),
+                lambda: sub_analyzer.analyze(
+                    chat_histories, breakdown_question, prompt=item_prompt
+                ),
+            )
+            _persist(
+                store,
+                transaction_hash,
+                Stage.SUB_ANALYSIS,
+                chat_histories,
+                name=analyzer.perspective,
             )
 
-        analyzed_intent = analyzer.analyze(hierarchical_intents, chat_histories)
+        analyzed_intent = memoize(
+            store,
+            Stage.PERSPECTIVE_REPORT,
+            analyzer.analyze_cache_key(hierarchical_intents, chat_histories),
+            lambda: analyzer.analyze(hierarchical_intents, chat_histories),
+        )
+        _persist(
+            store,
+            transaction_hash,
+            Stage.PERSPECTIVE_REPORT,
+            analyzed_intent,
+            name=analyzer.perspective,
+        )
         return analyzer.perspective, analyzed_intent
 
-    analyzers = [
-        defi_contract_analyzer,
-        context_analyzer,
-        market_analyzer,
-        abnormality_analyzer,
-    ]
+    analyzers = build_perspective_analyzers(client)
 
     # Execute analyzers in parallel
     with concurrent.futures.ThreadPoolExecutor() as executor:
         futures = {
-            executor.submit(run_analyzer, analyzer): analyzer for analyzer in analyzers
+            # the threads keep the transaction the token usage is counted for
+            executor.submit(
+                contextvars.copy_context().run, run_analyzer, analyzer
+            ): analyzer
+            for analyzer in analyzers
         }
         for future in concurrent.futures.as_completed(futures):
             perspective, analyzed_intent = future.result()
@@ -202,32 +378,601 @@ NEVER try decoding the raw data directly by yourself, ALWAYS use the tools provi
     #     "transaction_fact": transaction_fact,
     # }
 
+    # keep the check prompt independent of which perspective finished first
+    main_analyzer_reports = dict(sorted(main_analyzer_reports.items()))
+
     checker = StatelessChecker("grok-2-latest", client)
-    check_report = checker.check(hierarchical_intents, main_analyzer_reports)
+    check_report = memoize(
+        store,
+        Stage.CHECK_REPORT,
+        checker.check_cache_key(hierarchical_intents, main_analyzer_reports),
+        lambda: checker.check(hierarchical_intents, main_analyzer_reports),
+        load=CheckReport.model_validate,
+    )
 
+    _persist(store, transaction_hash, Stage.CHECK_REPORT, check_report)
     logger.info("check_report {}".format(check_report))
 
     scorer = StatelessScorer("grok-2-latest", client)
-    final_report = scorer.score(check_report, hierarchical_intents)
+    final_report = memoize(
+        store,
+        Stage.FINAL_REPORT,
+        scorer.score_cache_key(check_report, hierarchical_intents),
+        lambda: scorer.score(check_report, hierarchical_intents),
+        load=FinalReport.model_validate,
+    )
 
+    _persist(store, transaction_hash, Stage.FINAL_REPORT, final_report)
     logger.warning("Final report: {}".format(final_report))
 
+    return final_report
+
+
+async def aworkflow(
+    transaction_hash: str,
+    hierarchical_intents: Mapping,
+    store: Optional[ResultsStore] = None,
+) -> FinalReport:
+    """Async variant of `workflow`, all LLM calls share the running event loop"""
+    with _token_accounting(store, transaction_hash):
+        return await _aworkflow(transaction_hash, hierarchical_intents, store)
+
+
+async def _aworkflow(
+    transaction_hash: str,
+    hierarchical_intents: Mapping,
+    store: Optional[ResultsStore],
+) -> FinalReport:
+    print(f"Analyzing transaction: {transaction_hash}")
+
+    transaction_fact = await amemoize(
+        store,
+        Stage.FACTS,
+        facts_cache_key(transaction_hash),
+        lambda: acollect_fact(transaction_hash),
+    )
+    _persist(store, transaction_hash, Stage.FACTS, transaction_fact)
+
+    async def run_analyzer(analyzer: MetaControlAnalyzer) -> Tuple[str, str]:
+        plan = await amemoize(
+            store,
+            Stage.PLAN,
+            analyzer.breakdown_cache_key(transaction_hash),
+            lambda: analyzer.abreakdown(transaction_hash),
+            load=Plan.model_validate,
+        )
+        analyzer.plan = plan
+        _persist(store, transaction_hash, Stage.PLAN, plan, name=analyzer.perspective)
+
+        chat_histories = []
+        for todo in plan.items:
+            breakdown_question, item_prompt = todo.question, todo.prompt
+            sub_analyzer = DomainExpertAnalyzer(
+                "grok-2-latest",
+                async_client,
+                known_facts=transaction_fact,
+                main_perspective=analyzer.perspective,
+                tools=ALL_AVAILABLE_TOOLS,
+            )
+
+            chat_histories = await amemoize(
+                store,
+                Stage.SUB_ANALYSIS,
+                sub_analyzer.analyze_cache_key(
+                    chat_histories, breakdown_question, item_prompt
+                ),
+                lambda: sub_analyzer.aanalyze(
+                    chat_histories, breakdown_question, prompt=item_prompt
+                ),
+            )
+            _persist(
+                store,
+                transaction_hash,
+                Stage.SUB_ANALYSIS,
+                chat_histories,
+                name=analyzer.perspective,
+            )
+
+        analyzed_intent = await amemoize(
+            store,
+            Stage.PERSPECTIVE_REPORT,
+            analyzer.analyze_cache_key(hierarchical_intents, chat_histories),
+            lambda: analyzer.aanalyze(hierarchical_intents, chat_histories),
+        )
+        _persist(
+            store,
+            transaction_hash,
+            Stage.PERSPECTIVE_REPORT,
+            analyzed_intent,
+            name=analyzer.perspective,
+        )
+        return analyzer.perspective, analyzed_intent
+
+    main_analyzer_reports = dict(
+        sorted(
+            await asyncio.gather(
+                *(
+                    run_analyzer(analyzer)
+                    for analyzer in build_perspective_analyzers(async_client)
+                )
+            )
+        )
+    )
+
+    checker = StatelessChecker("grok-2-latest", async_client)
+    check_report = await amemoize(
+        store,
+        Stage.CHECK_REPORT,
+        checker.check_cache_key(hierarchical_intents, main_analyzer_reports),
+        lambda: checker.acheck(hierarchical_intents, main_analyzer_reports),
+        load=CheckReport.model_validate,
+    )
+
+    _persist(store, transaction_hash, Stage.CHECK_REPORT, check_report)
+    logger.info("check_report {}".format(check_report))
+
+    scorer = StatelessScorer("grok-2-latest", async_client)
+    final_report = await amemoize(
+        store,
+        Stage.FINAL_REPORT,
+        scorer.score_cache_key(check_report, hierarchical_intents),
+        lambda: scorer.ascore(check_report, hierarchical_intents),
+        load=FinalReport.model_validate,
+    )
+
+    _persist(store, transaction_hash, Stage.FINAL_REPORT, final_report)
+    logger.warning("Final report: {}".format(final_report))
+
+    return final_report
+
+
+def dedupe_transactions(transaction_hashes: List[str]) -> List[str]:
+    """Drop repeated hashes (case-insensitive), keeping the first occurrence"""
+    seen = set()
+    unique_hashes = []
+    for transaction_hash in transaction_hashes:
+        key = transaction_hash.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        unique_hashes.append(transaction_hash)
+    return unique_hashes
+
+
+def pending_transactions(
+    transaction_hashes: List[str],
+    store: Optional[ResultsStore] = None,
+    skip_completed: bool = True,
+) -> List[str]:
+    """Dedupe the hashes and drop those already completed in the store"""
+    transaction_hashes = dedupe_transactions(transaction_hashes)
+    if store is None or not skip_completed:
+        return transaction_hashes
+
+    completed = store.completed_transactions()
+    pending = [tx for tx in transaction_hashes if tx.lower() not in completed]
+    if len(pending) < len(transaction_hashes):
+        logger.info(
+            "Skipping {} transactions already completed in {}".format(
+                len(transaction_hashes) - len(pending), store.path
+            )
+        )
+    return pending
+
+
+def completed_reports(
+    transaction_hashes: List[str],
+    store: Optional[ResultsStore] = None,
+    skip_completed: bool = True,
+) -> Dict[str, dict]:
+    """The stored final reports of the transactions `pending_transactions` drops"""
+    if store is None or not skip_completed:
+        return {}
+
+    completed = store.completed_transactions()
+    return {
+        tx: store.latest(tx, Stage.FINAL_REPORT)
+        for tx in dedupe_transactions(transaction_hashes)
+        if tx.lower() in completed
+    }
+
+
+def _log_progress(done: int, total: int, failed: int, started_at: float):
+    elapsed_minutes = (time.monotonic() - started_at) / 60
+    logger.info(
+        "Progress {}/{} ({} failed), throughput {:.2f} tx/min".format(
+            done,
+            total,
+            failed,
+            done / elapsed_minutes if elapsed_minutes else 0.0,
+        )
+    )
+
+
+def _log_batch_finished(total: int, failed: int, started_at: float):
+    elapsed_minutes = (time.monotonic() - started_at) / 60
+    logger.warning(
+        "Batch finished: {} transactions ({} failed) in {:.1f} min, {:.2f} tx/min".format(
+            total,
+            failed,
+            elapsed_minutes,
+            total / elapsed_minutes if elapsed_minutes else 0.0,
+        )
+    )
+
+
+def run_batch(
+    transaction_hashes: List[str],
+    hierarchical_intents: Mapping,
+    concurrency: int = 1,
+    store: Optional[ResultsStore] = None,
+    skip_completed: bool = True,
+) -> Dict[str, Optional[FinalReport]]:
+    """Analyze many transactions, at most `concurrency` of them at once
+
+    A failing transaction is logged and recorded as None, it does not abort the
+    rest of the batch.
+
+    Args:
+        transaction_hashes: The transactions to analyze, duplicates are skipped
+        hierarchical_intents: The intent categories to classify against
+        concurrency: The global limit of transactions analyzed in parallel
+        store: Where stage artifacts are persisted and memoized
+        skip_completed: Skip transactions that already have a final report in the
+            store, their stored report is returned
+
+    Returns:
+        Dict[str, Optional[FinalReport]]: The final report of each transaction
+    """
+    completed = completed_reports(transaction_hashes, store, skip_completed)
+    transaction_hashes = pending_transactions(
+        transaction_hashes, store, skip_completed
+    )
+    total = len(transaction_hashes)
+    results: Dict[str, Optional[FinalReport]] = {}
+    failed = 0
+
+    logger.info(
+        "Analyzing {} transactions with concurrency {}".format(total, concurrency)
+    )
+    started_at = time.monotonic()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(
+                workflow, transaction_hash, hierarchical_intents, store
+            ): transaction_hash
+            for transaction_hash in transaction_hashes
+        }
+        for future in concurrent.futures.as_completed(futures):
+            transaction_hash = futures[future]
+            try:
+                results[transaction_hash] = future.result()
+            except Exception as e:
+                failed += 1
+                results[transaction_hash] = None
+                logger.error(
+                    "Failed to analyze transaction {}: {}".format(transaction_hash, e)
+                )
+                _persist(store, transaction_hash, Stage.ERROR, {"error": str(e)})
+
+            _log_progress(len(results), total, failed, started_at)
+
+    _log_batch_finished(total, failed, started_at)
+
+    # the skipped transactions keep their stored report in the batch output
+    return {**_stored_final_reports(completed), **results}
+
+
+async def arun_batch(
+    transaction_hashes: List[str],
+    hierarchical_intents: Mapping,
+    concurrency: int = 1,
+    store: Optional[ResultsStore] = None,
+    skip_completed: bool = True,
+) -> Dict[str, Optional[FinalReport]]:
+    """Async variant of `run_batch`, every transaction runs on one event loop
+
+    Args:
+        transaction_hashes: The transactions to analyze, duplicates are skipped
+        hierarchical_intents: The intent categories to classify against
+        concurrency: The global limit of transactions analyzed in parallel
+        store: Where stage artifacts are persisted and memoized
+        skip_completed: Skip transactions that already have a final report in the
+            store, their stored report is returned
+
+    Returns:
+        Dict[str, Optional[FinalReport]]: The final report of each transaction
+    """
+    completed = completed_reports(transaction_hashes, store, skip_completed)
+    transaction_hashes = pending_transactions(
+        transaction_hashes, store, skip_completed
+    )
+    total = len(transaction_hashes)
+    results: Dict[str, Optional[FinalReport]] = {}
+    failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    logger.info(
+        "Analyzing {} transactions with concurrency {} (async)".format(
+            total, concurrency
+        )
+    )
+    started_at = time.monotonic()
+
+    async def run_one(transaction_hash: str):
+        nonlocal failed
+        async with semaphore:
+            try:
+                results[transaction_hash] = await aworkflow(
+                    transaction_hash, hierarchical_intents, store
+                )
+            except Exception as e:
+                failed += 1
+                results[transaction_hash] = None
+                logger.error(
+                    "Failed to analyze transaction {}: {}".format(transaction_hash, e)
+                )
+                _persist(store, transaction_hash, Stage.ERROR, {"error": str(e)})
+        _log_progress(len(results), total, failed, started_at)
+
+    await asyncio.gather(
+        *(run_one(transaction_hash) for transaction_hash in transaction_hashes)
+    )
+
+    _log_batch_finished(total, failed, started_at)
+
+    return {**_stored_final_reports(completed), **results}
+
+
+def _stored_final_reports(reports: Mapping[str, dict]) -> Dict[str, FinalReport]:
+    return {
+        transaction_hash: FinalReport.model_validate(report)
+        for transaction_hash, report in reports.items()
+    }
+
+
+def _dump_reports(results: Mapping[str, Any]) -> Dict[str, Optional[dict]]:
+    return {
+        transaction_hash: (
+            report.model_dump(mode="json") if isinstance(report, FinalReport) else report
+        )
+        for transaction_hash, report in results.items()
+    }
+
+
+def write_results(path: str, results: Mapping[str, Any]):
+    """Write the final reports of a batch (FinalReport or plain dicts) to one JSON file"""
+    with open(path, "w") as f:
+        json.dump(_dump_reports(results), f, indent=4)
+
+
+def load_task_files(pattern: str) -> List[str]:
+    """Read the transaction hashes of task files, e.g. the output of task_generator.py
+
+    Args:
+        pattern: A directory of *.json task files or a glob of task files
+
+    Returns:
+        List[str]: The `txs` and `tfs` of all task files, deduplicated
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.json")
+
+    txs = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            task = json.load(f)
+        txs += task.get("txs", []) + task.get("tfs", [])
+
+    return dedupe_transactions(txs)
+
+
+def _init_shard_worker(shard_count: int):
+    # Workers are spawned, so they import their own RPC/LLM clients. Rate
+    # limited clients read the shard count to take their share of the quota.
+    os.environ["LLM4INTENT_SHARD_COUNT"] = str(shard_count)
+
+
+def _run_shard(
+    transaction_hashes: List[str],
+    hierarchical_intents: Mapping,
+    concurrency: int,
+    store_path: str,
+    use_async: bool,
+) -> Dict[str, Optional[dict]]:
+    store = ResultsStore(store_path)
+    if use_async:
+        results = asyncio.run(
+            arun_batch(
+                transaction_hashes,
+                hierarchical_intents,
+                concurrency=concurrency,
+                store=store,
+                skip_completed=False,
+            )
+        )
+    else:
+        results = run_batch(
+            transaction_hashes,
+            hierarchical_intents,
+            concurrency=concurrency,
+            store=store,
+            skip_completed=False,
+        )
+    store.close()
+
+    # only plain data crosses the process boundary
+    return _dump_reports(results)
+
+
+def run_sharded(
+    transaction_hashes: List[str],
+    hierarchical_intents: Mapping,
+    processes: int,
+    concurrency: int,
+    store_path: str,
+    use_async: bool = False,
+    skip_completed: bool = True,
+) -> Dict[str, Optional[dict]]:
+    """Shard the transactions across a process pool and merge the final reports
+
+    Args:
+        transaction_hashes: The transactions to analyze, duplicates are skipped
+        hierarchical_intents: The intent categories to classify against
+        processes: The number of worker processes
+        concurrency: The global limit of transactions analyzed in parallel, split across workers
+        store_path: The SQLite results store shared by all workers
+        use_async: Run each worker on an asyncio event loop
+        skip_completed: Skip transactions that already have a final report in the
+            store, their stored report is returned
+
+    Returns:
+        Dict[str, Optional[dict]]: The final report of each transaction, None if it failed
+    """
+    store = ResultsStore(store_path)
+    completed = completed_reports(transaction_hashes, store, skip_completed)
+    transaction_hashes = pending_transactions(transaction_hashes, store, skip_completed)
+    store.close()
+
+    processes = max(1, min(processes, len(transaction_hashes)))
+    shards = [transaction_hashes[i::processes] for i in range(processes)]
+    shard_concurrency = max(1, concurrency // processes)
+
+    logger.info(
+        "Sharding {} transactions across {} processes, concurrency {} each".format(
+            len(transaction_hashes), processes, shard_concurrency
+        )
+    )
+    started_at = time.monotonic()
+
+    results: Dict[str, Optional[dict]] = {}
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_shard_worker,
+        initargs=(processes,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _run_shard,
+                shard,
+                hierarchical_intents,
+                shard_concurrency,
+                store_path,
+                use_async,
+            )
+            for shard in shards
+            if shard
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            results.update(future.result())
+
+    failed = sum(1 for report in results.values() if report is None)
+    _log_batch_finished(len(results), failed, started_at)
+
+    # the skipped transactions keep their stored report in the merged output
+    return {**completed, **results}
+
 
 def start():
     # read config from argparser
     parser = argparse.ArgumentParser(description="LLM4Intent")
     parser.add_argument("--config", type=str, default="config.json")
+    parser.add_argument(
+        "--tasks",
+        type=str,
+        default=None,
+        help="directory or glob of task files (e.g. task_samples/*.json) instead of --config",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="shard the transactions across this many worker processes",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="write the merged final reports to this JSON file",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="number of transactions analyzed at once (default: config or 1)",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="run the whole pipeline on one asyncio event loop",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default="results.sqlite3",
+        help="SQLite file persisting every stage artifact, completed hashes are skipped",
+    )
+    parser.add_argument(
+        "--rerun",
+        action="store_true",
+        help="re-run completed transactions, only stages whose inputs changed are recomputed",
+    )
     args = parser.parse_args()
 
-    # read config from file
-    config = json.load(open(args.config))
-    # read transactions from the file
-    txs = config.get("txs", []) + config.get("tfs", [])
+    if args.tasks:
+        config = {}
+        txs = load_task_files(args.tasks)
+    else:
+        # read config from file
+        config = json.load(open(args.config))
+        # read transactions from the file
+        txs = config.get("txs", []) + config.get("tfs", [])
     hierarchical_intents = json.load(open("intent_cat.json"))
 
-    for transaction_hash in txs:
-        print(f"Analyzing transaction: {transaction_hash}")
-        workflow(transaction_hash, hierarchical_intents)
+    concurrency = args.concurrency or config.get("concurrency", 1)
+    # once here, before any worker reads the labels
+    refresh_label_dataset()
+
+    if args.processes > 1:
+        results = run_sharded(
+            txs,
+            hierarchical_intents,
+            processes=args.processes,
+            concurrency=concurrency,
+            store_path=args.store,
+            use_async=args.use_async,
+            skip_completed=not args.rerun,
+        )
+        if args.output:
+            write_results(args.output, results)
+        return
+
+    store = ResultsStore(args.store)
+
+    if args.use_async:
+        results = asyncio.run(
+            arun_batch(
+                txs,
+                hierarchical_intents,
+                concurrency=concurrency,
+                store=store,
+                skip_completed=not args.rerun,
+            )
+        )
+    else:
+        results = run_batch(
+            txs,
+            hierarchical_intents,
+            concurrency=concurrency,
+            store=store,
+            skip_completed=not args.rerun,
+        )
+
+    if args.output:
+        write_results(args.output, results)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+CACHE_DIR = os.getenv("LLM4INTENT_CACHE_DIR", ".cache")
+
+# how often a hit refreshes the LRU timestamp of an entry, saves a write per read
+_TOUCH_INTERVAL = 60
+# how many writes happen between two size checks
+_EVICTION_CHECK_INTERVAL = 100
+
+_MISSING = object()
+
+
+class DiskCache:
+    """A size-bounded key-value cache in one SQLite file
+
+    Values are stored as JSON. The file runs in WAL mode, so it can be shared by
+    threads (one connection per thread) and by worker processes. When the total
+    size of the values exceeds `max_bytes`, the least recently used entries are
+    evicted until the cache is back under 90% of the limit. The file is only
+    created on first use, so importing a module holding a cache writes nothing.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self._created = False
+        self._create_lock = threading.Lock()
+
+    def _create(self, conn: sqlite3.Connection) -> None:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_by_access ON entries (accessed_at)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._create_lock:
+                if not self._created:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn = sqlite3.connect(self.path, timeout=60)
+                    self._create(conn)
+                    self._created = True
+            conn = conn or sqlite3.connect(self.path, timeout=60)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a cached value, `default` if it is missing or expired"""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return default
+
+        value, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            conn.commit()
+            return default
+
+        if now - accessed_at > _TOUCH_INTERVAL:
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+
+        return json.loads(value)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Cache a JSON-serializable value, optionally expiring after `ttl` seconds"""
+        encoded = json.dumps(value)
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, encoded, len(encoded), now + ttl if ttl is not None else None, now),
+        )
+        conn.commit()
+
+        with self._writes_lock:
+            self._writes += 1
+            check = self._writes % _EVICTION_CHECK_INTERVAL == 0
+        if check:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        conn.commit()
+
+    def size(self) -> int:
+        """The total size in bytes of the cached values"""
+        conn = self._conn()
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self) -> None:
+        """Drop expired entries, then least recently used ones while over the size limit"""
+        conn = self._conn()
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+
+        total = self.size()
+        if total > self.max_bytes:
+            excess = total - int(self.max_bytes * 0.9)
+            rows = conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at"
+            ).fetchall()
+            evicted = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                evicted.append((key,))
+                excess -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        conn.commit()
+
+
+_caches: Dict[str, DiskCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_disk_cache(name: str, max_bytes: int = 1 << 30) -> DiskCache:
+    """Get the process-wide cache stored at `$LLM4INTENT_CACHE_DIR/<name>.sqlite3`"""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = DiskCache(
+                os.path.join(CACHE_DIR, f"{name}.sqlite3"), max_bytes=max_bytes
+            )
+        return _caches[name]
@@ -0,0 +1,43 @@
+import time
+
+from LLM4Intent.common.disk_cache import DiskCache
+
+
+def test_DiskCache_get_set(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache" / "cache.sqlite3"))
+    # nothing is written until the cache is used
+    assert not (tmp_path / "cache").exists()
+    assert cache.get("missing") is None
+    assert cache.get("missing", "default") == "default"
+
+    cache.set("eth_getCode", {"result": "0x"})
+    assert cache.get("eth_getCode") == {"result": "0x"}
+    assert "eth_getCode" in cache
+
+    # a cached null is distinguishable from a miss
+    cache.set("null", None)
+    assert "null" in cache
+
+    cache.delete("eth_getCode")
+    assert "eth_getCode" not in cache
+
+
+def test_DiskCache_ttl(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("short", 1, ttl=0.01)
+    cache.set("long", 2, ttl=60)
+    time.sleep(0.02)
+
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+def test_DiskCache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=1000)
+    for i in range(10):
+        cache.set(f"key{i}", "x" * 198)  # 200 bytes once JSON encoded
+    cache.evict()
+
+    assert cache.size() <= 900
+    assert "key0" not in cache
+    assert "key9" in cache
@@ -1,6 +1,9 @@
 import networkx as nx
 from LLM4Intent.common.utils import get_logger
-from LLM4Intent.tools.jsonrpc import get_address_type_from_jsonrpc
+from LLM4Intent.tools.jsonrpc import (
+    AddressType,
+    get_address_types_from_jsonrpc,
+)
 
 
 # Transaction Graph Retrieval Generation
@@ -27,22 +30,32 @@ class MemoryGraph:
             if attrs["type"] == "Transaction":
                 coverage["Transaction"] += 1
 
+    def _add_address_nodes(self, addresses):
+        # type every unseen address with one batched lookup
+        unseen = [address for address in addresses if not self.g.has_node(address)]
+        if not unseen:
+            return
+        for address, kind in get_address_types_from_jsonrpc(unseen).items():
+            self.g.add_node(address, kind=kind)
+
     # describe the whole graph in a cypher script
     def get_encoding(self):
+        untyped = [
+            n
+            for n, attrs in self.g.nodes(data=True)
+            if attrs.get("kind", attrs.get("type"))
+            not in (AddressType.EOA, AddressType.CA)
+        ]
+        if untyped:
+            self.log.warning(f"Unknown address types: {untyped}")
+            for n, kind in get_address_types_from_jsonrpc(untyped).items():
+                self.g.nodes[n]["kind"] = kind
+
         cypher = ""
         for n, attrs in self.g.nodes(data=True):
-            if attrs.get("type") == "EOA":
-                attrs["type"] = "EOA"
-            elif attrs.get("type") == "CA":
-                attrs["type"] = "CA"
-            else:
-                self.log.warning(f"Unknown address type: {attrs.get("type")}")
-                attrs["type"] = get_address_type_from_jsonrpc(n)
-
             cypher += "CREATE ({n}: {{{attrs}}}) \n".format(n=n, attrs=attrs)
 
         for u, v, k, attrs in self.g.edges(keys=True, data=True):
-            print(attrs)
             cypher += "MERGE ({u})-[{k}:{kind} {{{attrs}}}]->({v})\n".format(
                 u=u, v=v, k=k, kind=attrs["type"], attrs=attrs
             )
@@ -58,18 +71,7 @@ class MemoryGraph:
 
         transaction_attributes["type"] = "transaction"
 
-        if not self.g.has_node(transaction["from"]):
-            # determine the kind
-            self.g.add_node(
-                transaction["from"],
-                kind=get_address_type_from_jsonrpc(transaction["from"]),
-            )
-
-        if not self.g.has_node(transaction["to"]):
-            # determine the kind
-            self.g.add_node(
-                transaction["to"], kind=get_address_type_from_jsonrpc(transaction["to"])
-            )
+        self._add_address_nodes([transaction["from"], transaction["to"]])
 
         self.g.add_edge(
             transaction["from"],
@@ -80,31 +82,28 @@ class MemoryGraph:
 
     # transfer is a decoded transfer log from the transaction receipt
     def add_transfer(self, transfer):
-        transfer_attributes = transfer.copy()
-        transfer_attributes.pop("from")
-        transfer_attributes.pop("to")
-        transfer_attributes.pop("index")
+        self.add_transfers([transfer])
 
-        transfer_attributes["type"] = "transfer"
+    # transfers of a whole receipt, their endpoints are typed in one batch
+    def add_transfers(self, transfers):
+        self._add_address_nodes(
+            [transfer[side] for transfer in transfers for side in ("from", "to")]
+        )
 
-        if not self.g.has_node(transfer["from"]):
-            # determine the kind
-            self.g.add_node(
-                transfer["from"], kind=get_address_type_from_jsonrpc(transfer["from"])
-            )
+        for transfer in transfers:
+            transfer_attributes = transfer.copy()
+            transfer_attributes.pop("from")
+            transfer_attributes.pop("to")
+            transfer_attributes.pop("index")
 
-        if not self.g.has_node(transfer["to"]):
-            # determine the kind
-            self.g.add_node(
-                transfer["to"], kind=get_address_type_from_jsonrpc(transfer["to"])
-            )
+            transfer_attributes["type"] = "transfer"
 
-        self.g.add_edge(
-            transfer["from"],
-            transfer["to"],
-            transfer["hash"] + "." + transfer["index"],
-            **transfer_attributes,
-        )
+            self.g.add_edge(
+                transfer["from"],
+                transfer["to"],
+                transfer["hash"] + "." + transfer["index"],
+                **transfer_attributes,
+            )
 
     # set additional attributes to the transaction
     def enrich_edge(self, u, v, k, key, value):
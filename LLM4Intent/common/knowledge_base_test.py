@@ -12,3 +12,24 @@ def test_MemoryGraph():
     memory_graph.add_transaction(response)
 
     print(memory_graph.get_encoding())
+
+
+def test_MemoryGraph_add_transfers():
+    memory_graph = MemoryGraph()
+    tx_hash = "0x343888f0139d467f6b61607400cfae6f8fd26e19fc89aa919c7f8d15718878d1"
+    memory_graph.add_transfers(
+        [
+            {
+                "from": "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045",
+                "to": "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2",
+                "hash": tx_hash,
+                "index": str(i),
+                "value": i,
+            }
+            for i in range(3)
+        ]
+    )
+
+    assert memory_graph.g.nodes["0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"]["kind"] == "EOA"
+    assert memory_graph.g.nodes["0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"]["kind"] == "CA"
+    assert memory_graph.g.number_of_edges() == 3
@@ -0,0 +1,103 @@
+import contextvars
+import math
+import re
+from collections import Counter
+from typing import List, Optional
+
+# words per passage, paragraphs are merged up to it and longer ones cut
+PASSAGE_WORDS = 120
+# passages returned per page
+TOP_PASSAGES = 5
+
+_TOKEN = re.compile(r"0x[0-9a-f]+|[a-z0-9]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# what the current tool call is about: the question being analyzed and the
+# addresses, functions and events of the transaction, set by the analyzers
+relevance_context: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "relevance_context", default=""
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> List[str]:
+    """Split a page into passages of about `max_words` words along paragraphs"""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if len(paragraph.split()) <= max_words:
+            pieces.append(paragraph)
+            continue
+        # cut long paragraphs along sentences, and sentences along words
+        for sentence in _SENTENCE_END.split(paragraph):
+            words = sentence.split()
+            for start in range(0, len(words), max_words):
+                pieces.append(" ".join(words[start : start + max_words]))
+
+    passages = []
+    current: List[str] = []
+    for piece in pieces:
+        if current and len(" ".join(current + [piece]).split()) > max_words:
+            passages.append(" ".join(current))
+            current = []
+        current.append(piece)
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def bm25_scores(
+    passages: List[str], query: str, k1: float = 1.5, b: float = 0.75
+) -> List[float]:
+    """The Okapi BM25 score of every passage for the terms of `query`"""
+    documents = [Counter(tokenize(passage)) for passage in passages]
+    if not documents:
+        return []
+    average_length = sum(sum(d.values()) for d in documents) / len(documents) or 1
+    terms = set(tokenize(query))
+    document_frequency = {
+        term: sum(1 for document in documents if term in document) for term in terms
+    }
+
+    scores = []
+    for document in documents:
+        length = sum(document.values())
+        score = 0.0
+        for term in terms:
+            frequency = document.get(term, 0)
+            if not frequency:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+            score += idf * (
+                frequency
+                * (k1 + 1)
+                / (frequency + k1 * (1 - b + b * length / average_length))
+            )
+        scores.append(score)
+    return scores
+
+
+def top_passages(
+    text: str,
+    query: Optional[str] = None,
+    k: int = TOP_PASSAGES,
+    max_words: int = PASSAGE_WORDS,
+) -> List[str]:
+    """The `k` passages of a page most relevant to `query`, in page order
+
+    Without a query the relevance context of the current tool call is used,
+    and without either the page is cut to its first passages.
+    """
+    passages = split_passages(text, max_words)
+    query = query if query is not None else relevance_context.get()
+    scores = bm25_scores(passages, query) if query else [0.0] * len(passages)
+    if not any(scores):
+        return passages[:k]
+    ranked = sorted(range(len(passages)), key=lambda i: scores[i], reverse=True)
+    return [passages[i] for i in sorted(ranked[:k]) if scores[i] > 0]
@@ -0,0 +1,51 @@
+from LLM4Intent.common.passages import (
+    bm25_scores,
+    relevance_context,
+    split_passages,
+    top_passages,
+)
+
+PAGE = """Euler Finance was exploited for $197 million on March 13, 2023.
+
+The attacker used a flash loan and the donateToReserves function to make
+their position insolvent, then liquidated it at a discount.
+
+Weather in London was mild that day.
+
+Funds were later returned to the protocol by the exploiter."""
+
+
+def test_split_passages():
+    assert split_passages("a b c\n\nd e\n\n\nf", max_words=3) == ["a b c", "d e f"]
+    long = " ".join(["word"] * 7)
+    assert split_passages(long, max_words=3) == [
+        "word word word",
+        "word word word",
+        "word",
+    ]
+
+
+def test_bm25_scores():
+    scores = bm25_scores(["flash loan attack", "weather report", "loan"], "flash loan")
+    assert scores[0] > scores[2] > scores[1] == 0
+
+
+def test_top_passages():
+    assert top_passages(PAGE, "flash loan exploited", k=2, max_words=25) == [
+        "Euler Finance was exploited for $197 million on March 13, 2023.",
+        "The attacker used a flash loan and the donateToReserves function to make "
+        "their position insolvent, then liquidated it at a discount.",
+    ]
+
+    token = relevance_context.set("weather")
+    try:
+        assert top_passages(PAGE, k=1, max_words=25) == [
+            "Weather in London was mild that day. "
+            "Funds were later returned to the protocol by the exploiter."
+        ]
+    finally:
+        relevance_context.reset(token)
+    # without any query the page is cut to its lead
+    assert top_passages(PAGE, k=1, max_words=25) == [
+        "Euler Finance was exploited for $197 million on March 13, 2023."
+    ]
@@ -0,0 +1,92 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+
+class Priority:
+    """Lower values are served first when requests queue up"""
+
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+def shard_share(rate: float) -> float:
+    """The part of a per-key quota one process may use, see run_sharded"""
+    return rate / max(1, int(os.getenv("LLM4INTENT_SHARD_COUNT", "1")))
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter, so retrying clients spread out"""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class RateLimiter:
+    """A token bucket shared by the threads of a process
+
+    Tokens refill at `rate` per second up to `burst`. Callers waiting for a
+    token queue up and are served by priority, then in arrival order. After a
+    rate limit answer of the server, `pause` holds every caller back.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def acquire(
+        self, priority: int = Priority.NORMAL, timeout: Optional[float] = None
+    ) -> bool:
+        """Take a token, waiting for it at most `timeout` seconds
+
+        Returns:
+            bool: False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        entry = (priority, next(self._counter))
+        with self._condition:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == entry:
+                        if now >= self._paused_until and self._tokens >= 1:
+                            self._tokens -= 1
+                            return True
+                        wait = max(
+                            self._paused_until - now, (1 - self._tokens) / self.rate
+                        )
+                    else:
+                        wait = None
+                    if deadline is not None:
+                        if now >= deadline:
+                            return False
+                        wait = min(deadline - now, wait or deadline - now)
+                    self._condition.wait(wait)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        """Hand out no token for `seconds`, e.g. after a 429"""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self._updated_at = time.monotonic()
@@ -0,0 +1,40 @@
+import threading
+import time
+
+from LLM4Intent.common.rate_limit import Priority, RateLimiter
+
+
+def test_RateLimiter_refills_at_rate():
+    limiter = RateLimiter(rate=20, burst=2)
+    started_at = time.monotonic()
+    for _ in range(6):
+        assert limiter.acquire()
+    # two from the burst, four refilled at 20 per second
+    assert time.monotonic() - started_at >= 0.18
+
+    limiter.pause(10)
+    assert not limiter.acquire(timeout=0.05)
+
+
+def test_RateLimiter_serves_by_priority():
+    limiter = RateLimiter(rate=10, burst=1)
+    limiter.acquire()
+    served = []
+
+    def acquire(name, priority):
+        limiter.acquire(priority)
+        served.append(name)
+
+    threads = [
+        threading.Thread(target=acquire, args=("low", Priority.LOW)),
+        threading.Thread(target=acquire, args=("normal", Priority.NORMAL)),
+        threading.Thread(target=acquire, args=("high", Priority.HIGH)),
+    ]
+    # queue them all up before the next token arrives
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+    assert served == ["high", "normal", "low"]
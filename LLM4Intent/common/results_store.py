@@ -0,0 +1,164 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+
+class Stage:
+    FACTS = "facts"
+    PLAN = "plan"
+    SUB_ANALYSIS = "sub_analysis"
+    PERSPECTIVE_REPORT = "perspective_report"
+    CHECK_REPORT = "check_report"
+    FINAL_REPORT = "final_report"
+    TOKEN_USAGE = "token_usage"
+    ERROR = "error"
+
+
+def _to_jsonable(payload: Any) -> Any:
+    # pydantic models (Plan, CheckReport, FinalReport, ...)
+    if hasattr(payload, "model_dump"):
+        return payload.model_dump(mode="json")
+    return payload
+
+
+class ResultsStore:
+    """Append-only SQLite store of the stage artifacts of every analyzed transaction
+
+    Rows are never updated or deleted, a re-run of a stage appends a new row and
+    readers take the latest one. A transaction counts as completed once its
+    final report is stored. The database runs in WAL mode so several processes
+    can append to the same file.
+    """
+
+    def __init__(self, path: str = "results.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS artifacts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transaction_hash TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                name TEXT NOT NULL DEFAULT '',
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS artifacts_by_transaction "
+            "ON artifacts (transaction_hash, stage)"
+        )
+        # content-addressed stage outputs, see LLM4Intent.common.stages
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stage_artifacts (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def append(
+        self, transaction_hash: str, stage: str, payload: Any, name: str = ""
+    ) -> None:
+        """Persist one stage artifact of a transaction
+
+        Args:
+            transaction_hash: The analyzed transaction
+            stage: One of the `Stage` constants
+            payload: A JSON-serializable value or a pydantic model
+            name: Distinguishes artifacts of the same stage, e.g. the perspective
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO artifacts (transaction_hash, stage, name, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    transaction_hash.lower(),
+                    stage,
+                    name,
+                    json.dumps(_to_jsonable(payload)),
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    def get_artifacts(
+        self, transaction_hash: str, stage: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all artifacts of a transaction in insertion order, optionally of one stage"""
+        query = (
+            "SELECT stage, name, payload, created_at FROM artifacts "
+            "WHERE transaction_hash = ?"
+        )
+        params: list = [transaction_hash.lower()]
+        if stage is not None:
+            query += " AND stage = ?"
+            params.append(stage)
+        query += " ORDER BY id"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return [
+            {
+                "stage": row_stage,
+                "name": name,
+                "payload": json.loads(payload),
+                "created_at": created_at,
+            }
+            for row_stage, name, payload, created_at in rows
+        ]
+
+    def latest(self, transaction_hash: str, stage: str, name: str = "") -> Any:
+        """Get the payload of the most recent artifact of a stage, None if absent"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM artifacts "
+                "WHERE transaction_hash = ? AND stage = ? AND name = ? "
+                "ORDER BY id DESC LIMIT 1",
+                (transaction_hash.lower(), stage, name),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_stage_artifact(self, key: str, stage: str, payload: Any) -> None:
+        """Store the output of a stage under its content-addressed key, first write wins"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO stage_artifacts (key, stage, payload, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, stage, json.dumps(_to_jsonable(payload)), time.time()),
+            )
+            self._conn.commit()
+
+    def get_stage_artifact(self, key: str) -> Any:
+        """Get the stage output stored under a key, None if it was never computed"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM stage_artifacts WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def completed_transactions(self) -> Set[str]:
+        """Get the (lowercased) hashes of all transactions with a final report"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT transaction_hash FROM artifacts WHERE stage = ?",
+                (Stage.FINAL_REPORT,),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def is_completed(self, transaction_hash: str) -> bool:
+        return self.latest(transaction_hash, Stage.FINAL_REPORT) is not None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,45 @@
+from LLM4Intent.common.results_store import ResultsStore, Stage
+
+tx_hash = "0x43A2CB2A2A4FA683A67DB6F828D2DB99E1253A33A8EB1032915E50F71D85A9F0"
+
+
+def test_ResultsStore_append_and_latest(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite3"))
+
+    store.append(tx_hash, Stage.PERSPECTIVE_REPORT, "first", name="Market Analysis")
+    store.append(tx_hash, Stage.PERSPECTIVE_REPORT, "second", name="Market Analysis")
+    store.append(tx_hash, Stage.CHECK_REPORT, {"weighted_analyses": []})
+
+    assert store.latest(tx_hash, Stage.PERSPECTIVE_REPORT, "Market Analysis") == "second"
+    assert store.latest(tx_hash.lower(), Stage.CHECK_REPORT) == {"weighted_analyses": []}
+    assert store.latest(tx_hash, Stage.FINAL_REPORT) is None
+
+    # append-only, both reports are kept in order
+    reports = store.get_artifacts(tx_hash, Stage.PERSPECTIVE_REPORT)
+    assert [report["payload"] for report in reports] == ["first", "second"]
+
+
+def test_ResultsStore_completed_transactions(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    store = ResultsStore(path)
+    store.append(tx_hash, Stage.PLAN, {"target": "x", "items": []})
+    assert not store.is_completed(tx_hash)
+
+    store.append(tx_hash, Stage.FINAL_REPORT, {"final_intent": "1.1.1 Trading Profits"})
+    store.close()
+
+    # a restarted run sees the completed transaction
+    reopened = ResultsStore(path)
+    assert reopened.is_completed(tx_hash)
+    assert reopened.completed_transactions() == {tx_hash.lower()}
+
+
+def test_ResultsStore_stage_artifacts(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite3"))
+    assert store.get_stage_artifact("plan:abc") is None
+
+    store.put_stage_artifact("plan:abc", Stage.PLAN, {"target": "x", "items": []})
+    # first write wins, a key always maps to the same content
+    store.put_stage_artifact("plan:abc", Stage.PLAN, {"target": "y", "items": []})
+
+    assert store.get_stage_artifact("plan:abc") == {"target": "x", "items": []}
@@ -0,0 +1,40 @@
+import threading
+import time
+
+import pytest
+
+from LLM4Intent.common.single_flight import SingleFlight
+
+
+def test_SingleFlight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return len(calls)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [1] * 5
+    # nothing is kept once the call is over
+    assert flight.do("key", slow) == 2
+
+
+def test_SingleFlight_shares_exceptions():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
@@ -0,0 +1,81 @@
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Optional
+
+from LLM4Intent.common.results_store import ResultsStore
+from LLM4Intent.common.utils import get_logger
+
+# The workflow is a DAG of stages:
+#   facts -> plan -> sub-analyses -> perspective report -> check -> score
+# Every stage output is stored under a key hashed from everything that went
+# into it (the upstream outputs, the full prompt messages and the model name),
+# so changing e.g. the scorer prompt only invalidates the score stage.
+
+logger = get_logger("Stages")
+
+
+def artifact_key(stage: str, *inputs: Any) -> str:
+    """Content-addressed key of a stage output
+
+    Args:
+        stage: The stage name, one of `Stage`
+        inputs: JSON-serializable inputs of the stage, e.g. model name and messages
+
+    Returns:
+        str: The key in form of "<stage>:<sha256>"
+    """
+    encoded = json.dumps([stage, *inputs], sort_keys=True, default=str)
+    return "{}:{}".format(stage, hashlib.sha256(encoded.encode()).hexdigest())
+
+
+def memoize(
+    store: Optional[ResultsStore],
+    stage: str,
+    key: str,
+    compute: Callable[[], Any],
+    load: Optional[Callable[[Any], Any]] = None,
+) -> Any:
+    """Return the stored output of a stage if its key is known, compute and store it otherwise
+
+    Args:
+        store: The store holding stage outputs, None disables memoization
+        stage: The stage name
+        key: The content-addressed key from `artifact_key`
+        compute: Produces the stage output on a miss
+        load: Rebuilds the output from its stored JSON, e.g. `Plan.model_validate`
+
+    Returns:
+        Any: The stage output
+    """
+    if store is None:
+        return compute()
+
+    cached = store.get_stage_artifact(key)
+    if cached is not None:
+        logger.info("Reusing {} artifact {}".format(stage, key))
+        return load(cached) if load else cached
+
+    result = compute()
+    store.put_stage_artifact(key, stage, result)
+    return result
+
+
+async def amemoize(
+    store: Optional[ResultsStore],
+    stage: str,
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    load: Optional[Callable[[Any], Any]] = None,
+) -> Any:
+    """Async variant of `memoize`, `compute` returns an awaitable"""
+    if store is None:
+        return await compute()
+
+    cached = store.get_stage_artifact(key)
+    if cached is not None:
+        logger.info("Reusing {} artifact {}".format(stage, key))
+        return load(cached) if load else cached
+
+    result = await compute()
+    store.put_stage_artifact(key, stage, result)
+    return result
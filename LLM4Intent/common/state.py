@@ -4,6 +4,7 @@ from typing import Any, Dict, List, Mapping, Optional
 from pydantic import BaseModel, Field
 from web3 import Web3
 
+from LLM4Intent.common import tool_results
 from LLM4Intent.common.knowledge_base import MemoryGraph
 from LLM4Intent.common.utils import convert_tool
 from LLM4Intent.tools.etherscan import (
@@ -134,6 +135,11 @@ class State:
                 self.get_contract_ABI_from_whatsabi,
                 self.search_webpage_from_google,
                 self.extract_webpage_info_by_urls,
+                # Artifacts of large results
+                self.page_tool_result,
+                self.filter_tool_result,
+                self.project_tool_result,
+                self.aggregate_tool_result,
                 #
             ]
         ]
@@ -481,3 +487,85 @@ class State:
         result = extract_webpage_info_by_urls_from_tavily(urls)
 
         return result
+
+    def page_tool_result(
+        self, artifact: str, path: str = "", offset: int = 0, limit: int = 20
+    ) -> dict:
+        """Reads a large tool result stored as an artifact, a page of items at a time
+
+        Args:
+            artifact: The artifact handle of the tool result
+            path: The dot path of the list inside the result, empty for the whole result
+            offset: The index of the first item to read
+            limit: The number of items to read, at most 100
+
+        Returns:
+            dict: The items, their total and the offset of the next page
+        """
+        return tool_results.page(artifact, path, offset, limit)
+
+    def filter_tool_result(
+        self,
+        artifact: str,
+        field: str,
+        operator: str,
+        value: str,
+        path: str = "",
+        offset: int = 0,
+        limit: int = 20,
+    ) -> dict:
+        """Finds the items of a large tool result whose field matches a condition
+
+        Args:
+            artifact: The artifact handle of the tool result
+            field: The dot path of the field to compare inside each item
+            operator: One of "==", "!=", ">", ">=", "<", "<=" or "contains"
+            value: The value to compare the field with
+            path: The dot path of the list inside the result, empty for the whole result
+            offset: The index of the first matching item to return
+            limit: The number of matching items to return, at most 100
+
+        Returns:
+            dict: The matching items, their total and the offset of the next page
+        """
+        return tool_results.filter_rows(
+            artifact, field, operator, value, path, offset, limit
+        )
+
+    def project_tool_result(
+        self,
+        artifact: str,
+        fields: List[str],
+        path: str = "",
+        offset: int = 0,
+        limit: int = 20,
+    ) -> dict:
+        """Reads only some fields of the items of a large tool result
+
+        Args:
+            artifact: The artifact handle of the tool result
+            fields: The dot paths of the fields to keep in each item
+            path: The dot path of the list inside the result, empty for the whole result
+            offset: The index of the first item to read
+            limit: The number of items to read, at most 100
+
+        Returns:
+            dict: The projected items, their total and the offset of the next page
+        """
+        return tool_results.project(artifact, fields, path, offset, limit)
+
+    def aggregate_tool_result(
+        self, artifact: str, field: str, group_by: Optional[str] = None, path: str = ""
+    ) -> dict:
+        """Counts and sums a field over the items of a large tool result
+
+        Args:
+            artifact: The artifact handle of the tool result
+            field: The dot path of the field to aggregate inside each item
+            group_by: The dot path of the field to group the items by, if any
+            path: The dot path of the list inside the result, empty for the whole result
+
+        Returns:
+            dict: The count, distinct count, sum, min and max, per group if grouped
+        """
+        return tool_results.aggregate(artifact, field, group_by, path)
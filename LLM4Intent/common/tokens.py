@@ -0,0 +1,227 @@
+import contextvars
+import json
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from LLM4Intent.common.utils import get_logger
+
+# context window of the models used, prompts are cut to fit it before sending
+TOKEN_LIMIT = int(os.getenv("TOKEN_LIMIT", "128000"))
+# tokens left free in the window for the completion
+COMPLETION_TOKEN_RESERVE = int(os.getenv("COMPLETION_TOKEN_RESERVE", "4096"))
+# a Hugging Face tokenizer close to the ones of the models used
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "Xenova/gpt-4o")
+# characters per token when the tokenizer cannot be loaded
+CHARS_PER_TOKEN = 4
+# role, name and separators of a chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TRUNCATED_NOTE = "\n... [truncated to fit the context window]"
+
+logger = get_logger("Tokens")
+
+# the transaction the LLM calls of the current thread or task are made for,
+# set by the workflow
+current_transaction: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_transaction", default=""
+)
+
+
+class ContextBudgetExceeded(ValueError):
+    """The messages that cannot be dropped do not fit the context window"""
+
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """The local tokenizer, None if transformers cannot load it"""
+    global _tokenizer, _tokenizer_loaded
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            try:
+                from transformers import AutoTokenizer
+
+                _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+            except Exception as e:
+                logger.warning(
+                    f"Failed to load tokenizer {TOKENIZER_NAME}, "
+                    f"estimating {CHARS_PER_TOKEN} characters per token: {e}"
+                )
+            _tokenizer_loaded = True
+        return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """The start of `text` that fits in `max_tokens` tokens"""
+    if max_tokens <= 0:
+        return ""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    return text if len(ids) <= max_tokens else tokenizer.decode(ids[:max_tokens])
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+
+def message_tokens(message: dict) -> int:
+    """The tokens of a chat message: content, tool calls and overhead"""
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(_text(message.get("content")))
+    if message.get("tool_calls"):
+        tokens += count_tokens(_text(message["tool_calls"]))
+    return tokens
+
+
+def messages_tokens(messages: List[dict], tools: Optional[list] = None) -> int:
+    """The prompt tokens of a request, the tool schemas included"""
+    tokens = sum(message_tokens(message) for message in messages)
+    return tokens + (count_tokens(_text(tools)) if tools else 0)
+
+
+def _groups(messages: List[dict]) -> List[List[int]]:
+    # an assistant message with tool calls and their results go together, the
+    # API rejects tool results without the call and calls without results
+    groups: List[List[int]] = []
+    for i, message in enumerate(messages):
+        if message.get("role") == "tool" and groups:
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+    return groups
+
+
+def fit_messages(
+    messages: List[dict],
+    tools: Optional[list] = None,
+    pinned: Optional[Iterable[int]] = None,
+    limit: Optional[int] = None,
+    reserve: int = COMPLETION_TOKEN_RESERVE,
+    role: str = "",
+) -> List[dict]:
+    """The messages cut to fit the context window, by priority
+
+    System messages and the `pinned` ones (by default the last message, the
+    question) are always kept. Then the most recent turns and tool results are
+    kept over older turns: older turns are dropped first, then the remaining
+    tool results are truncated, and last the most recent turn is dropped.
+
+    Raises:
+        ContextBudgetExceeded: If the kept messages alone do not fit
+    """
+    budget = (limit or TOKEN_LIMIT) - reserve
+    if tools:
+        budget -= count_tokens(_text(tools))
+    sizes = [message_tokens(message) for message in messages]
+    total = sum(sizes)
+    if total <= budget:
+        return messages
+
+    keep = {i for i, message in enumerate(messages) if message.get("role") == "system"}
+    keep.update(pinned if pinned is not None else [len(messages) - 1])
+    droppable = [group for group in _groups(messages) if not keep.intersection(group)]
+    dropped = set()
+    fitted = {i: message for i, message in enumerate(messages)}
+
+    def drop(group: List[int]):
+        nonlocal total
+        dropped.update(group)
+        total -= sum(sizes[i] for i in group)
+
+    for group in droppable[:-1]:
+        if total <= budget:
+            break
+        drop(group)
+
+    truncated = 0
+    results = [
+        i
+        for i in sorted(droppable[-1] if droppable else [], key=lambda i: -sizes[i])
+        if messages[i].get("role") == "tool"
+    ]
+    for i in results:
+        if total <= budget:
+            break
+        note = count_tokens(TRUNCATED_NOTE)
+        content = _text(messages[i].get("content"))
+        target = max(sizes[i] - (total - budget) - MESSAGE_OVERHEAD_TOKENS - note, 0)
+        fitted[i] = {**messages[i], "content": truncate_text(content, target)}
+        fitted[i]["content"] += TRUNCATED_NOTE
+        size = message_tokens(fitted[i])
+        total -= sizes[i] - size
+        sizes[i] = size
+        truncated += 1
+
+    if total > budget and droppable:
+        drop(droppable[-1])
+    if total > budget:
+        raise ContextBudgetExceeded(
+            f"{role or 'The'} prompt needs {total} tokens out of a budget of "
+            f"{budget} even with only its system and pinned messages"
+        )
+
+    logger.warning(
+        f"{role}: dropped {len(dropped)} of {len(messages)} messages and truncated "
+        f"{truncated} tool results to fit {total} tokens in a budget of {budget}"
+    )
+    return [fitted[i] for i in range(len(messages)) if i not in dropped]
+
+
+class UsageTracker:
+    """The prompt and completion tokens reported by the provider
+
+    Counted per transaction (see `current_transaction`) and per role, every
+    call is recorded from the `usage` of its completion.
+    """
+
+    def __init__(self):
+        self._usage: Dict[str, Dict[str, Counter]] = defaultdict(
+            lambda: defaultdict(Counter)
+        )
+        self._lock = threading.Lock()
+
+    def record(self, role: str, completion, transaction: Optional[str] = None):
+        usage = getattr(completion, "usage", None)
+        if usage is None:
+            return
+        transaction = current_transaction.get() if transaction is None else transaction
+        with self._lock:
+            counter = self._usage[transaction][role]
+            counter["calls"] += 1
+            counter["prompt_tokens"] += usage.prompt_tokens or 0
+            counter["completion_tokens"] += usage.completion_tokens or 0
+
+    def usage(self, transaction: Optional[str] = None) -> Dict[str, dict]:
+        """The usage per role of a transaction, of all transactions if None"""
+        totals: Dict[str, Counter] = defaultdict(Counter)
+        with self._lock:
+            for key, roles in self._usage.items():
+                if transaction is None or key == transaction:
+                    for role, counter in roles.items():
+                        totals[role].update(counter)
+        return {role: dict(counter) for role, counter in totals.items()}
+
+    def pop(self, transaction: str) -> Dict[str, dict]:
+        """The usage per role of a transaction, forgetting it"""
+        with self._lock:
+            roles = self._usage.pop(transaction, {})
+        return {role: dict(counter) for role, counter in roles.items()}
+
+
+usage_tracker = UsageTracker()
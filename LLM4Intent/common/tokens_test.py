@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+from LLM4Intent.common import tokens
+
+
+@pytest.fixture(autouse=True)
+def heuristic_tokenizer(monkeypatch):
+    # 4 characters per token, without downloading a tokenizer
+    monkeypatch.setattr(tokens, "_tokenizer", None)
+    monkeypatch.setattr(tokens, "_tokenizer_loaded", True)
+
+
+def message(role, words, **extra):
+    return {"role": role, "content": "abcd " * words, **extra}
+
+
+def test_fit_messages_keeps_small_prompts():
+    messages = [message("system", 10), message("user", 10)]
+    assert tokens.fit_messages(messages, limit=100, reserve=0) is messages
+
+
+def test_fit_messages_drops_older_turns_first():
+    call = {"role": "assistant", "content": None, "tool_calls": [{"id": "1"}]}
+    messages = [
+        message("system", 20),
+        message("user", 40),  # an older turn
+        message("assistant", 40),
+        message("user", 20),  # the question
+        call,
+        message("tool", 40, tool_call_id="1"),
+    ]
+    fitted = tokens.fit_messages(messages, pinned=[3], limit=150, reserve=0)
+    assert fitted == [messages[0], messages[3], messages[4], messages[5]]
+
+
+def test_fit_messages_truncates_recent_tool_results():
+    call = {"role": "assistant", "content": None, "tool_calls": [{"id": "1"}]}
+    messages = [
+        message("system", 20),
+        message("user", 20),
+        call,
+        message("tool", 400, tool_call_id="1"),
+    ]
+    fitted = tokens.fit_messages(messages, pinned=[1], limit=200, reserve=0)
+    assert fitted[:3] == messages[:3]
+    assert fitted[3]["content"].endswith(tokens.TRUNCATED_NOTE)
+    assert messages[3]["content"] == "abcd " * 400
+    assert tokens.messages_tokens(fitted) <= 200
+
+
+def test_fit_messages_never_drops_pinned_messages():
+    messages = [message("system", 200), message("user", 200)]
+    with pytest.raises(tokens.ContextBudgetExceeded):
+        tokens.fit_messages(messages, limit=100, reserve=0)
+
+
+def test_usage_tracker():
+    tracker = tokens.UsageTracker()
+    completion = SimpleNamespace(
+        usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20)
+    )
+    token = tokens.current_transaction.set("0xabc")
+    try:
+        tracker.record("checker", completion)
+        tracker.record("checker", completion)
+    finally:
+        tokens.current_transaction.reset(token)
+    tracker.record("scorer", completion, transaction="0xdef")
+    tracker.record("scorer", SimpleNamespace(usage=None), transaction="0xdef")
+
+    assert tracker.usage("0xabc") == {
+        "checker": {"calls": 2, "prompt_tokens": 200, "completion_tokens": 40}
+    }
+    assert tracker.usage()["scorer"]["calls"] == 1
+    assert tracker.pop("0xdef") == {
+        "scorer": {"calls": 1, "prompt_tokens": 100, "completion_tokens": 20}
+    }
+    assert tracker.usage("0xdef") == {}
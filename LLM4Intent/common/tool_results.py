@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from LLM4Intent.common.disk_cache import get_disk_cache
+
+# tool results longer than this (JSON characters) are stored and replaced by a
+# summary with a handle, the model reads them through the artifact tools
+TOOL_RESULT_MAX_CHARS = int(os.getenv("TOOL_RESULT_MAX_CHARS", "8000"))
+# tools whose results are already a bounded page of an artifact or a webpage,
+# compacting them would only hand out another handle to read the same page with
+UNCOMPACTED_TOOLS = frozenset(
+    {
+        "page_tool_result",
+        "filter_tool_result",
+        "project_tool_result",
+        "aggregate_tool_result",
+        "get_webpage_content",
+    }
+)
+# how long a stored result can be read back
+ARTIFACT_TTL = 24 * 3600
+# most rows an artifact tool returns at once
+MAX_ROWS = 100
+# characters of a string value shown in previews
+PREVIEW_CHARS = 300
+
+artifact_cache = get_disk_cache(
+    "tool_results", max_bytes=int(os.getenv("TOOL_RESULT_CACHE_MAX_BYTES", 1 << 30))
+)
+
+
+class ArtifactError(ValueError):
+    """An artifact handle or path the model gave does not resolve"""
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, default=str)
+
+
+def _preview(value: Any, levels: int = 2, chars: int = PREVIEW_CHARS) -> Any:
+    # a shape-preserving, size-bounded sample of a value, `levels` deep
+    if isinstance(value, str):
+        if len(value) > chars:
+            return value[:chars] + "..."
+        return value
+    if isinstance(value, dict):
+        if levels <= 0:
+            return "{...}"
+        return {k: _preview(v, levels - 1, chars) for k, v in list(value.items())[:20]}
+    if isinstance(value, (list, tuple)):
+        if levels <= 0:
+            return "[...]"
+        return [_preview(v, levels - 1, chars) for v in value[:3]]
+    return value
+
+
+def _shape(value: Any) -> dict:
+    if isinstance(value, (list, tuple)):
+        return {"type": "list", "length": len(value)}
+    if isinstance(value, dict):
+        return {"type": "dict", "length": len(value)}
+    return {"type": type(value).__name__}
+
+
+# summaries tried from the most to the least detailed until one fits:
+# (keys per dict, sample items per list, nesting levels, preview characters)
+_SUMMARY_LEVELS = [(50, 3, 2, PREVIEW_CHARS), (20, 1, 1, 100), (10, 1, 1, 30)]
+
+
+def summarize(
+    value: Any,
+    keys: int = 50,
+    items: int = 3,
+    levels: int = 2,
+    chars: int = PREVIEW_CHARS,
+) -> dict:
+    """The shape of a value: its type, size, fields and a small preview
+
+    Args:
+        keys: Most keys of a dict and fields of a list summarized
+        items: List items previewed
+        levels: How deep nested values are summarized and previewed
+        chars: Characters of a string value shown in previews
+    """
+    if isinstance(value, (list, tuple)):
+        fields = {}
+        for item in value[:MAX_ROWS]:
+            if isinstance(item, dict):
+                fields.update(dict.fromkeys(item))
+        return {
+            "type": "list",
+            "length": len(value),
+            "fields": list(fields)[:keys],
+            # items keep at least their own fields, whatever the nesting level
+            "first_items": [
+                _preview(item, max(levels, 1), chars) for item in value[:items]
+            ],
+        }
+    if isinstance(value, dict):
+        summary = {}
+        for key, item in list(value.items())[:keys]:
+            if not isinstance(item, (list, tuple, dict)) or len(_encode(item)) <= 200:
+                summary[key] = _preview(item, 0, chars)
+            elif levels > 0:
+                summary[key] = summarize(item, keys, items, levels - 1, chars)
+            else:
+                summary[key] = _shape(item)
+        return {"type": "dict", "length": len(value), "keys": summary}
+    if isinstance(value, str):
+        preview = _preview(value, 0, chars)
+        return {"type": "string", "length": len(value), "preview": preview}
+    return {"type": type(value).__name__, "value": value}
+
+
+def store_artifact(value: Any) -> str:
+    """Store a tool result, the handle is derived from its content"""
+    encoded = _encode(value)
+    handle = "artifact-" + hashlib.sha1(encoded.encode()).hexdigest()[:16]
+    artifact_cache.set(handle, json.loads(encoded), ttl=ARTIFACT_TTL)
+    return handle
+
+
+def compact_tool_result(tool_name: str, result: Any) -> Any:
+    """The result itself if it is small, otherwise a summary with an artifact handle
+
+    The results of the UNCOMPACTED_TOOLS are always returned as they are.
+    """
+    if tool_name in UNCOMPACTED_TOOLS:
+        return result
+    encoded = _encode(result)
+    if len(encoded) <= TOOL_RESULT_MAX_CHARS:
+        return result
+    compacted = {
+        "artifact": store_artifact(result),
+        "tool": tool_name,
+        "characters": len(encoded),
+        "summary": _shape(result),
+        "note": (
+            "The result is too large to show. Read it with page_tool_result, "
+            "filter_tool_result, project_tool_result or aggregate_tool_result."
+        ),
+    }
+    # the summary counts against the same limit, less detail until it fits
+    for level in _SUMMARY_LEVELS:
+        summary = summarize(result, *level)
+        if len(_encode({**compacted, "summary": summary})) <= TOOL_RESULT_MAX_CHARS:
+            compacted["summary"] = summary
+            break
+    return compacted
+
+
+def resolve(handle: str, path: str = "") -> Any:
+    """The value at a dot path ("result.transfers", "logs.0.topics") of an artifact"""
+    value = artifact_cache.get(handle)
+    if value is None:
+        raise ArtifactError(
+            f"Unknown or expired artifact {handle}, call the tool again"
+        )
+    for part in filter(None, path.split(".")):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.lstrip("-").isdigit():
+            try:
+                value = value[int(part)]
+            except IndexError:
+                raise ArtifactError(f"Index {part} out of range in {path}")
+        else:
+            raise ArtifactError(f"No {part} in {path} of {handle}")
+    return value
+
+
+def _field(item: Any, field: str) -> Any:
+    for part in field.split("."):
+        if isinstance(item, dict):
+            item = item.get(part)
+        elif isinstance(item, list) and part.isdigit() and int(part) < len(item):
+            item = item[int(part)]
+        else:
+            return None
+    return item
+
+
+def _number(value: Any) -> Optional[float]:
+    # amounts are often strings, decimal or hex
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value, 0)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+def _next(end: int, total: int) -> Optional[int]:
+    return end if end < total else None
+
+
+def _rows(handle: str, path: str, value: Any = None) -> List[Any]:
+    value = resolve(handle, path) if value is None else value
+    if isinstance(value, dict):
+        return [{"key": key, "value": item} for key, item in value.items()]
+    if not isinstance(value, list):
+        raise ArtifactError(f"{path or 'The artifact'} is not a list")
+    return value
+
+
+def page(handle: str, path: str = "", offset: int = 0, limit: int = 20) -> dict:
+    """A page of the list (or text) at `path`, dicts are read as key/value rows"""
+    value = resolve(handle, path)
+    limit = min(limit, MAX_ROWS)
+    if isinstance(value, str):
+        end = offset + limit * PREVIEW_CHARS
+        return {"content": value[offset:end], "next_offset": _next(end, len(value))}
+    rows = _rows(handle, path, value)
+    end = offset + limit
+    return {
+        "items": rows[offset:end],
+        "total": len(rows),
+        "next_offset": _next(end, len(rows)),
+    }
+
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+def _matches(item: Any, field: str, operator: str, value: Any) -> bool:
+    actual = _field(item, field)
+    if operator == "contains":
+        return str(value).lower() in _encode(actual).lower()
+    if operator not in _OPERATORS:
+        raise ArtifactError(f"Unknown operator {operator}")
+    left, right = _number(actual), _number(value)
+    if left is not None and right is not None:
+        return _OPERATORS[operator](left, right)
+    if isinstance(actual, str) and isinstance(value, str):
+        # addresses and hashes compare case-insensitively
+        return _OPERATORS[operator](actual.lower(), value.lower())
+    try:
+        return _OPERATORS[operator](actual, value)
+    except TypeError:
+        return False
+
+
+def filter_rows(
+    handle: str,
+    field: str,
+    operator: str,
+    value: Any,
+    path: str = "",
+    offset: int = 0,
+    limit: int = 20,
+) -> dict:
+    """The rows at `path` whose `field` compares to `value` with `operator`"""
+    matched = [
+        item for item in _rows(handle, path) if _matches(item, field, operator, value)
+    ]
+    end = offset + min(limit, MAX_ROWS)
+    return {
+        "items": matched[offset:end],
+        "total": len(matched),
+        "next_offset": _next(end, len(matched)),
+    }
+
+
+def project(
+    handle: str, fields: List[str], path: str = "", offset: int = 0, limit: int = 20
+) -> dict:
+    """The rows at `path` reduced to some of their fields"""
+    rows = _rows(handle, path)
+    end = offset + min(limit, MAX_ROWS)
+    return {
+        "items": [{f: _field(item, f) for f in fields} for item in rows[offset:end]],
+        "total": len(rows),
+        "next_offset": _next(end, len(rows)),
+    }
+
+
+def aggregate(
+    handle: str, field: str, group_by: Optional[str] = None, path: str = ""
+) -> dict:
+    """Count, distinct, and for numbers sum/min/max of `field`, per `group_by`"""
+    groups: Dict[Any, List[Any]] = {}
+    for item in _rows(handle, path):
+        key = _field(item, group_by) if group_by else None
+        groups.setdefault(_encode(key) if group_by else None, []).append(
+            _field(item, field)
+        )
+
+    def stats(values: List[Any]) -> dict:
+        numbers = [n for n in map(_number, values) if n is not None]
+        result = {
+            "count": len(values),
+            "distinct": len({_encode(v) for v in values}),
+        }
+        if numbers:
+            result.update(sum=sum(numbers), min=min(numbers), max=max(numbers))
+        return result
+
+    if group_by is None:
+        return stats(groups.get(None, []))
+    ranked: List[Tuple[Any, List[Any]]] = sorted(
+        groups.items(), key=lambda group: len(group[1]), reverse=True
+    )
+    return {
+        "groups": [
+            {group_by: json.loads(key), **stats(values)}
+            for key, values in ranked[:MAX_ROWS]
+        ],
+        "total_groups": len(groups),
+    }
@@ -0,0 +1,121 @@
+import pytest
+
+from LLM4Intent.common import tool_results
+from LLM4Intent.common.disk_cache import DiskCache
+
+TRANSFERS = {
+    "result": [
+        {"token": "USDC", "from": "0xAbC", "value": str(100 * (i + 1))}
+        for i in range(30)
+    ]
+    + [{"token": "WETH", "from": "0xdef", "value": "0x10"}]
+}
+
+
+@pytest.fixture(autouse=True)
+def artifact_cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "tool_results.sqlite3"))
+    monkeypatch.setattr(tool_results, "artifact_cache", cache)
+    monkeypatch.setattr(tool_results, "TOOL_RESULT_MAX_CHARS", 500)
+    return cache
+
+
+def test_compact_tool_result(monkeypatch):
+    assert tool_results.compact_tool_result("get_transaction", {"a": 1}) == {"a": 1}
+
+    monkeypatch.setattr(tool_results, "TOOL_RESULT_MAX_CHARS", 1000)
+    compacted = tool_results.compact_tool_result("get_transfers", TRANSFERS)
+    assert compacted["artifact"].startswith("artifact-")
+    assert compacted["tool"] == "get_transfers"
+    summary = compacted["summary"]["keys"]["result"]
+    assert summary["length"] == 31
+    assert summary["fields"] == ["token", "from", "value"]
+    assert summary["first_items"] == [
+        {"token": "USDC", "from": "0xAbC", "value": "100"},
+        {"token": "USDC", "from": "0xAbC", "value": "200"},
+        {"token": "USDC", "from": "0xAbC", "value": "300"},
+    ]
+    # the same result is stored under the same handle
+    assert tool_results.store_artifact(TRANSFERS) == compacted["artifact"]
+
+    # pages read back from artifacts and webpages are never compacted again
+    page = tool_results.page(compacted["artifact"], "result", limit=31)
+    assert tool_results.compact_tool_result("page_tool_result", page) is page
+    webpage = {"content": "x" * 8000, "next_start": 8000}
+    assert tool_results.compact_tool_result("get_webpage_content", webpage) is webpage
+
+
+def test_compact_tool_result_fits_the_limit():
+    # a dict of dicts of long strings, its full summary alone is far too large
+    nested = {f"pool{i}": {f"field{j}": "x" * 400 for j in range(20)} for i in range(50)}
+    compacted = tool_results.compact_tool_result("get_pools", nested)
+    assert len(tool_results._encode(compacted)) <= tool_results.TOOL_RESULT_MAX_CHARS
+    assert compacted["summary"]["type"] == "dict"
+    assert compacted["summary"]["length"] == 50
+
+    # the first items of a list show their fields even at the smallest summary
+    compacted = tool_results.compact_tool_result("get_transfers", TRANSFERS)
+    assert len(tool_results._encode(compacted)) <= tool_results.TOOL_RESULT_MAX_CHARS
+    assert compacted["summary"]["keys"]["result"]["first_items"] == [
+        {"token": "USDC", "from": "0xAbC", "value": "100"}
+    ]
+
+
+def test_page():
+    handle = tool_results.store_artifact(TRANSFERS)
+    page = tool_results.page(handle, "result", offset=28, limit=5)
+    assert [item["value"] for item in page["items"]] == ["2900", "3000", "0x10"]
+    assert page["total"] == 31
+    assert page["next_offset"] is None
+    assert tool_results.page(handle, "result.30.from")["content"] == "0xdef"
+
+    with pytest.raises(tool_results.ArtifactError):
+        tool_results.page(handle, "result.99")
+    with pytest.raises(tool_results.ArtifactError):
+        tool_results.page("artifact-missing")
+
+
+def test_filter_and_project():
+    handle = tool_results.store_artifact(TRANSFERS)
+    large = tool_results.filter_rows(handle, "value", ">=", "2500", "result")
+    assert large["total"] == 6
+    # addresses compare case-insensitively, hex amounts as numbers
+    assert tool_results.filter_rows(handle, "from", "==", "0xabc", "result")[
+        "total"
+    ] == 30
+    assert tool_results.filter_rows(handle, "value", "==", "16", "result")[
+        "items"
+    ] == [{"token": "WETH", "from": "0xdef", "value": "0x10"}]
+    assert tool_results.filter_rows(handle, "token", "contains", "eth", "result")[
+        "total"
+    ] == 1
+    with pytest.raises(tool_results.ArtifactError):
+        tool_results.filter_rows(handle, "value", "~", "1", "result")
+
+    projected = tool_results.project(handle, ["token"], "result", limit=2)
+    assert projected == {
+        "items": [{"token": "USDC"}, {"token": "USDC"}],
+        "total": 31,
+        "next_offset": 2,
+    }
+
+
+def test_aggregate():
+    handle = tool_results.store_artifact(TRANSFERS)
+    assert tool_results.aggregate(handle, "value", path="result") == {
+        "count": 31,
+        "distinct": 31,
+        "sum": 46516,
+        "min": 16,
+        "max": 3000,
+    }
+    grouped = tool_results.aggregate(handle, "value", "token", "result")
+    assert grouped["total_groups"] == 2
+    assert grouped["groups"][0] == {
+        "token": "USDC",
+        "count": 30,
+        "distinct": 30,
+        "sum": 46500,
+        "min": 100,
+        "max": 3000,
+    }
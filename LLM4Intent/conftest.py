@@ -0,0 +1,26 @@
+import json
+from http import HTTPStatus
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+def make_http_response(
+    payload=None, status_code: int = 200, headers=None, content=None
+) -> requests.Response:
+    """A real requests.Response answering `payload` as JSON, or raw `content`"""
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = HTTPStatus(status_code).phrase
+    response.url = "http://test.invalid/"
+    response.headers = CaseInsensitiveDict(headers or {})
+    response._content = content if content is not None else json.dumps(payload).encode()
+    response.encoding = "utf-8"
+    return response
+
+
+@pytest.fixture
+def http_response():
+    """The factory of canned HTTP responses for patched requests calls"""
+    return make_http_response
@@ -4,6 +4,7 @@ import logging
 from openai import Client
 from pydantic import BaseModel, Field
 from LLM4Intent.common.state import State
+from LLM4Intent.common.tokens import fit_messages, usage_tracker
 from LLM4Intent.common.utils import get_logger, get_prompt
 
 
@@ -29,8 +30,11 @@ Please analyze against the retrieved data.""",
         ]
         self.log.debug("analyzer messages: %s", messages)
         completion = self.client.chat.completions.create(
-            model=self.model, messages=messages, temperature=0.7
+            model=self.model,
+            messages=fit_messages(messages, role=self.name),
+            temperature=0.7,
         )
+        usage_tracker.record(self.name, completion)
         self.log.debug("analyzer completion: %s", completion)
         response = completion.choices[0].message.content
 
@@ -5,6 +5,7 @@ from openai import Client
 from pydantic import BaseModel, Field
 
 from LLM4Intent.common.state import DataMissing, State
+from LLM4Intent.common.tokens import fit_messages, usage_tracker
 from LLM4Intent.common.utils import get_logger, get_prompt
 
 
@@ -47,9 +48,12 @@ class Checker():
         ]
         self.log.debug(messages)
         completion = self.client.chat.completions.create(
-            model=self.model, messages=messages, temperature=0,
-            response_format={"type": "json_object"}
+            model=self.model,
+            messages=fit_messages(messages, role=self.name),
+            temperature=0,
+            response_format={"type": "json_object"},
         )
+        usage_tracker.record(self.name, completion)
         self.log.debug(completion)
         response = completion.choices[0].message.content
         report_data = json.loads(response.strip("```json\n").strip("\n```"))
@@ -1,8 +1,12 @@
 import json
 import logging
+from typing import Union
 
-from openai import Client
+from openai import AsyncClient, Client
 from pydantic import BaseModel, Field
+from LLM4Intent.common.results_store import Stage
+from LLM4Intent.common.stages import artifact_key
+from LLM4Intent.common.tokens import fit_messages, usage_tracker
 from LLM4Intent.common.utils import get_logger, get_prompt
 
 class TODOItem(BaseModel):
@@ -28,7 +32,13 @@ Please output an answer in pure JSON format according to the following schema. T
 
 
 class MetaControlAnalyzer:
-    def __init__(self, model: str, client: Client, perspective: str, tips: str):
+    def __init__(
+        self,
+        model: str,
+        client: Union[Client, AsyncClient],
+        perspective: str,
+        tips: str,
+    ):
         self.name = "MetaControlAnalyzer"
         self.model = model
         self.client = client
@@ -40,21 +50,25 @@ class MetaControlAnalyzer:
 
         self.plan = None
 
-    def breakdown(self, transaction_hash) -> Plan:
+    def _breakdown_messages(self, transaction_hash) -> list:
         breakdown_prompt = BREAKDOWN_PROMPT.format(
             transaction_hash=transaction_hash,
             tips=self.tips,
             plan_json_schema=Plan.model_json_schema(),
         )
 
-        messages = [
+        return [
             {"role": "system", "content": self.system_message},
             {"role": "assistant", "content": breakdown_prompt},
         ]
-        completion = self.client.chat.completions.create(
-            model=self.model, messages=messages, temperature=0.7
+
+    def breakdown_cache_key(self, transaction_hash) -> str:
+        """Content-addressed key of the plan `breakdown` produces"""
+        return artifact_key(
+            Stage.PLAN, self.model, self._breakdown_messages(transaction_hash)
         )
-        response = completion.choices[0].message.content
+
+    def _parse_plan(self, response: str) -> Plan:
         self.log.info("Breakdown response: %s", response)
 
         plan_data = response.strip("```json\n").strip("\n```")
@@ -66,7 +80,30 @@ class MetaControlAnalyzer:
 
         return plan
 
-    def analyze(self, hierarchical_intents, merged_chat_history) -> str:
+    def breakdown(self, transaction_hash) -> Plan:
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=fit_messages(
+                self._breakdown_messages(transaction_hash), role=self.name
+            ),
+            temperature=0.7,
+        )
+        usage_tracker.record(self.name, completion)
+        return self._parse_plan(completion.choices[0].message.content)
+
+    async def abreakdown(self, transaction_hash) -> Plan:
+        """Async variant of `breakdown`, requires an `AsyncClient`"""
+        completion = await self.client.chat.completions.create(
+            model=self.model,
+            messages=fit_messages(
+                self._breakdown_messages(transaction_hash), role=self.name
+            ),
+            temperature=0.7,
+        )
+        usage_tracker.record(self.name, completion)
+        return self._parse_plan(completion.choices[0].message.content)
+
+    def _analyze_messages(self, hierarchical_intents, merged_chat_history) -> list:
         chat_history = [
             {
                 "role": "user",
@@ -81,39 +118,53 @@ class MetaControlAnalyzer:
             *merged_chat_history,
         ]
 
-        while True:
-            system_message = self.system_message.format()
-            messages = [
-                {"role": "system", "content": system_message},
-                *chat_history,
-                {
-                    "role": "user",
-                    "content": f"""Please infer the intent behind the {self.plan.target} from the perspective of the {self.perspective}.
+        system_message = self.system_message.format()
+        messages = [
+            {"role": "system", "content": system_message},
+            *chat_history,
+            {
+                "role": "user",
+                "content": f"""Please infer the intent behind the {self.plan.target} from the perspective of the {self.perspective}.
 
 The intent inferred should be one of the following:
 {hierarchical_intents}
                     """,
-                },
-            ]
-            self.log.debug("analyzer messages: %s", messages)
-            completion = self.client.chat.completions.create(
-                model=self.model, messages=messages, temperature=0
-            )
-            self.log.debug("analyzer completion: %s", completion)
-            response = completion.choices[0].message.content
-
-            # Save the analysis to the state
-            chat_history.extend(
-                [
-                    {
-                        "role": "user",
-                        "content": f"Please analyze against the retrieved data.",
-                    },
-                    {"role": "assistant", "content": response},
-                ]
-            )
-
-            with open("analysis_report.output.md", "w") as f:
-                f.write(response)
-
-            return response
+            },
+        ]
+        self.log.debug("analyzer messages: %s", messages)
+        return messages
+
+    def analyze_cache_key(self, hierarchical_intents, merged_chat_history) -> str:
+        """Content-addressed key of the report `analyze` produces, requires the plan"""
+        return artifact_key(
+            Stage.PERSPECTIVE_REPORT,
+            self.model,
+            self._analyze_messages(hierarchical_intents, merged_chat_history),
+        )
+
+    def analyze(self, hierarchical_intents, merged_chat_history) -> str:
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=fit_messages(
+                self._analyze_messages(hierarchical_intents, merged_chat_history),
+                role=self.name,
+            ),
+            temperature=0,
+        )
+        usage_tracker.record(self.name, completion)
+        self.log.debug("analyzer completion: %s", completion)
+        return completion.choices[0].message.content
+
+    async def aanalyze(self, hierarchical_intents, merged_chat_history) -> str:
+        """Async variant of `analyze`, requires an `AsyncClient`"""
+        completion = await self.client.chat.completions.create(
+            model=self.model,
+            messages=fit_messages(
+                self._analyze_messages(hierarchical_intents, merged_chat_history),
+                role=self.name,
+            ),
+            temperature=0,
+        )
+        usage_tracker.record(self.name, completion)
+        self.log.debug("analyzer completion: %s", completion)
+        return completion.choices[0].message.content
@@ -4,6 +4,8 @@ from typing import List
 from openai import Client
 from openai.types.chat import ChatCompletionMessage
 from LLM4Intent.common.state import DataMissing, State
+from LLM4Intent.common.tokens import fit_messages, usage_tracker
+from LLM4Intent.common.tool_results import compact_tool_result
 from LLM4Intent.common.utils import get_logger, get_prompt
 
 
@@ -35,7 +37,7 @@ class Retriever:
             tool = getattr(self.state, tool_name, None)
             if tool:
                 try:
-                    result = tool(**tool_args)
+                    result = compact_tool_result(tool_name, tool(**tool_args))
                     tool_messages.append(
                         {
                             "role": "tool",
@@ -75,11 +77,14 @@ class Retriever:
         self.log.info(messages)
         completion = self.client.chat.completions.create(
             model=self.model,
-            messages=messages,
+            messages=fit_messages(
+                messages, tools=self.state.openai_tools, role=self.name
+            ),
             temperature=0,
             tools=self.state.openai_tools,
             tool_choice="auto",
         )
+        usage_tracker.record(self.name, completion)
         self.log.info(completion)
         response = completion.choices[0].message
 
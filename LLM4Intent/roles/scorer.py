@@ -3,6 +3,7 @@ from typing import List
 from openai import Client
 from pydantic import BaseModel, Field
 from LLM4Intent.common.state import State
+from LLM4Intent.common.tokens import fit_messages, usage_tracker
 from LLM4Intent.common.utils import get_logger, get_prompt
 
 
@@ -43,13 +44,13 @@ class Scorer:
             {"role": "user", "content": human_message},
         ]
         self.log.debug(messages)
-        response = (
-            self.client.chat.completions.create(
-                model=self.model, messages=messages, temperature=0
-            )
-            .choices[0]
-            .message.content
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=fit_messages(messages, role=self.name),
+            temperature=0,
         )
+        usage_tracker.record(self.name, completion)
+        response = completion.choices[0].message.content
         self.log.debug(response)
         report_data = json.loads(response.strip("```json\n").strip("\n```"))
         report = ScoreReport(**report_data)
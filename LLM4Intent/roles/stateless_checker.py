@@ -1,8 +1,11 @@
 import json
-from typing import List, Dict, Any, Optional, Mapping
-from openai import Client
+from typing import List, Dict, Any, Optional, Mapping, Union
+from openai import AsyncClient, Client
 from pydantic import BaseModel, Field
 
+from LLM4Intent.common.results_store import Stage
+from LLM4Intent.common.stages import artifact_key
+from LLM4Intent.common.tokens import fit_messages, usage_tracker
 from LLM4Intent.common.utils import get_logger, get_prompt
 
 logger = get_logger("StatelessChecker")
@@ -27,18 +30,16 @@ class CheckReport(BaseModel):
 
 
 class StatelessChecker:
-    def __init__(self, model: str, client: Client):
+    def __init__(self, model: str, client: Union[Client, AsyncClient]):
         self.name = "checker"
         self.model = model
         self.client = client
         self.system_message = get_prompt("stateless_checker")
         self.log = get_logger("Checker")
 
-    def check(
+    def _check_messages(
         self, hierarchical_intents: dict, perspective_analyzer_reports: dict
-    ) -> CheckReport:
-        chat_history = []
-
+    ) -> list:
         system_message = self.system_message.format()
 
         analysis = ""
@@ -83,22 +84,60 @@ Make sure your response is valid JSON that follows this schema exactly."""
         ]
 
         self.log.debug(messages)
-        completion = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=0,
-        )
+        return messages
 
-        self.log.debug(completion)
-        response = completion.choices[0].message.content
+    def check_cache_key(
+        self, hierarchical_intents: dict, perspective_analyzer_reports: dict
+    ) -> str:
+        """Content-addressed key of the report `check` produces"""
+        return artifact_key(
+            Stage.CHECK_REPORT,
+            self.model,
+            self._check_messages(hierarchical_intents, perspective_analyzer_reports),
+        )
 
+    def _parse_report(self, response: str) -> CheckReport:
         # Extract the JSON part if it's wrapped in a code block
         if "```json" in response:
             response = response.strip("```json\n").strip("\n```")
 
         report = CheckReport.model_validate_json(response)
 
-        with open("check_report.output.md", "w") as f:
-            f.write(report.model_dump_json(indent=4))
-
         return report
+
+    def check(
+        self, hierarchical_intents: dict, perspective_analyzer_reports: dict
+    ) -> CheckReport:
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=fit_messages(
+                self._check_messages(
+                    hierarchical_intents, perspective_analyzer_reports
+                ),
+                role=self.name,
+            ),
+            temperature=0,
+        )
+        usage_tracker.record(self.name, completion)
+
+        self.log.debug(completion)
+        return self._parse_report(completion.choices[0].message.content)
+
+    async def acheck(
+        self, hierarchical_intents: dict, perspective_analyzer_reports: dict
+    ) -> CheckReport:
+        """Async variant of `check`, requires an `AsyncClient`"""
+        completion = await self.client.chat.completions.create(
+            model=self.model,
+            messages=fit_messages(
+                self._check_messages(
+                    hierarchical_intents, perspective_analyzer_reports
+                ),
+                role=self.name,
+            ),
+            temperature=0,
+        )
+        usage_tracker.record(self.name, completion)
+
+        self.log.debug(completion)
+        return self._parse_report(completion.choices[0].message.content)
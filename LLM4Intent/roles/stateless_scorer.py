@@ -1,7 +1,10 @@
 import json
-from typing import List
-from openai import Client
+from typing import List, Union
+from openai import AsyncClient, Client
 from pydantic import BaseModel, Field
+from LLM4Intent.common.results_store import Stage
+from LLM4Intent.common.stages import artifact_key
+from LLM4Intent.common.tokens import fit_messages, usage_tracker
 from LLM4Intent.common.utils import get_logger, get_prompt
 from LLM4Intent.roles.stateless_checker import CheckReport
 
@@ -42,7 +45,7 @@ class FinalReport(BaseModel):
 
 
 class StatelessScorer:
-    def __init__(self, model: str, client: Client):
+    def __init__(self, model: str, client: Union[Client, AsyncClient]):
         self.name = "FinalEvaluator"
         self.model = model
 
@@ -51,9 +54,9 @@ class StatelessScorer:
         self.system_message = get_prompt("stateless_scorer")
         self.log = get_logger("FinalEvaluator")
 
-    def score(
+    def _score_messages(
         self, check_report: CheckReport, hierarchical_intents: dict
-    ) -> FinalReport:
+    ) -> list:
         human_message = """
 Evaluate step by step as below:
 1. Evaluate the logical consistency of the reasoning chain in the analysis result. 
@@ -89,18 +92,50 @@ Wrap the output in `json` tags with the structure of the FinalReport.
             },
         ]
         self.log.debug(messages)
-        response = (
-            self.client.chat.completions.create(
-                model=self.model, messages=messages, temperature=0
-            )
-            .choices[0]
-            .message.content
+        return messages
+
+    def score_cache_key(
+        self, check_report: CheckReport, hierarchical_intents: dict
+    ) -> str:
+        """Content-addressed key of the report `score` produces"""
+        return artifact_key(
+            Stage.FINAL_REPORT,
+            self.model,
+            self._score_messages(check_report, hierarchical_intents),
         )
+
+    def _parse_report(self, response: str) -> FinalReport:
         self.log.debug(response)
         response = response.strip("```json\n").strip("\n```")
         report = FinalReport.model_validate_json(response)
 
-        with open("score_report.output.md", "w") as f:
-            f.write(report.model_dump_json(indent=4))
-
         return report
+
+    def score(
+        self, check_report: CheckReport, hierarchical_intents: dict
+    ) -> FinalReport:
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=fit_messages(
+                self._score_messages(check_report, hierarchical_intents),
+                role=self.name,
+            ),
+            temperature=0,
+        )
+        usage_tracker.record(self.name, completion)
+        return self._parse_report(completion.choices[0].message.content)
+
+    async def ascore(
+        self, check_report: CheckReport, hierarchical_intents: dict
+    ) -> FinalReport:
+        """Async variant of `score`, requires an `AsyncClient`"""
+        completion = await self.client.chat.completions.create(
+            model=self.model,
+            messages=fit_messages(
+                self._score_messages(check_report, hierarchical_intents),
+                role=self.name,
+            ),
+            temperature=0,
+        )
+        usage_tracker.record(self.name, completion)
+        return self._parse_report(completion.choices[0].message.content)
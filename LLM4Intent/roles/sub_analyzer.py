@@ -1,15 +1,26 @@
+import asyncio
+import inspect
 import json
 import logging
-from typing import Callable, Dict, List
-from openai import Client
+from typing import Callable, Dict, List, Optional, Union
+from openai import AsyncClient, Client
 from openai.types.chat import ChatCompletionMessage
+from LLM4Intent.common.passages import relevance_context
+from LLM4Intent.common.results_store import Stage
+from LLM4Intent.common.stages import artifact_key
+from LLM4Intent.common.tokens import fit_messages, usage_tracker
+from LLM4Intent.common.tool_results import compact_tool_result
 from LLM4Intent.common.utils import convert_tool, get_logger, get_prompt
 
+MAX_ITERATIONS = 10  # Prevent infinite loops
+QUESTION_PREFIX = "Known Transaction Facts: "
+
+
 class DomainExpertAnalyzer:
     def __init__(
         self,
         model: str,
-        client: Client,
+        client: Union[Client, AsyncClient],
         known_facts: str,
         main_perspective: str,
         tools: List[Callable],
@@ -37,138 +48,203 @@ class DomainExpertAnalyzer:
                 # Skip this tool or create a simplified version if needed
         self.converted_tools = converted_tools
 
+    def _tool_message(self, tool_call, result) -> dict:
+        # large results stay out of the context, the model queries them by handle
+        result = compact_tool_result(tool_call.function.name, result)
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": json.dumps(result),
+        }
+
+    def _tool_error_message(self, tool_call, tool_args, e: Exception) -> dict:
+        error_message = (
+            f"Error in tool {tool_call.function.name} with args {tool_args}: {str(e)}"
+        )
+        self.log.error(error_message)
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": error_message,
+        }
+
+    def _resolve_tool(self, question: str, tool_call) -> tuple:
+        tool_name = tool_call.function.name
+        tool_args = json.loads(tool_call.function.arguments)
+
+        self.log.warning(f"For {question} call Tool: {tool_name} with args {tool_args}")
+
+        tool = self.tool_map.get(tool_name)
+        if not tool:
+            raise ValueError(f"Tool {tool_name} not found in tool map")
+
+        return tool, tool_args
+
+    def _relevance_context(self, question: str) -> str:
+        """The question with the addresses, function and events of the transaction
+
+        Tools returning long text, like extracted webpages, rank it against this.
+        """
+        terms = [question]
+        if isinstance(self.facts, dict):
+            terms += [self.facts.get("from") or "", self.facts.get("to") or ""]
+            decoded_input = self.facts.get("decoded_input") or {}
+            terms.append(decoded_input.get("function") or "")
+            for log in self.facts.get("decoded_logs") or []:
+                terms += [log.get("address") or "", log.get("event") or ""]
+        return " ".join(term for term in dict.fromkeys(terms) if term)
+
     def call_tools(self, question: str, response: ChatCompletionMessage) -> list:
         tool_messages = [
             response.to_dict(),
         ]
 
-        for tool_call in response.tool_calls:
-            tool_name = tool_call.function.name
-            tool_args = json.loads(tool_call.function.arguments)
-
-            self.log.warning(f"For {question} call Tool: {tool_name} with args {tool_args}")
-
-            tool = self.tool_map.get(tool_name)
-            if tool:
+        token = relevance_context.set(self._relevance_context(question))
+        try:
+            for tool_call in response.tool_calls:
+                tool, tool_args = self._resolve_tool(question, tool_call)
                 try:
                     result = tool(**tool_args)
-                    tool_messages.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": json.dumps(result),
-                        }
-                    )
+                    tool_messages.append(self._tool_message(tool_call, result))
                 except Exception as e:
-                    error_message = (
-                        f"Error in tool {tool_name} with args {tool_args}: {str(e)}"
-                    )
-                    self.log.error(error_message)
                     tool_messages.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": error_message,
-                        }
+                        self._tool_error_message(tool_call, tool_args, e)
                     )
-            else:
-                raise ValueError(f"Tool {tool_name} not found in tool map")
+        finally:
+            relevance_context.reset(token)
 
         return tool_messages
 
-    def analyze(self, previous_chat_history: list, question: str, prompt: str) -> str:
-        """
-        Analyze a specific sub-question using tools and LLM capabilities
-
-        Args:
-            previous_chat_history (list): The chat history so far
-            question: The sub-question to analyze
-            prompt: The prompt to use for the analysis
+    async def _acall_tool(self, question: str, tool_call) -> dict:
+        tool, tool_args = self._resolve_tool(question, tool_call)
+        try:
+            if inspect.iscoroutinefunction(tool):
+                result = await tool(**tool_args)
+            else:
+                # blocking tools (requests / web3 HTTP) run on the loop's default executor
+                result = await asyncio.to_thread(tool, **tool_args)
+            return self._tool_message(tool_call, result)
+        except Exception as e:
+            return self._tool_error_message(tool_call, tool_args, e)
 
-        Returns:
-            str: The analysis result
-        """
+    async def acall_tools(self, question: str, response: ChatCompletionMessage) -> list:
+        """Async variant of `call_tools`, the tool calls of one response run concurrently"""
+        # the tasks and threads of the tool calls copy the context when created
+        token = relevance_context.set(self._relevance_context(question))
+        try:
+            results = await asyncio.gather(
+                *(
+                    self._acall_tool(question, tool_call)
+                    for tool_call in response.tool_calls
+                )
+            )
+        finally:
+            relevance_context.reset(token)
+        return [response.to_dict(), *results]
 
-        chat_history = [
+    def _start_chat_history(
+        self, previous_chat_history: list, question: str, prompt: str
+    ) -> list:
+        return [
             *previous_chat_history,
             {
                 "role": "user",
-                "content": f"Known Transaction Facts: {json.dumps(self.facts)}\n\nQuestion to analyze: {question}\n\n{prompt}",
+                "content": f"{QUESTION_PREFIX}{json.dumps(self.facts)}\n\nQuestion to analyze: {question}\n\n{prompt}",
             },
         ]
-        max_iterations = 10  # Prevent infinite loops
-        iterations = 0
 
-        while iterations < max_iterations:
-            iterations += 1
-            self.log.info(
-                f"Iteration {iterations} for question: {question} ({self.main_perspective})"
-            )
+    def _completion_kwargs(self, chat_history: list) -> dict:
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            *chat_history,
+        ]
 
-            messages = [
-                {"role": "system", "content": self.system_prompt},
-                *chat_history,
-            ]
+        return dict(
+            model=self.model_name,
+            messages=messages,
+            tools=self.converted_tools,
+            tool_choice="auto",
+            temperature=0,
+        )
 
-            completion = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                tools=self.converted_tools,
-                tool_choice="auto",
-                temperature=0,
+    def _budgeted_kwargs(self, chat_history: list) -> dict:
+        kwargs = self._completion_kwargs(chat_history)
+        messages = kwargs["messages"]
+        # the facts and the question being analyzed are never dropped
+        question = max(
+            i
+            for i, message in enumerate(messages)
+            if message.get("role") == "user"
+            and str(message.get("content")).startswith(QUESTION_PREFIX)
+        )
+        kwargs["messages"] = fit_messages(
+            messages, tools=kwargs["tools"], pinned=[question], role=self.name
+        )
+        return kwargs
+
+    def analyze_cache_key(
+        self, previous_chat_history: list, question: str, prompt: str
+    ) -> str:
+        """Content-addressed key of the result `analyze` produces"""
+        return artifact_key(
+            Stage.SUB_ANALYSIS,
+            self._completion_kwargs(
+                self._start_chat_history(previous_chat_history, question, prompt)
+            ),
+            MAX_ITERATIONS,
+        )
+
+    def _handle_answer(
+        self,
+        chat_history: list,
+        question: str,
+        response: ChatCompletionMessage,
+        iterations: int,
+    ) -> Optional[list]:
+        """Handle a response without tool calls, return the result once the analysis is complete"""
+        # Check if analysis is complete (when "END" appears in the response)
+        if "END" in response.content:
+            # Clean up the response by removing the END marker
+            final_response = response.content.replace("END", "").strip()
+            self.log.info(f"Analysis complete after {iterations} iterations")
+            chat_history.append(
+                {
+                    "role": "assistant",
+                    "content": final_response,
+                }
             )
 
-            response = completion.choices[0].message
+            self.log.info(f"Final response: {final_response}")
 
-            # Check if the response has tool calls that need to be processed
-            if response.tool_calls:
-                # Process tool calls and add results to conversation
-                tool_messages = self.call_tools(question, response)
-                chat_history.extend(
-                    tool_messages
-                )  # Skip the first item as it's the assistant's message already in conversation
-            else:
-                # Check if analysis is complete (when "END" appears in the response)
-                if "END" in response.content:
-                    # Clean up the response by removing the END marker
-                    final_response = response.content.replace("END", "").strip()
-                    self.log.info(f"Analysis complete after {iterations} iterations")
-                    chat_history.append(
-                        {
-                            "role": "assistant",
-                            "content": final_response,
-                        }
-                    )
+            return [
+                {
+                    "role": "user",
+                    "content": question,
+                },
+                {
+                    "role": "assistant",
+                    "content": final_response,
+                },
+            ]
 
-                    self.log.info(f"Final response: {final_response}")
-
-                    return [
-                        {
-                            "role": "user",
-                            "content": question,
-                        },
-                        {
-                            "role": "assistant",
-                            "content": final_response,
-                        },
-                    ]
-
-                # No tool calls, add response to conversation
-                chat_history.append({"role": "assistant", "content": response.content})
-
-                self.log.info(f"Response: {response.content}")
-
-                # Ask for additional analysis if not complete
-                chat_history.append(
-                    {
-                        "role": "user",
-                        "content": "Continue analyzing this question. When you have completed the analysis, include 'END' at the end of your response.",
-                    }
-                )
+        # No tool calls, add response to conversation
+        chat_history.append({"role": "assistant", "content": response.content})
+
+        self.log.info(f"Response: {response.content}")
 
+        # Ask for additional analysis if not complete
+        chat_history.append(
+            {
+                "role": "user",
+                "content": "Continue analyzing this question. When you have completed the analysis, include 'END' at the end of your response.",
+            }
+        )
+        return None
+
+    def _give_up(self, chat_history: list, question: str) -> list:
         # If we reach max iterations without completion
         self.log.warning(
-            f"Reached maximum iterations ({max_iterations}) without completing analysis"
+            f"Reached maximum iterations ({MAX_ITERATIONS}) without completing analysis"
         )
 
         self.log.warning(f"Final chat history: {chat_history}")
@@ -183,3 +259,71 @@ class DomainExpertAnalyzer:
                 "content": chat_history[-1]["content"],
             },
         ]
+
+    def analyze(self, previous_chat_history: list, question: str, prompt: str) -> list:
+        """
+        Analyze a specific sub-question using tools and LLM capabilities
+
+        Args:
+            previous_chat_history (list): The chat history so far
+            question: The sub-question to analyze
+            prompt: The prompt to use for the analysis
+
+        Returns:
+            list: The question and the final answer, as user and assistant messages
+        """
+
+        chat_history = self._start_chat_history(previous_chat_history, question, prompt)
+
+        for iterations in range(1, MAX_ITERATIONS + 1):
+            self.log.info(
+                f"Iteration {iterations} for question: {question} ({self.main_perspective})"
+            )
+
+            completion = self.client.chat.completions.create(
+                **self._budgeted_kwargs(chat_history)
+            )
+            usage_tracker.record(self.name, completion)
+
+            response = completion.choices[0].message
+
+            # Check if the response has tool calls that need to be processed
+            if response.tool_calls:
+                # Process tool calls and add results to conversation
+                chat_history.extend(self.call_tools(question, response))
+                continue
+
+            result = self._handle_answer(chat_history, question, response, iterations)
+            if result:
+                return result
+
+        return self._give_up(chat_history, question)
+
+    async def aanalyze(
+        self, previous_chat_history: list, question: str, prompt: str
+    ) -> list:
+        """Async variant of `analyze`, requires an `AsyncClient`"""
+
+        chat_history = self._start_chat_history(previous_chat_history, question, prompt)
+
+        for iterations in range(1, MAX_ITERATIONS + 1):
+            self.log.info(
+                f"Iteration {iterations} for question: {question} ({self.main_perspective})"
+            )
+
+            completion = await self.client.chat.completions.create(
+                **self._budgeted_kwargs(chat_history)
+            )
+            usage_tracker.record(self.name, completion)
+
+            response = completion.choices[0].message
+
+            if response.tool_calls:
+                chat_history.extend(await self.acall_tools(question, response))
+                continue
+
+            result = self._handle_answer(chat_history, question, response, iterations)
+            if result:
+                return result
+
+        return self._give_up(chat_history, question)
@@ -0,0 +1,384 @@
+import argparse
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from web3 import Web3
+
+from LLM4Intent.common.disk_cache import CACHE_DIR
+from LLM4Intent.common.utils import get_logger
+from LLM4Intent.tools.jsonrpc import (
+    SCAN_BLOCKS_PER_BATCH,
+    TRANSFER_TOPIC,
+    batch_request_from_jsonrpc,
+    get_finalized_block_number_from_jsonrpc,
+)
+
+ADDRESS_INDEX_PATH = os.getenv(
+    "ADDRESS_INDEX_PATH", os.path.join(CACHE_DIR, "address_index.sqlite3")
+)
+
+logger = get_logger("AddressIndex")
+
+
+def _topic_address(topic: str) -> str:
+    return "0x" + topic[-40:]
+
+
+class AddressIndex:
+    """A local SQLite index of the transactions and ERC20 transfers of every address
+
+    Blocks are ingested with their receipts in JSON-RPC batches, only up to the
+    finalized block so ingested data never needs to be rolled back. Range
+    queries are answered from the index once every block of the range is
+    ingested, see `is_covered`. Addresses are stored lowercase.
+    """
+
+    def __init__(self, path: str = ADDRESS_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS transactions (
+                hash TEXT PRIMARY KEY,
+                block_number INTEGER NOT NULL,
+                transaction_index INTEGER NOT NULL,
+                block_timestamp INTEGER NOT NULL,
+                nonce INTEGER NOT NULL,
+                from_address TEXT NOT NULL,
+                to_address TEXT,
+                contract_address TEXT,
+                value TEXT NOT NULL,
+                gas INTEGER NOT NULL,
+                gas_price TEXT,
+                input TEXT NOT NULL,
+                status INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS address_transactions (
+                address TEXT NOT NULL,
+                block_number INTEGER NOT NULL,
+                transaction_index INTEGER NOT NULL,
+                direction TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (address, block_number, transaction_index, direction)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS token_transfers (
+                block_number INTEGER NOT NULL,
+                log_index INTEGER NOT NULL,
+                transaction_index INTEGER NOT NULL,
+                transaction_hash TEXT NOT NULL,
+                token TEXT NOT NULL,
+                from_address TEXT NOT NULL,
+                to_address TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (block_number, log_index)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS address_token_transfers (
+                address TEXT NOT NULL,
+                block_number INTEGER NOT NULL,
+                log_index INTEGER NOT NULL,
+                direction TEXT NOT NULL,
+                PRIMARY KEY (address, block_number, log_index, direction)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS ingested_blocks (
+                block_number INTEGER PRIMARY KEY
+            ) WITHOUT ROWID;
+            """
+        )
+        self._conn.commit()
+
+    ####################### INGESTION #######################
+
+    def ingest_blocks(self, from_block_number: int, to_block_number: int) -> None:
+        """Fetch blocks with full transactions and their receipts, and index them
+
+        Blocks past the finalized block are skipped, they could still be reorged.
+        """
+        finalized = get_finalized_block_number_from_jsonrpc()
+        to_block_number = min(to_block_number, finalized)
+        for chunk_start in range(
+            from_block_number, to_block_number + 1, SCAN_BLOCKS_PER_BATCH
+        ):
+            chunk_end = min(to_block_number, chunk_start + SCAN_BLOCKS_PER_BATCH - 1)
+            block_numbers = [hex(n) for n in range(chunk_start, chunk_end + 1)]
+            # read once, so kept out of the shared JSON-RPC cache
+            results = batch_request_from_jsonrpc(
+                [("eth_getBlockByNumber", [n, True]) for n in block_numbers]
+                + [("eth_getBlockReceipts", [n]) for n in block_numbers],
+                cached=False,
+            )
+            blocks = results[: len(block_numbers)]
+            receipts = results[len(block_numbers) :]
+            with self._lock:
+                for block, block_receipts in zip(blocks, receipts):
+                    self._insert_block(block, block_receipts)
+                self._conn.commit()
+
+    def _insert_block(self, block: dict, receipts: List[dict]) -> None:
+        block_number = int(block["number"], 16)
+        timestamp = int(block["timestamp"], 16)
+        receipts_by_hash = {receipt["transactionHash"]: receipt for receipt in receipts}
+
+        for tx in block["transactions"]:
+            receipt = receipts_by_hash.get(tx["hash"], {})
+            tx_index = int(tx["transactionIndex"], 16)
+            self._conn.execute(
+                "INSERT OR IGNORE INTO transactions VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    tx["hash"],
+                    block_number,
+                    tx_index,
+                    timestamp,
+                    int(tx["nonce"], 16),
+                    tx["from"],
+                    tx["to"],
+                    receipt.get("contractAddress"),
+                    str(int(tx["value"], 16)),
+                    int(tx["gas"], 16),
+                    str(int(tx["gasPrice"], 16)) if tx.get("gasPrice") else None,
+                    tx["input"],
+                    int(receipt["status"], 16) if receipt.get("status") else None,
+                ),
+            )
+            # a contract creation is indexed as received by the created contract
+            to_address = tx["to"] or receipt.get("contractAddress")
+            for direction, address in (("from", tx["from"]), ("to", to_address)):
+                if address is not None:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO address_transactions "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (address, block_number, tx_index, direction, tx["hash"]),
+                    )
+
+            for log in receipt.get("logs", []):
+                # ERC20 Transfer, ERC721 has the token id as a third indexed topic
+                if len(log["topics"]) != 3 or log["topics"][0] != TRANSFER_TOPIC:
+                    continue
+                log_index = int(log["logIndex"], 16)
+                from_address = _topic_address(log["topics"][1])
+                to_address = _topic_address(log["topics"][2])
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO token_transfers "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        block_number,
+                        log_index,
+                        tx_index,
+                        tx["hash"],
+                        log["address"].lower(),
+                        from_address,
+                        to_address,
+                        str(int(log["data"], 16) if log["data"] != "0x" else 0),
+                    ),
+                )
+                for direction, address in (("from", from_address), ("to", to_address)):
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO address_token_transfers "
+                        "VALUES (?, ?, ?, ?)",
+                        (address, block_number, log_index, direction),
+                    )
+
+        self._conn.execute(
+            "INSERT OR IGNORE INTO ingested_blocks VALUES (?)", (block_number,)
+        )
+
+    def latest_ingested_block_number(self) -> Optional[int]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MAX(block_number) FROM ingested_blocks"
+            ).fetchone()[0]
+
+    def follow(
+        self,
+        from_block_number: int,
+        poll_interval: float = 12,
+        stop: Optional[threading.Event] = None,
+    ) -> None:
+        """Keep ingesting up to the finalized block until `stop` is set"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            latest = self.latest_ingested_block_number()
+            start = max(from_block_number, latest + 1 if latest is not None else 0)
+            finalized = get_finalized_block_number_from_jsonrpc()
+            if start <= finalized:
+                end = min(finalized, start + 100 * SCAN_BLOCKS_PER_BATCH - 1)
+                logger.info("Ingesting blocks {} - {}".format(start, end))
+                self.ingest_blocks(start, end)
+                continue
+            stop.wait(poll_interval)
+
+    ####################### QUERIES #######################
+
+    def is_covered(self, from_block_number: int, to_block_number: int) -> bool:
+        """Whether every block of the range is ingested"""
+        with self._lock:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM ingested_blocks WHERE block_number BETWEEN ? AND ?",
+                (from_block_number, to_block_number),
+            ).fetchone()[0]
+        return count == to_block_number - from_block_number + 1
+
+    def get_address_transactions(
+        self,
+        address: str,
+        from_block_number: int,
+        to_block_number: int,
+        direction: Optional[str] = None,
+    ) -> List[Dict]:
+        """Transactions sent (`direction="from"`), received ("to") or both by an address"""
+        query = (
+            "SELECT DISTINCT t.hash, t.nonce, t.from_address, t.to_address, t.value, "
+            "t.gas, t.gas_price, t.input, t.block_number, t.block_timestamp, "
+            "t.contract_address, t.transaction_index "
+            "FROM address_transactions a JOIN transactions t ON t.hash = a.hash "
+            "WHERE a.address = ? AND a.block_number BETWEEN ? AND ?"
+        )
+        params: list = [address.lower(), from_block_number, to_block_number]
+        if direction is not None:
+            query += " AND a.direction = ?"
+            params.append(direction)
+        query += " ORDER BY t.block_number, t.transaction_index"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return [
+            {
+                "hash": tx_hash,
+                "nonce": nonce,
+                "from": Web3.to_checksum_address(from_address),
+                "to": Web3.to_checksum_address(to_address) if to_address else None,
+                "value": int(value),
+                "gas": gas,
+                "gasPrice": int(gas_price) if gas_price else None,
+                "input": tx_input,
+                "blockNumber": block_number,
+                "blockTimestamp": block_timestamp,
+                **(
+                    {"contractAddress": Web3.to_checksum_address(contract_address)}
+                    if contract_address
+                    else {}
+                ),
+            }
+            for (
+                tx_hash,
+                nonce,
+                from_address,
+                to_address,
+                value,
+                gas,
+                gas_price,
+                tx_input,
+                block_number,
+                block_timestamp,
+                contract_address,
+                _,
+            ) in rows
+        ]
+
+    def get_address_token_transfers(
+        self,
+        address: str,
+        from_block_number: int,
+        to_block_number: int,
+        direction: Optional[str] = None,
+    ) -> List[Dict]:
+        """ERC20 transfers sent (`direction="from"`), received ("to") or both by an address"""
+        query = (
+            "SELECT DISTINCT t.block_number, t.log_index, t.transaction_index, "
+            "t.transaction_hash, t.token, t.from_address, t.to_address, t.value "
+            "FROM address_token_transfers a JOIN token_transfers t "
+            "ON t.block_number = a.block_number AND t.log_index = a.log_index "
+            "WHERE a.address = ? AND a.block_number BETWEEN ? AND ?"
+        )
+        params: list = [address.lower(), from_block_number, to_block_number]
+        if direction is not None:
+            query += " AND a.direction = ?"
+            params.append(direction)
+        query += " ORDER BY t.block_number, t.log_index"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        return [
+            {
+                "address": Web3.to_checksum_address(token),
+                "blockNumber": block_number,
+                "transactionHash": tx_hash,
+                "transactionIndex": tx_index,
+                "logIndex": log_index,
+                "decoded": {
+                    "from": Web3.to_checksum_address(from_address),
+                    "to": Web3.to_checksum_address(to_address),
+                    "value": int(value),
+                },
+            }
+            for (
+                block_number,
+                log_index,
+                tx_index,
+                tx_hash,
+                token,
+                from_address,
+                to_address,
+                value,
+            ) in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_address_index: Optional[AddressIndex] = None
+_address_index_lock = threading.Lock()
+
+
+def get_address_index() -> Optional[AddressIndex]:
+    """The process-wide index at ADDRESS_INDEX_PATH, None until something was ingested there"""
+    global _address_index
+    with _address_index_lock:
+        if _address_index is None and os.path.exists(ADDRESS_INDEX_PATH):
+            _address_index = AddressIndex(ADDRESS_INDEX_PATH)
+        return _address_index
+
+
+def get_covering_address_index(
+    from_block_number: int, to_block_number: int
+) -> Optional[AddressIndex]:
+    """The address index if it holds every block of the range, None otherwise"""
+    index = get_address_index()
+    if index is not None and index.is_covered(from_block_number, to_block_number):
+        return index
+    return None
+
+
+def start():
+    parser = argparse.ArgumentParser(
+        description="Ingest blocks into the local address activity index"
+    )
+    parser.add_argument("--from-block", type=int, required=True)
+    parser.add_argument(
+        "--to-block",
+        type=int,
+        help="Stop at this block instead of following the chain",
+    )
+    parser.add_argument("--path", default=ADDRESS_INDEX_PATH)
+    args = parser.parse_args()
+
+    index = AddressIndex(args.path)
+    if args.to_block is not None:
+        index.ingest_blocks(args.from_block, args.to_block)
+    else:
+        index.follow(args.from_block)
+
+
+if __name__ == "__main__":
+    start()
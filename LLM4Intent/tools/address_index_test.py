@@ -0,0 +1,66 @@
+from LLM4Intent.tools.address_index import AddressIndex
+from LLM4Intent.tools.jsonrpc import TRANSFER_TOPIC
+
+sender = "0xd8da6bf26964af9d7eed9e03e53415d37aa96045"
+receiver = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+tx_hash = "0x43a2cb2a2a4fa683a67db6f828d2db99e1253a33a8eb1032915e50f71d85a9f0"
+
+
+def _block(number: int) -> dict:
+    return {
+        "number": hex(number),
+        "timestamp": hex(1_700_000_000 + number),
+        "transactions": [
+            {
+                "hash": tx_hash,
+                "transactionIndex": "0x0",
+                "nonce": "0x1",
+                "from": sender,
+                "to": receiver,
+                "value": hex(10**18),
+                "gas": "0x5208",
+                "gasPrice": "0x3b9aca00",
+                "input": "0x",
+            }
+        ],
+    }
+
+
+def _receipts() -> list:
+    return [
+        {
+            "transactionHash": tx_hash,
+            "status": "0x1",
+            "contractAddress": None,
+            "logs": [
+                {
+                    "address": receiver,
+                    "logIndex": "0x0",
+                    "topics": [
+                        TRANSFER_TOPIC,
+                        "0x" + "0" * 24 + receiver[2:],
+                        "0x" + "0" * 24 + sender[2:],
+                    ],
+                    "data": hex(5),
+                }
+            ],
+        }
+    ]
+
+
+def test_AddressIndex_queries(tmp_path):
+    index = AddressIndex(str(tmp_path / "address_index.sqlite3"))
+    index._insert_block(_block(100), _receipts())
+    index._conn.commit()
+
+    assert index.is_covered(100, 100)
+    assert not index.is_covered(100, 101)
+
+    txs = index.get_address_transactions(sender, 100, 100)
+    assert [tx["hash"] for tx in txs] == [tx_hash]
+    assert txs[0]["value"] == 10**18
+    assert index.get_address_transactions(sender, 100, 100, direction="to") == []
+
+    transfers = index.get_address_token_transfers(sender, 100, 100, direction="to")
+    assert transfers[0]["decoded"]["value"] == 5
+    assert index.get_address_token_transfers(sender, 101, 200) == []
@@ -1,9 +1,15 @@
-from typing import Dict, List
-from datetime import datetime
-import requests
-
-
+import os
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+
+from LLM4Intent.tools.address_index import get_covering_address_index
+from LLM4Intent.tools.decoder import CallDecoder, LogDecoder
+from LLM4Intent.tools.labels import label_store
+from LLM4Intent.common.passages import relevance_context, top_passages
+from LLM4Intent.common.rate_limit import Priority
+from LLM4Intent.common import tool_results
 from LLM4Intent.tools.etherscan import (
+    EtherscanError,
     get_verified_contract_abi_from_etherscan,
     get_verified_contract_source_code_from_etherscan,
     get_contract_creation_from_etherscan,
@@ -12,34 +18,46 @@ from LLM4Intent.tools.etherscan import (
 from LLM4Intent.tools.jsonrpc import (
     get_address_token_balance_at_block_number_from_jsonrpc,
     get_address_eth_balance_at_block_number_from_jsonrpc,
+    get_address_transactions_within_block_number_range_from_jsonrpc,
+    get_balances_at_block_numbers_from_jsonrpc,
+    ETH,
     get_contract_basic_info_from_jsonrpc,
+    get_contracts_basic_info_from_jsonrpc,
     get_contract_code_at_block_number_from_jsonrpc,
     get_contract_storage_at_block_number_from_jsonrpc,
     get_transaction_from_jsonrpc,
     get_transaction_receipt_from_jsonrpc,
     get_transaction_time_from_jsonrpc,
+    get_block_timestamp_from_jsonrpc,
+    get_block_number_at_time_from_jsonrpc,
+    get_contract_events_within_block_number_range_from_jsonrpc,
+    get_erc20_transfers_of_address_from_jsonrpc,
+    get_erc20_transfers_of_token_from_jsonrpc,
     get_transaction_trace_from_jsonrpc,
 )
+from LLM4Intent.tools.signatures import abi_signatures, signature_database
+from LLM4Intent.tools.source_index import get_source_index
 from LLM4Intent.tools.web2 import (
     extract_webpage_info_by_urls_from_tavily,
     get_address_labels_from_github_repo,
     get_contract_ABI_from_whatsabi,
     get_function_signatures_from_signature_database,
     get_event_signatures_from_signature_database,
+    load_webpage,
     search_webpages_from_tavily,
+    store_webpage,
 )
 from LLM4Intent.tools.web3research import (
-    get_address_token_transfers_within_block_number_range_from_web3research,
     get_address_transactions_within_block_number_range_from_web3research,
-    get_contract_events_within_block_number_range_from_web3research,
-    get_token_transfers_from_address_within_block_number_range_from_web3research,
-    get_token_transfers_to_address_within_block_number_range_from_web3research,
-    get_token_transfers_within_block_number_range_from_web3research,
     get_transactions_from_address_within_block_number_range_from_web3research,
     get_transactions_to_address_within_block_number_range_from_web3research,
 )
 
 
+# characters of a webpage returned per get_webpage_content call
+WEBPAGE_PART_CHARS = 8000
+
+
 """-------------jsonrpc-------------"""
 
 
@@ -92,6 +110,40 @@ def get_address_eth_balance_at_block_number(address: str, block_number: int) ->
     return get_address_eth_balance_at_block_number_from_jsonrpc(address, block_number)
 
 
+def get_balances_at_block_numbers(
+    holders: List[str], tokens: List[str], block_numbers: List[int]
+) -> Dict:
+    """Retrieves the ETH and ERC20 token balances of many addresses at several block numbers at once,
+    e.g. the balances of every participant of a transaction before (block_number - 1) and after (block_number) it
+
+    Args:
+        holders: The addresses to check balances for
+        tokens: The ERC20 token contract addresses, use "ETH" for the ETH balance
+        block_numbers: The block numbers to check balances at
+
+    Returns:
+        Dict: The block numbers and the balances in form of {holder: {token: [balance at each block number]}},
+            balances are in wei / the token's smallest unit, null if the token has no balanceOf
+    """
+    print(f"Calling get_balances_at_block_numbers_from_jsonrpc with input:")
+    print(f"holders: {holders}, tokens: {tokens}, block_numbers: {block_numbers}")
+
+    try:
+        tokens = [ETH if token.upper() == ETH else token for token in tokens]
+        pairs = [(holder, token) for holder in holders for token in tokens]
+        rows = get_balances_at_block_numbers_from_jsonrpc(pairs, block_numbers)
+        balances = {holder: {} for holder in holders}
+        for (holder, token), row in zip(pairs, rows):
+            balances[holder][token] = row
+        result = {"block_numbers": block_numbers, "balances": balances}
+        print(f"Result: {result}")
+        return result
+    except Exception as e:
+        error_result = {"error": str(e)}
+        print(f"Error occurred: {error_result}")
+        return error_result
+
+
 def get_address_token_transfers_within_block_number_range(
     address: str, from_block: int, to_block: int
 ) -> List[Dict]:
@@ -100,14 +152,15 @@ def get_address_token_transfers_within_block_number_range(
     Args:
         address: The address to get transfers for
         from_block: Starting block number
-        to_block: Ending block number, at most 1000 blocks can be queried at once, i.e. to_block <= from_block + 1000
+        to_block: Ending block number
 
     Returns:
         List[Dict]: List of token transfer events
     """
-    return get_address_token_transfers_within_block_number_range_from_web3research(
-        address, from_block, to_block
-    )
+    index = get_covering_address_index(from_block, to_block)
+    if index is not None:
+        return index.get_address_token_transfers(address, from_block, to_block)
+    return get_erc20_transfers_of_address_from_jsonrpc(address, from_block, to_block)
 
 def get_token_transfers_from_address_within_block_number_range(
     address: str, start_block: int, end_block: int
@@ -122,7 +175,14 @@ def get_token_transfers_from_address_within_block_number_range(
     Returns:
         List[Dict]: List of token transfer events
     """
-    return get_token_transfers_from_address_within_block_number_range_from_web3research(address, start_block, end_block)
+    index = get_covering_address_index(start_block, end_block)
+    if index is not None:
+        return index.get_address_token_transfers(
+            address, start_block, end_block, direction="from"
+        )
+    return get_erc20_transfers_of_address_from_jsonrpc(
+        address, start_block, end_block, direction="from"
+    )
 
 def get_token_transfers_to_address_within_block_number_range(
     address: str, start_block: int, end_block: int
@@ -137,7 +197,14 @@ def get_token_transfers_to_address_within_block_number_range(
     Returns:
         List[Dict]: List of token transfer events
     """
-    return get_token_transfers_to_address_within_block_number_range_from_web3research(address, start_block, end_block)
+    index = get_covering_address_index(start_block, end_block)
+    if index is not None:
+        return index.get_address_token_transfers(
+            address, start_block, end_block, direction="to"
+        )
+    return get_erc20_transfers_of_address_from_jsonrpc(
+        address, start_block, end_block, direction="to"
+    )
 
 
 def get_address_transactions_within_block_number_range(
@@ -148,11 +215,19 @@ def get_address_transactions_within_block_number_range(
     Args:
         address: The address to get transactions for
         from_block: Starting block number
-        to_block: Ending block number, at most 1000 blocks can be queried at once, i.e. to_block <= from_block + 1000
+        to_block: Ending block number
 
     Returns:
         List[Dict]: List of transactions
     """
+    index = get_covering_address_index(from_block, to_block)
+    if index is not None:
+        return index.get_address_transactions(address, from_block, to_block)
+    if not os.getenv("W3R_API_KEY"):
+        # without web3research, scan the node directly
+        return get_address_transactions_within_block_number_range_from_jsonrpc(
+            address, from_block, to_block
+        )
     return get_address_transactions_within_block_number_range_from_web3research(
         address, from_block, to_block
     )
@@ -171,6 +246,11 @@ def get_transactions_from_address_within_block_number_range(
     Returns:
         List[Dict]: List of transactions
     """
+    index = get_covering_address_index(start_block, end_block)
+    if index is not None:
+        return index.get_address_transactions(
+            address, start_block, end_block, direction="from"
+        )
     return get_transactions_from_address_within_block_number_range_from_web3research(
         address, start_block, end_block
     )
@@ -189,6 +269,11 @@ def get_transactions_to_address_within_block_number_range(
     Returns:
         List[Dict]: List of transactions
     """
+    index = get_covering_address_index(start_block, end_block)
+    if index is not None:
+        return index.get_address_transactions(
+            address, start_block, end_block, direction="to"
+        )
     return get_transactions_to_address_within_block_number_range_from_web3research(
         address, start_block, end_block
     )
@@ -208,7 +293,7 @@ def get_address_token_balance_at_block_number(
         str: Token balance
     """
     return get_address_token_balance_at_block_number_from_jsonrpc(
-        token_address, address, block_number
+        address, token_address, block_number
     )
 
 
@@ -237,6 +322,32 @@ def get_contract_basic_info(contract_address: str, block_number: int) -> Dict:
         return error_result
 
 
+def get_contracts_basic_info(
+    contract_addresses: List[str], block_number: int
+) -> Dict:
+    """Retrieves basic information about many smart contracts at once, e.g. all tokens in a receipt
+
+    Args:
+        contract_addresses: The addresses of the smart contracts
+        block_number: The block number to get contract info at
+
+    Returns:
+        Dict: Contract information keyed by contract address
+    """
+    print(f"Calling get_contracts_basic_info_from_jsonrpc with input:")
+    print(f"contract_addresses: {contract_addresses}")
+
+    try:
+        infos = get_contracts_basic_info_from_jsonrpc(contract_addresses, block_number)
+        result = dict(zip(contract_addresses, infos))
+        print(f"Result: {result}")
+        return result
+    except Exception as e:
+        error_result = {"error": str(e)}
+        print(f"Error occurred: {error_result}")
+        return error_result
+
+
 def get_contract_events_within_block_number_range(
     contract_address: str, from_block: int, to_block: int
 ) -> List[Dict]:
@@ -245,12 +356,12 @@ def get_contract_events_within_block_number_range(
     Args:
         contract_address: The address of the smart contract
         from_block: Starting block number
-        to_block: Ending block number, at most 1000 blocks can be queried at once, i.e. to_block <= from_block + 1000
+        to_block: Ending block number
 
     Returns:
         List[Dict]: List of events (not decoded)
     """
-    return get_contract_events_within_block_number_range_from_web3research(
+    return get_contract_events_within_block_number_range_from_jsonrpc(
         contract_address, from_block, to_block
     )
 
@@ -296,12 +407,12 @@ def get_token_transfers_within_block_number_range(
     Args:
         contract_address: The address of the ERC20 token contract
         from_block: Starting block number
-        to_block: Ending block number, at most 1000 blocks can be queried at once, i.e. to_block <= from_block + 1000
+        to_block: Ending block number
 
     Returns:
         List[Dict]: List of token transfer events
     """
-    return get_token_transfers_within_block_number_range_from_web3research(
+    return get_erc20_transfers_of_token_from_jsonrpc(
         erc20_contract_address, from_block, to_block
     )
 
@@ -319,7 +430,10 @@ def get_contract_creation(contract_address: str) -> dict:
     Returns:
         dict: Contract creation information including creator address and transaction details
     """
-    return get_contract_creation_from_etherscan(contract_address)
+    try:
+        return get_contract_creation_from_etherscan(contract_address)
+    except EtherscanError as e:
+        return {"error": str(e)}
 
 
 def get_contract_source_code(contract_address: str) -> dict:
@@ -331,7 +445,75 @@ def get_contract_source_code(contract_address: str) -> dict:
     Returns:
         dict: Contract source code and related metadata
     """
-    return get_verified_contract_source_code_from_etherscan(contract_address)
+    try:
+        # the model is waiting on it, served before background lookups
+        return get_verified_contract_source_code_from_etherscan(
+            contract_address, priority=Priority.HIGH
+        )
+    except EtherscanError as e:
+        return {"error": str(e)}
+
+
+def get_contract_source_overview(contract_address: str) -> dict:
+    """Lists the files and contracts of the verified source of a contract, with the names of their functions, modifiers and events
+
+    Args:
+        contract_address: The Ethereum contract address to get the source overview for
+
+    Returns:
+        dict: Contract name, compiler, proxy implementation, files and contracts, without code
+    """
+    try:
+        index = get_source_index(contract_address)
+    except EtherscanError as e:
+        return {"error": str(e)}
+    if index is None:
+        return {"error": "Contract source code not verified"}
+    return index.overview()
+
+
+def get_contract_function_source(
+    contract_address: str, function: str, contract: Optional[str] = None
+) -> dict:
+    """Retrieves the source code of a function, modifier or event of a verified contract
+
+    Args:
+        contract_address: The Ethereum contract address
+        function: The name of the function/modifier/event, or a 4-byte function selector like 0xa9059cbb
+        contract: Only look in the contract (or library/interface) of this name, optional
+
+    Returns:
+        dict: The matching definitions with their code, those of the contract itself first
+    """
+    try:
+        index = get_source_index(contract_address)
+    except EtherscanError as e:
+        return {"error": str(e)}
+    if index is None:
+        return {"error": "Contract source code not verified"}
+    definitions = index.get_definitions(function, contract)
+    if not definitions:
+        return {"error": f"{function} not found, search the source for it"}
+    return {"definitions": definitions}
+
+
+def search_contract_source(contract_address: str, term: str) -> dict:
+    """Searches the verified source of a contract for a term, e.g. a variable, a function call or an address
+
+    Args:
+        contract_address: The Ethereum contract address
+        term: The text to search for, case-insensitive
+
+    Returns:
+        dict: The matching lines with their file, line number and enclosing definition
+    """
+    try:
+        index = get_source_index(contract_address)
+    except EtherscanError as e:
+        return {"error": str(e)}
+    if index is None:
+        return {"error": "Contract source code not verified"}
+    return index.search(term)
 
 
 """-------------database-------------"""
@@ -357,14 +539,10 @@ def get_function_signature(contract_address: str, hex_signature: str) -> str:
         print("No ABI found for contract address:", contract_address)
         return None
 
-    response = requests.post(
-        "http://evmlookup.web3resear.ch/api/keccak256/submit", json={"abi": abi}
-    )
-    response.raise_for_status()
-
-    signatures = response.json()
+    # hashed locally, get_contract_ABI also stored them in the signature database
+    signatures = abi_signatures(abi)
     for signature in signatures:
-        if signature["hex"] == hex_signature:
+        if signature["hex"] == hex_signature.lower():
             return [signature]
 
     print(
@@ -393,14 +571,10 @@ def get_event_signature(contract_address: str, hex_signature: str) -> str:
         print("No ABI found for contract address:", contract_address)
         return None
 
-    response = requests.post(
-        "http://evmlookup.web3resear.ch/api/keccak256/submit", json={"abi": abi}
-    )
-    response.raise_for_status()
-
-    signatures = response.json()
+    # hashed locally, get_contract_ABI also stored them in the signature database
+    signatures = abi_signatures(abi)
     for signature in signatures:
-        if signature["hex"] == hex_signature:
+        if signature["hex"] == hex_signature.lower():
             return [signature]
 
     print(
@@ -419,10 +593,17 @@ def get_contract_ABI(contract_address: str) -> dict:
         dict: Contract ABI in JSON format
     """
 
-    abi = get_verified_contract_abi_from_etherscan(contract_address)
+    try:
+        abi = get_verified_contract_abi_from_etherscan(
+            contract_address, priority=Priority.HIGH
+        )
+    except EtherscanError:
+        abi = None
     if not abi:
         abi = get_contract_ABI_from_whatsabi(contract_address)
 
+    # feed the local signature database with every ABI we see
+    signature_database.add_abi(abi)
     return abi
 
 
@@ -440,18 +621,58 @@ def search_webpages(query: str) -> dict:
     return response
 
 
-def extract_webpage_info_by_urls(urls: List[str]) -> dict:
+def extract_webpage_info_by_urls(urls: List[str], query: Optional[str] = None) -> dict:
     """
-    Extracts information from webpages using Browser agent and returns the response.
+    Extracts the passages of webpages most relevant to the analyzed question, with a handle to read the full page.
 
     Args:
         urls: A list of URLs to extract information from.
+        query: What to look for in the pages, in addition to the analyzed question, optional.
 
     Returns:
-        dict: The response from the Browser extraction agent.
+        dict: The relevant passages and the handle of every page, and the URLs that failed.
     """
     response = extract_webpage_info_by_urls_from_tavily(urls)
-    return response
+    focus = " ".join(filter(None, [query, relevance_context.get()]))
+    pages = []
+    for result in response["results"]:
+        content = result.get("raw_content") or ""
+        pages.append(
+            {
+                "url": result["url"],
+                "handle": store_webpage(result),
+                "characters": len(content),
+                "passages": top_passages(content, focus),
+            }
+        )
+    return {"pages": pages, "failed_results": response["failed_results"]}
+
+
+def get_webpage_content(handle: str, start: int = 0) -> dict:
+    """
+    Reads the full content of a webpage extracted before, a part at a time.
+
+    Args:
+        handle: The handle of the page returned by extract_webpage_info_by_urls.
+        start: The character to start reading at, the next_start of the previous part.
+
+    Returns:
+        dict: The part of the page content and where the next part starts, null at the end.
+    """
+    page = load_webpage(handle)
+    if page is None:
+        return {
+            "error": f"Unknown or expired page handle {handle}, extract the URL again"
+        }
+    content = page["raw_content"]
+    end = start + WEBPAGE_PART_CHARS
+    return {
+        "url": page["url"],
+        "content": content[start:end],
+        "start": start,
+        "next_start": end if end < len(content) else None,
+        "characters": len(content),
+    }
 
 
 def get_address_label(address: str) -> list[dict]:
@@ -464,7 +685,21 @@ def get_address_label(address: str) -> list[dict]:
     Returns:
         list[dict]: The labels for the address
     """
-    return get_address_labels_from_github_repo(address)
+    return label_store.lookup(address, fetch=get_address_labels_from_github_repo)
+
+
+def get_address_labels(addresses: List[str]) -> Dict[str, list]:
+    """Retrieves the labels of many Ethereum addresses at once, e.g. all the participants of a transaction
+
+    Args:
+        addresses: The Ethereum addresses to get the labels for
+
+    Returns:
+        Dict[str, list]: The labels keyed by address, an empty list if not found
+    """
+    return label_store.lookup_many(
+        addresses, fetch=get_address_labels_from_github_repo
+    )
 
 
 def get_transaction_time(transaction_hash: str) -> str:
@@ -477,3 +712,150 @@ def get_transaction_time(transaction_hash: str) -> str:
         str: The time of the transaction
     """
     return get_transaction_time_from_jsonrpc(transaction_hash)
+
+
+def get_block_timestamp(block_number: int) -> str:
+    """Retrieves the time (in UTC) a block was produced at
+
+    Args:
+        block_number: The block number to get the time of
+
+    Returns:
+        str: The time of the block in form of "YYYY-MM-DD HH:MM:SS"
+    """
+    timestamp = get_block_timestamp_from_jsonrpc(block_number)
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
+
+
+def get_block_number_at_time(time: str) -> int:
+    """Retrieves the last block produced at or before a time, use it to turn dates into block number ranges
+
+    Args:
+        time: The time in form of "YYYY-MM-DD HH:MM:SS" or "YYYY-MM-DD", in UTC unless it has an offset like "+02:00"
+
+    Returns:
+        int: The block number
+    """
+    moment = datetime.fromisoformat(time)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    else:
+        moment = moment.astimezone(timezone.utc)
+    return get_block_number_at_time_from_jsonrpc(int(moment.timestamp()))
+
+
+"""-------------artifacts-------------"""
+
+
+def page_tool_result(
+    artifact: str, path: str = "", offset: int = 0, limit: int = 20
+) -> dict:
+    """
+    Reads a large tool result stored as an artifact, a page of items at a time.
+
+    Args:
+        artifact: The artifact handle of the tool result, e.g. "artifact-0123456789abcdef".
+        path: The dot path of the list (or text) to read inside the result, e.g. "result.transfers" or "logs.0.topics", empty for the whole result.
+        offset: The index of the first item to read, the next_offset of the previous page.
+        limit: The number of items to read, at most 100.
+
+    Returns:
+        dict: The items, their total and the offset of the next page, null at the end.
+    """
+    try:
+        return tool_results.page(artifact, path, offset, limit)
+    except tool_results.ArtifactError as e:
+        return {"error": str(e)}
+
+
+def filter_tool_result(
+    artifact: str,
+    field: str,
+    operator: str,
+    value: str,
+    path: str = "",
+    offset: int = 0,
+    limit: int = 20,
+) -> dict:
+    """
+    Finds the items of a large tool result stored as an artifact whose field matches a condition.
+
+    Args:
+        artifact: The artifact handle of the tool result.
+        field: The dot path of the field to compare inside each item, e.g. "from" or "args.value".
+        operator: One of "==", "!=", ">", ">=", "<", "<=" or "contains". Numbers (decimal or hex) compare as numbers, text case-insensitively.
+        value: The value to compare the field with.
+        path: The dot path of the list inside the result, empty if the result is the list.
+        offset: The index of the first matching item to return.
+        limit: The number of matching items to return, at most 100.
+
+    Returns:
+        dict: The matching items, their total and the offset of the next page, null at the end.
+    """
+    try:
+        return tool_results.filter_rows(
+            artifact, field, operator, value, path, offset, limit
+        )
+    except tool_results.ArtifactError as e:
+        return {"error": str(e)}
+
+
+def project_tool_result(
+    artifact: str, fields: List[str], path: str = "", offset: int = 0, limit: int = 20
+) -> dict:
+    """
+    Reads only some fields of the items of a large tool result stored as an artifact.
+
+    Args:
+        artifact: The artifact handle of the tool result.
+        fields: The dot paths of the fields to keep in each item, e.g. ["from", "to", "value"].
+        path: The dot path of the list inside the result, empty if the result is the list.
+        offset: The index of the first item to read.
+        limit: The number of items to read, at most 100.
+
+    Returns:
+        dict: The projected items, their total and the offset of the next page, null at the end.
+    """
+    try:
+        return tool_results.project(artifact, fields, path, offset, limit)
+    except tool_results.ArtifactError as e:
+        return {"error": str(e)}
+
+
+def aggregate_tool_result(
+    artifact: str, field: str, group_by: Optional[str] = None, path: str = ""
+) -> dict:
+    """
+    Counts and sums a field over the items of a large tool result stored as an artifact, optionally per group.
+
+    Args:
+        artifact: The artifact handle of the tool result.
+        field: The dot path of the field to aggregate inside each item, e.g. "value".
+        group_by: The dot path of the field to group the items by, e.g. "token_address", or null for a single total.
+        path: The dot path of the list inside the result, empty if the result is the list.
+
+    Returns:
+        dict: The count, distinct count, and for numbers the sum, min and max, per group if grouped, largest groups first.
+    """
+    try:
+        return tool_results.aggregate(artifact, field, group_by, path)
+    except tool_results.ArtifactError as e:
+        return {"error": str(e)}
+
+
+# decodes the logs attached to the transaction facts, see collect_fact
+log_decoder = LogDecoder(
+    get_abi=get_verified_contract_abi_from_etherscan,
+    lookup_signatures=get_event_signatures_from_signature_database,
+)
+
+# decodes the input of the transaction in the facts, see collect_fact
+call_decoder = CallDecoder(
+    abi_sources=[
+        ("etherscan", get_verified_contract_abi_from_etherscan),
+        ("whatsabi", get_contract_ABI_from_whatsabi),
+    ],
+    lookup_signatures=get_function_signatures_from_signature_database,
+)
@@ -0,0 +1,109 @@
+import os
+import threading
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+# blocks the file grows by when a later block is stored
+_GROWTH = 1 << 20
+# probes per round of the time -> block search, sent as one batch
+SEARCH_FANOUT = 32
+
+
+class BlockTimestamps:
+    """A memory-mapped block number -> unix timestamp array, filled lazily
+
+    Entry n of the file holds the timestamp of block n plus one as uint32, 0
+    while it is unknown, so the zeros a grown file is padded with stay unknown
+    and the genesis timestamp 0 can be stored. Missing entries are fetched with
+    `fetch`, which takes block numbers and returns their timestamps, e.g. from
+    block headers. Only blocks up to `finalized()` are written, later ones
+    could still be reorged. The file is created on first use and can be shared
+    by several processes, entries are written independently.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fetch: Callable[[List[int]], List[int]],
+        finalized: Callable[[], int],
+    ):
+        self.path = path
+        self.fetch = fetch
+        self.finalized = finalized
+        self._lock = threading.Lock()
+        self._timestamps = None
+
+    def _map(self):
+        self._timestamps = np.memmap(self.path, dtype=np.uint32, mode="r+")
+
+    def _ensure_capacity(self, block_number: int):
+        if self._timestamps is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # append mode never clobbers a file another process just created
+            with open(self.path, "ab") as f:
+                if f.seek(0, os.SEEK_END) < _GROWTH * 4:
+                    f.truncate(_GROWTH * 4)
+            self._map()
+        if block_number < len(self._timestamps):
+            return
+        # another process may have grown the file already
+        size = max(
+            os.path.getsize(self.path), (block_number // _GROWTH + 1) * _GROWTH * 4
+        )
+        self._timestamps.flush()
+        with open(self.path, "r+b") as f:
+            f.truncate(size)
+        self._map()
+
+    def get_many(self, block_numbers: Sequence[int]) -> Dict[int, int]:
+        """The timestamps of many blocks, the unknown ones fetched together"""
+        with self._lock:
+            self._ensure_capacity(max(block_numbers))
+            timestamps = {n: int(self._timestamps[n]) - 1 for n in block_numbers}
+
+        missing = sorted(n for n, timestamp in timestamps.items() if timestamp < 0)
+        if missing:
+            fetched = self.fetch(missing)
+            finalized = self.finalized()
+            with self._lock:
+                self._ensure_capacity(missing[-1])
+                for n, timestamp in zip(missing, fetched):
+                    if timestamp is None:
+                        raise ValueError(f"Block {n} does not exist yet")
+                    timestamps[n] = timestamp
+                    if n <= finalized:
+                        self._timestamps[n] = timestamp + 1
+
+        return timestamps
+
+    def get(self, block_number: int) -> int:
+        """The timestamp of a block, O(1) once it is known"""
+        return self.get_many([block_number])[block_number]
+
+    def block_number_at(self, timestamp: int, latest_block_number: int) -> int:
+        """The last block at or before a unix timestamp, 0 if it predates every block
+
+        A SEARCH_FANOUT-ary search, every round probes evenly spaced blocks of
+        the remaining range in one fetch, so it takes a handful of round trips
+        and none once the probed blocks are known.
+        """
+        low, high = 0, latest_block_number
+        if self.get(high) <= timestamp:
+            return high
+
+        # invariant: block `low` is at or before the timestamp (or 0), `high` after it
+        while high - low > 1:
+            step = max(1, (high - low) // SEARCH_FANOUT)
+            probes = list(range(low + step, high, step))
+            timestamps = self.get_many(probes)
+            for probe in probes:
+                if timestamps[probe] <= timestamp:
+                    low = probe
+                else:
+                    high = probe
+                    break
+
+        return low
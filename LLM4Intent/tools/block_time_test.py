@@ -0,0 +1,60 @@
+import pytest
+
+from LLM4Intent.tools.block_time import BlockTimestamps
+
+# a chain with one block every 12 seconds
+GENESIS_TIME = 1_600_000_000
+
+
+def _timestamp(block_number: int) -> int:
+    return GENESIS_TIME + 12 * block_number
+
+
+def test_BlockTimestamps(tmp_path):
+    fetched = []
+
+    def fetch(block_numbers):
+        fetched.extend(block_numbers)
+        return [_timestamp(n) for n in block_numbers]
+
+    path = str(tmp_path / "block_timestamps.u32")
+    block_timestamps = BlockTimestamps(path, fetch=fetch, finalized=lambda: 5_000_000)
+
+    assert block_timestamps.get(3_000_000) == _timestamp(3_000_000)
+    assert block_timestamps.get(3_000_000) == _timestamp(3_000_000)
+    assert fetched.count(3_000_000) == 1
+
+    assert block_timestamps.block_number_at(_timestamp(1234) + 5, 5_000_000) == 1234
+    assert block_timestamps.block_number_at(_timestamp(1234), 5_000_000) == 1234
+    assert block_timestamps.block_number_at(_timestamp(6_000_000), 5_000_000) == 5_000_000
+
+    # filled entries are persisted
+    reopened = BlockTimestamps(path, fetch=fetch, finalized=lambda: 5_000_000)
+    fetched.clear()
+    assert reopened.get(1234) == _timestamp(1234)
+    assert fetched == []
+
+
+def test_BlockTimestamps_genesis_and_lazy_file(tmp_path):
+    fetched = []
+
+    def fetch(block_numbers):
+        fetched.extend(block_numbers)
+        return [12 * n for n in block_numbers]
+
+    path = tmp_path / "cache" / "block_timestamps.u32"
+    block_timestamps = BlockTimestamps(str(path), fetch=fetch, finalized=lambda: 100)
+    assert not path.exists()
+
+    # genesis has timestamp 0 and is stored like any other block
+    assert block_timestamps.get(0) == 0
+    assert block_timestamps.get(0) == 0
+    assert fetched == [0]
+    assert path.exists()
+
+    # blocks past the head are not guessed
+    past_head = BlockTimestamps(
+        str(path), fetch=lambda block_numbers: [None], finalized=lambda: 100
+    )
+    with pytest.raises(ValueError):
+        past_head.get(200)
@@ -0,0 +1,433 @@
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from eth_abi import decode
+from web3 import Web3
+
+from LLM4Intent.tools.signatures import (
+    SignatureKind,
+    abi_item_signature,
+    canonical_type,
+    signature_hex,
+)
+
+
+def _event(name: str, *inputs: Tuple[str, str, bool]) -> dict:
+    return {
+        "type": "event",
+        "name": name,
+        "inputs": [
+            {"type": type_, "name": input_name, "indexed": indexed}
+            for type_, input_name, indexed in inputs
+        ],
+    }
+
+
+ERC20_EVENTS = [
+    _event(
+        "Transfer",
+        ("address", "from", True),
+        ("address", "to", True),
+        ("uint256", "value", False),
+    ),
+    _event(
+        "Approval",
+        ("address", "owner", True),
+        ("address", "spender", True),
+        ("uint256", "value", False),
+    ),
+]
+ERC721_EVENTS = [
+    _event(
+        "Transfer",
+        ("address", "from", True),
+        ("address", "to", True),
+        ("uint256", "tokenId", True),
+    ),
+    _event(
+        "Approval",
+        ("address", "owner", True),
+        ("address", "approved", True),
+        ("uint256", "tokenId", True),
+    ),
+    _event(
+        "ApprovalForAll",
+        ("address", "owner", True),
+        ("address", "operator", True),
+        ("bool", "approved", False),
+    ),
+]
+ERC1155_EVENTS = [
+    _event(
+        "TransferSingle",
+        ("address", "operator", True),
+        ("address", "from", True),
+        ("address", "to", True),
+        ("uint256", "id", False),
+        ("uint256", "value", False),
+    ),
+    _event(
+        "TransferBatch",
+        ("address", "operator", True),
+        ("address", "from", True),
+        ("address", "to", True),
+        ("uint256[]", "ids", False),
+        ("uint256[]", "values", False),
+    ),
+    _event("URI", ("string", "value", False), ("uint256", "id", True)),
+]
+WETH_EVENTS = [
+    _event("Deposit", ("address", "dst", True), ("uint256", "wad", False)),
+    _event("Withdrawal", ("address", "src", True), ("uint256", "wad", False)),
+]
+
+# standard name -> events, ERC20 and ERC721 share topic0s and differ in topic count
+STANDARD_EVENTS = {
+    "ERC20": ERC20_EVENTS,
+    "ERC721": ERC721_EVENTS,
+    "ERC1155": ERC1155_EVENTS,
+    "WETH": WETH_EVENTS,
+}
+
+# (topic0, number of topics) -> event ABI item
+EventTable = Dict[Tuple[str, int], dict]
+
+
+def event_table(abi: List[dict]) -> EventTable:
+    """Index the events of an ABI by their topic0 and number of topics"""
+    table = {}
+    for item in abi or []:
+        if not isinstance(item, dict) or item.get("type") != SignatureKind.EVENT:
+            continue
+        if item.get("anonymous"):
+            continue
+        topic0 = signature_hex(abi_item_signature(item), SignatureKind.EVENT)
+        indexed = sum(1 for i in item.get("inputs", []) if i.get("indexed"))
+        table[(topic0, indexed + 1)] = item
+    return table
+
+
+_STANDARD_TABLE: Dict[Tuple[str, int], Tuple[str, dict]] = {
+    key: (standard, item)
+    for standard, events in STANDARD_EVENTS.items()
+    for key, item in event_table(events).items()
+}
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return "0x" + value.hex()
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, str) and Web3.is_address(value):
+        return Web3.to_checksum_address(value)
+    return value
+
+
+def _is_dynamic(type_: str) -> bool:
+    return type_ in ("string", "bytes") or type_.endswith("]") or type_.startswith("(")
+
+
+def decode_log_with_event(log: dict, item: dict) -> Dict[str, Any]:
+    """Decode a raw log with the matching event ABI item, returns its named arguments"""
+    topics = [Web3.to_bytes(hexstr=topic) for topic in log["topics"][1:]]
+    inputs = item.get("inputs", [])
+    indexed = [i for i in inputs if i.get("indexed")]
+    non_indexed = [i for i in inputs if not i.get("indexed")]
+    if len(indexed) != len(topics):
+        raise ValueError(
+            "{} expects {} indexed topics".format(item["name"], len(indexed))
+        )
+
+    values = decode(
+        [canonical_type(i) for i in non_indexed], Web3.to_bytes(hexstr=log["data"])
+    )
+    non_indexed_values = iter(values)
+    indexed_topics = iter(topics)
+
+    args = {}
+    for position, param in enumerate(inputs):
+        name = param.get("name") or "arg{}".format(position)
+        if param.get("indexed"):
+            topic = next(indexed_topics)
+            # indexed dynamic values are only stored as their hash
+            args[name] = (
+                "0x" + topic.hex()
+                if _is_dynamic(canonical_type(param))
+                else decode([canonical_type(param)], topic)[0]
+            )
+        else:
+            args[name] = next(non_indexed_values)
+    return {name: _jsonable(value) for name, value in args.items()}
+
+
+def _split_types(text: str) -> Tuple[str, List[str]]:
+    # "swap((address,uint256),bytes)" -> ("swap", ["(address,uint256)", "bytes"])
+    name, _, params = text.partition("(")
+    params = params[:-1]
+    types = []
+    depth, current = 0, ""
+    for char in params:
+        if char == "," and depth == 0:
+            types.append(current)
+            current = ""
+            continue
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        current += char
+    if current:
+        types.append(current)
+    return name, types
+
+
+def _event_from_text(text: str, indexed_count: int) -> Optional[dict]:
+    # a text signature does not tell which inputs are indexed, assume the first ones
+    name, types = _split_types(text)
+    if indexed_count > len(types) or any(t.startswith("(") for t in types):
+        return None
+    return {
+        "type": "event",
+        "name": name,
+        "inputs": [
+            {"type": t, "name": "", "indexed": i < indexed_count}
+            for i, t in enumerate(types)
+        ],
+    }
+
+
+def _load_abi(get_abi: Optional[Callable[[str], Any]], address: str) -> List[dict]:
+    # ABI sources return a list, a JSON string or nothing, and may fail
+    if get_abi is None:
+        return []
+    try:
+        abi = get_abi(address)
+    except Exception:
+        return []
+    if isinstance(abi, str):
+        try:
+            abi = json.loads(abi)
+        except ValueError:
+            return []
+    return abi if isinstance(abi, list) else []
+
+
+def _lookup(
+    lookup_signatures: Optional[Callable[[str], List[dict]]], hex_signature: str
+) -> List[dict]:
+    # the signature database may be remote and fail, the item then stays undecoded
+    if lookup_signatures is None:
+        return []
+    try:
+        return list(lookup_signatures(hex_signature) or [])
+    except Exception:
+        return []
+
+
+class LogDecoder:
+    """Decodes receipt logs locally
+
+    A log is matched against, in order: the ERC20/721/1155 and WETH events,
+    the verified ABI of the emitting contract from `get_abi` (only asked when
+    the standard events do not match, results are kept per address), and
+    the text signatures of the signature database from `lookup_signatures`.
+    """
+
+    def __init__(
+        self,
+        get_abi: Optional[Callable[[str], Any]] = None,
+        lookup_signatures: Optional[Callable[[str], List[dict]]] = None,
+    ):
+        self.get_abi = get_abi
+        self.lookup_signatures = lookup_signatures
+        self._tables: Dict[str, EventTable] = {}
+        self._lock = threading.Lock()
+
+    def _contract_table(self, address: str) -> EventTable:
+        address = address.lower()
+        with self._lock:
+            table = self._tables.get(address)
+        if table is None:
+            table = event_table(_load_abi(self.get_abi, address))
+            with self._lock:
+                self._tables[address] = table
+        return table
+
+    def _candidates(self, log: dict):
+        topic0 = log["topics"][0].lower()
+        key = (topic0, len(log["topics"]))
+        if key in _STANDARD_TABLE:
+            yield _STANDARD_TABLE[key]
+        item = self._contract_table(log["address"]).get(key)
+        if item is not None:
+            yield None, item
+        for signature in _lookup(self.lookup_signatures, topic0):
+            item = _event_from_text(signature["text"], len(log["topics"]) - 1)
+            if item is not None:
+                yield None, item
+
+    def decode_log(self, log: dict) -> Dict[str, Any]:
+        """Decode one raw log, `event` is None when no ABI or signature matches"""
+        decoded = {
+            "logIndex": log.get("logIndex"),
+            "address": Web3.to_checksum_address(log["address"]),
+            "event": None,
+        }
+        if not log["topics"]:
+            return decoded
+
+        for standard, item in self._candidates(log):
+            try:
+                args = decode_log_with_event(log, item)
+            except Exception:
+                continue
+            decoded["event"] = item["name"]
+            decoded["signature"] = abi_item_signature(item)
+            if standard is not None:
+                decoded["standard"] = standard
+            decoded["args"] = args
+            return decoded
+
+        decoded["topic0"] = log["topics"][0]
+        return decoded
+
+    def decode_logs(self, logs: List[dict]) -> List[Dict[str, Any]]:
+        return [self.decode_log(log) for log in logs]
+
+
+def function_table(abi: List[dict]) -> Dict[str, dict]:
+    """Index the functions of an ABI by their selector"""
+    return {
+        signature_hex(abi_item_signature(item), SignatureKind.FUNCTION): item
+        for item in abi
+        if isinstance(item, dict)
+        and item.get("type") == SignatureKind.FUNCTION
+        and item.get("name")
+    }
+
+
+def _named(value: Any, param: dict) -> Any:
+    # tuples become dicts keyed by their component names where the ABI has them
+    components = param.get("components")
+    if components is None:
+        return _jsonable(value)
+    if param["type"].endswith("]"):
+        element = {**param, "type": param["type"][: param["type"].rindex("[")]}
+        return [_named(v, element) for v in value]
+    return {
+        (c.get("name") or "arg{}".format(i)): _named(v, c)
+        for i, (c, v) in enumerate(zip(components, value))
+    }
+
+
+# calls nested deeper than this are left encoded
+MAX_CALL_DEPTH = 3
+
+
+class CallDecoder:
+    """Decodes transaction calldata locally, including calls nested in its arguments
+
+    The function is resolved through a chain of ABI sources tried in order,
+    e.g. the Etherscan verified ABI then whatsabi, each fetched once per
+    address, and finally the text signatures of `lookup_signatures`. Byte
+    arguments starting with a known selector are decoded as nested calls
+    (multicall, aggregate/aggregate3, Safe execTransaction, routers).
+    """
+
+    def __init__(
+        self,
+        abi_sources: Sequence[Tuple[str, Callable[[str], Any]]] = (),
+        lookup_signatures: Optional[Callable[[str], List[dict]]] = None,
+    ):
+        self.abi_sources = list(abi_sources)
+        self.lookup_signatures = lookup_signatures
+        self._tables: Dict[Tuple[str, str], Dict[str, dict]] = {}
+        self._lock = threading.Lock()
+
+    def _function_table(self, source: str, get_abi, address: str) -> Dict[str, dict]:
+        key = (source, address.lower())
+        with self._lock:
+            table = self._tables.get(key)
+        if table is None:
+            table = function_table(_load_abi(get_abi, address))
+            with self._lock:
+                self._tables[key] = table
+        return table
+
+    def _candidates(self, address: Optional[str], selector: str):
+        if address is not None:
+            for source, get_abi in self.abi_sources:
+                item = self._function_table(source, get_abi, address).get(selector)
+                if item is not None:
+                    yield source, item
+        for signature in _lookup(self.lookup_signatures, selector):
+            name, types = _split_types(signature["text"])
+            yield "signatures", {
+                "type": "function",
+                "name": name,
+                "inputs": [{"type": t, "name": ""} for t in types],
+            }
+
+    def decode_call(
+        self, address: Optional[str], data: str, depth: int = 0
+    ) -> Optional[Dict[str, Any]]:
+        """Decode calldata sent to `address`, None if it has no selector
+
+        Returns:
+            Dict: selector, function, signature, source of the ABI, named args
+                and the decoded nested calls; function is None when unresolved
+        """
+        data = Web3.to_bytes(hexstr=data) if isinstance(data, str) else bytes(data)
+        if len(data) < 4:
+            return None
+        selector = "0x" + data[:4].hex()
+        decoded = {
+            "to": Web3.to_checksum_address(address) if address else None,
+            "selector": selector,
+            "function": None,
+        }
+
+        for source, item in self._candidates(address, selector):
+            inputs = item.get("inputs", [])
+            try:
+                values = decode([canonical_type(i) for i in inputs], data[4:])
+            except Exception:
+                continue
+            args = {
+                (param.get("name") or "arg{}".format(i)): _named(value, param)
+                for i, (param, value) in enumerate(zip(inputs, values))
+            }
+            decoded.update(
+                function=item["name"],
+                signature=abi_item_signature(item),
+                source=source,
+                args=args,
+            )
+            if depth < MAX_CALL_DEPTH:
+                calls = self._nested_calls(address, values, depth)
+                if calls:
+                    decoded["calls"] = calls
+            return decoded
+
+        return decoded
+
+    def decode_transaction(self, transaction: dict) -> Optional[Dict[str, Any]]:
+        """Decode the input of a transaction, None for transfers and deployments"""
+        if not transaction.get("to"):
+            return None
+        return self.decode_call(transaction["to"], transaction.get("input") or b"")
+
+    def _nested_calls(self, address: Optional[str], values, depth: int) -> list:
+        # calldata is sent to the closest address before it, e.g. the target of
+        # an aggregate3 call or the `to` of execTransaction, else to `address`
+        calls = []
+        target = address
+        for value in values:
+            if isinstance(value, str) and Web3.is_address(value):
+                target = value
+            elif isinstance(value, bytes) and len(value) >= 4:
+                call = self.decode_call(target, value, depth + 1)
+                if call is not None and call["function"] is not None:
+                    calls.append(call)
+            elif isinstance(value, (list, tuple)):
+                calls.extend(self._nested_calls(target, value, depth))
+        return calls
@@ -0,0 +1,163 @@
+from eth_abi import encode
+from web3 import Web3
+
+from LLM4Intent.tools.decoder import CallDecoder, LogDecoder
+from LLM4Intent.tools.multicall import MULTICALL3_ADDRESS, encode_aggregate3
+
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+WETH_contract_address = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+sender = "0x" + "0" * 24 + "d8da6bf26964af9d7eed9e03e53415d37aa96045"
+receiver = "0x" + "0" * 24 + "c02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+
+
+def test_LogDecoder_standard_events():
+    decoder = LogDecoder()
+    erc20, erc721 = decoder.decode_logs(
+        [
+            {
+                "address": WETH_contract_address,
+                "logIndex": 0,
+                "topics": [TRANSFER_TOPIC, sender, receiver],
+                "data": "0x" + hex(10**18)[2:].zfill(64),
+            },
+            {
+                "address": WETH_contract_address,
+                "logIndex": 1,
+                "topics": [TRANSFER_TOPIC, sender, receiver, "0x" + "0" * 63 + "7"],
+                "data": "0x",
+            },
+        ]
+    )
+
+    assert erc20["standard"] == "ERC20"
+    assert erc20["args"] == {
+        "from": "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045",
+        "to": WETH_contract_address,
+        "value": 10**18,
+    }
+    assert erc721["standard"] == "ERC721"
+    assert erc721["args"]["tokenId"] == 7
+
+
+def test_LogDecoder_falls_back_to_signatures():
+    sync_topic = "0x1c411e9a96e071241c2f21f7726b17ae89e3cab4c78be50e062b03a9fffbbad1"
+    decoder = LogDecoder(
+        get_abi=lambda address: None,
+        lookup_signatures=lambda topic0: [
+            {"hex": topic0, "text": "Sync(uint112,uint112)"}
+        ],
+    )
+    decoded = decoder.decode_log(
+        {
+            "address": WETH_contract_address,
+            "logIndex": 3,
+            "topics": [sync_topic],
+            "data": "0x" + "1".zfill(64) + "2".zfill(64),
+        }
+    )
+    assert decoded["event"] == "Sync"
+    assert decoded["args"] == {"arg0": 1, "arg1": 2}
+
+    unknown = LogDecoder().decode_log(
+        {"address": WETH_contract_address, "topics": ["0x" + "ab" * 32], "data": "0x"}
+    )
+    assert unknown["event"] is None
+
+
+def _unreachable(hex_signature):
+    raise ConnectionError("signature service unreachable")
+
+
+def test_LogDecoder_survives_signature_lookup_errors():
+    decoder = LogDecoder(lookup_signatures=_unreachable)
+    decoded = decoder.decode_log(
+        {"address": WETH_contract_address, "topics": ["0x" + "ab" * 32], "data": "0x"}
+    )
+    assert decoded["event"] is None
+    assert decoded["topic0"] == "0x" + "ab" * 32
+
+
+USDC_contract_address = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+TRANSFER_ABI = [
+    {
+        "type": "function",
+        "name": "transfer",
+        "inputs": [
+            {"type": "address", "name": "to"},
+            {"type": "uint256", "name": "amount"},
+        ],
+    }
+]
+
+
+def test_CallDecoder_uses_abi_sources_in_order():
+    calldata = Web3.keccak(text="transfer(address,uint256)")[:4] + encode(
+        ["address", "uint256"], [WETH_contract_address, 5]
+    )
+    decoder = CallDecoder(
+        abi_sources=[
+            ("empty", lambda address: None),
+            ("abi", lambda address: TRANSFER_ABI),
+        ]
+    )
+    decoded = decoder.decode_transaction(
+        {"to": USDC_contract_address, "input": "0x" + calldata.hex()}
+    )
+
+    assert decoded["function"] == "transfer"
+    assert decoded["signature"] == "transfer(address,uint256)"
+    assert decoded["source"] == "abi"
+    assert decoded["args"] == {"to": WETH_contract_address, "amount": 5}
+    assert "calls" not in decoded
+
+    transfer_input = "0x" + calldata.hex()
+    empty_input = {"to": USDC_contract_address, "input": "0x"}
+    assert decoder.decode_transaction(empty_input) is None
+    assert decoder.decode_transaction({"to": None, "input": transfer_input}) is None
+
+
+def test_CallDecoder_decodes_nested_calls():
+    transfer = Web3.keccak(text="transfer(address,uint256)")[:4] + encode(
+        ["address", "uint256"], [WETH_contract_address, 5]
+    )
+    texts = {
+        "0x82ad56cb": "aggregate3((address,bool,bytes)[])",
+        "0xa9059cbb": "transfer(address,uint256)",
+    }
+    decoder = CallDecoder(
+        lookup_signatures=lambda selector: (
+            [{"hex": selector, "text": texts[selector]}] if selector in texts else []
+        )
+    )
+    decoded = decoder.decode_call(
+        MULTICALL3_ADDRESS,
+        encode_aggregate3(
+            [(USDC_contract_address, transfer), (USDC_contract_address, b"\x01" * 4)]
+        ),
+    )
+
+    assert decoded["function"] == "aggregate3"
+    assert decoded["source"] == "signatures"
+    assert decoded["args"]["arg0"][0] == [
+        USDC_contract_address,
+        True,
+        "0x" + transfer.hex(),
+    ]
+    (nested,) = decoded["calls"]
+    assert nested["to"] == USDC_contract_address
+    assert nested["function"] == "transfer"
+    assert nested["args"] == {"arg0": WETH_contract_address, "arg1": 5}
+
+    unknown = decoder.decode_call(USDC_contract_address, "0x12345678")
+    assert unknown["selector"] == "0x12345678"
+    assert unknown["function"] is None
+
+
+def test_CallDecoder_survives_signature_lookup_errors():
+    calldata = Web3.keccak(text="transfer(address,uint256)")[:4] + encode(
+        ["address", "uint256"], [WETH_contract_address, 5]
+    )
+    decoder = CallDecoder(lookup_signatures=_unreachable)
+    decoded = decoder.decode_call(USDC_contract_address, calldata)
+    assert decoded["selector"] == "0xa9059cbb"
+    assert decoded["function"] is None
@@ -1,53 +1,372 @@
 import os
+import threading
 import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence
 
 import requests
+from web3 import Web3
 
+from LLM4Intent.common.disk_cache import get_disk_cache
+from LLM4Intent.common.rate_limit import (
+    Priority,
+    RateLimiter,
+    backoff_delay,
+    shard_share,
+)
+from LLM4Intent.tools.jsonrpc import batch_request_from_jsonrpc
 
-def get_contract_creation_from_etherscan(contract_address: str) -> dict:
-    url = "https://api.etherscan.io/v2/api?chainid=1&module=contract&action=getcontractcreation&contractaddresses={contract_address}&apikey={API_KEY}".format(
-        contract_address=contract_address, API_KEY=os.environ["ETHERSCAN_API_KEY"]
-    )
-    while True:
+ETHERSCAN_API_URL = "https://api.etherscan.io/v2/api"
+
+# verified source, ABIs and creation info never change for a given code, they are
+# cached for good under the code hash of the address
+etherscan_cache = get_disk_cache(
+    "etherscan", max_bytes=int(os.getenv("ETHERSCAN_CACHE_MAX_BYTES", 1 << 30))
+)
+# how long an unverified contract is not asked again, it may get verified later
+UNVERIFIED_TTL = 6 * 3600
+# how long the source of a proxy is kept, its code hash stays the same when it
+# is upgraded but the Implementation of the answer changes
+PROXY_SOURCE_TTL = 3600
+# getcontractcreation accepts at most this many addresses per request
+CREATION_BATCH_SIZE = 5
+# how long a creation lookup waits for others to share its request
+CREATION_BATCH_WINDOW = 0.05
+
+# answers meaning the contract has no verified source or no creation, as opposed
+# to transient errors like rate limits which must not be cached
+_NOT_FOUND_RESULTS = ("Contract source code not verified", "No data found")
+
+# calls per second of each API plan, https://docs.etherscan.io/resources/rate-limits
+ETHERSCAN_TIER_RATES = {
+    "free": 5,
+    "standard": 10,
+    "advanced": 20,
+    "professional": 30,
+    "pro_plus": 30,
+}
+# attempts of a request before giving up with an EtherscanError
+ETHERSCAN_MAX_ATTEMPTS = int(os.getenv("ETHERSCAN_MAX_ATTEMPTS", "5"))
+# (connect, read) timeouts in seconds
+ETHERSCAN_TIMEOUT = (5, 30)
+# how long a request may queue for a token before giving up
+ETHERSCAN_QUEUE_TIMEOUT = 120
+
+_code_hashes: Dict[str, str] = {}
+_code_hashes_lock = threading.Lock()
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+class EtherscanError(Exception):
+    """An Etherscan request failed for good, after its retries"""
+
+
+def get_etherscan_limiter() -> RateLimiter:
+    """The process-wide limiter, its share of the quota of the API key
+
+    ETHERSCAN_RATE_LIMIT (calls per second) overrides the rate of the
+    ETHERSCAN_API_TIER plan. Created on first use, as sharded workers learn
+    the shard count after importing this module.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            tier = os.getenv("ETHERSCAN_API_TIER", "free").lower()
+            rate = float(
+                os.getenv("ETHERSCAN_RATE_LIMIT", ETHERSCAN_TIER_RATES.get(tier, 5))
+            )
+            _limiter = RateLimiter(shard_share(rate))
+        return _limiter
+
+
+def _is_rate_limited(result: dict) -> bool:
+    # Etherscan answers "Max calls per sec rate limit reached (5/sec)" with a 200
+    return str(result.get("status")) == "0" and "rate limit" in str(
+        result.get("result", "")
+    ).lower()
+
+
+def _etherscan_request(params: dict, priority: int = Priority.NORMAL) -> dict:
+    """Send a GET to the Etherscan v2 API on mainnet within the rate limit
+
+    Rate limit answers pause the shared limiter and network errors back off,
+    both with jitter, for at most ETHERSCAN_MAX_ATTEMPTS attempts.
+
+    Raises:
+        EtherscanError: when the attempts or the wait for the limiter ran out
+    """
+    params = {"chainid": 1, **params, "apikey": os.environ["ETHERSCAN_API_KEY"]}
+    limiter = get_etherscan_limiter()
+    error = None
+    for attempt in range(ETHERSCAN_MAX_ATTEMPTS):
+        if not limiter.acquire(priority, timeout=ETHERSCAN_QUEUE_TIMEOUT):
+            raise EtherscanError("Etherscan rate limit queue timed out")
         try:
-            response = requests.get(url)
+            response = requests.get(
+                ETHERSCAN_API_URL, params=params, timeout=ETHERSCAN_TIMEOUT
+            )
+            if response.status_code == 429:
+                retry_after = response.headers.get("Retry-After", "")
+                limiter.pause(
+                    float(retry_after)
+                    if retry_after.isdigit()
+                    else backoff_delay(attempt)
+                )
+                error = "HTTP 429 Too Many Requests"
+                continue
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(e)
-            time.sleep(10)
+            result = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            error = str(e)
+            time.sleep(backoff_delay(attempt))
             continue
+        if _is_rate_limited(result):
+            limiter.pause(backoff_delay(attempt))
+            error = result["result"]
+            continue
+        return result
+    raise EtherscanError(
+        f"Etherscan {params.get('action')} failed after "
+        f"{ETHERSCAN_MAX_ATTEMPTS} attempts: {error}"
+    )
+
+
+def get_code_hashes(addresses: Sequence[str]) -> Dict[str, str]:
+    """The keccak of the current code of many addresses, unknown ones in one batch
+
+    A code hash only changes when a contract is destroyed and redeployed at the
+    same address, so it is remembered for the lifetime of the process.
+    """
+    addresses = [address.lower() for address in addresses]
+    with _code_hashes_lock:
+        hashes = {a: _code_hashes[a] for a in addresses if a in _code_hashes}
+    missing = [a for a in dict.fromkeys(addresses) if a not in hashes]
+    if missing:
+        codes = batch_request_from_jsonrpc(
+            [("eth_getCode", [address, "latest"]) for address in missing]
+        )
+        fetched = {
+            address: Web3.keccak(hexstr=code).hex()
+            for address, code in zip(missing, codes)
+        }
+        with _code_hashes_lock:
+            _code_hashes.update(fetched)
+        hashes.update(fetched)
+    return hashes
+
 
+def _cache_key(action: str, address: str, code_hash: str) -> str:
+    return f"{action}:{address.lower()}:{code_hash}"
 
-def get_verified_contract_source_code_from_etherscan(contract_address: str) -> dict:
-    url = "https://api.etherscan.io/v2/api?chainid=1&module=contract&action=getsourcecode&address={contract_address}&apikey={API_KEY}".format(
-        contract_address=contract_address, API_KEY=os.environ["ETHERSCAN_API_KEY"]
+
+def _is_proxy_source(response: dict) -> bool:
+    result = response.get("result")
+    return (
+        isinstance(result, list)
+        and bool(result)
+        and isinstance(result[0], dict)
+        and str(result[0].get("Proxy")) == "1"
     )
-    while True:
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(e)
-            time.sleep(10)
-            continue
 
 
-def get_verified_contract_abi_from_etherscan(contract_address: str) -> dict:
-    url = "https://api.etherscan.io/v2/api?chainid=1&module=contract&action=getabi&address={contract_address}&apikey={API_KEY}".format(
-        contract_address=contract_address, API_KEY=os.environ["ETHERSCAN_API_KEY"]
+def _cache_response(key: str, response: dict, verified: bool) -> None:
+    if verified and _is_proxy_source(response):
+        etherscan_cache.set(key, response, ttl=PROXY_SOURCE_TTL)
+    elif verified:
+        etherscan_cache.set(key, response)
+    elif (
+        str(response.get("status")) == "1"
+        or response.get("result") in _NOT_FOUND_RESULTS
+    ):
+        etherscan_cache.set(key, response, ttl=UNVERIFIED_TTL)
+
+
+def _cached_contract_request(
+    action: str,
+    contract_address: str,
+    is_verified: Callable[[dict], bool],
+    priority: int,
+) -> dict:
+    code_hash = get_code_hashes([contract_address])[contract_address.lower()]
+    key = _cache_key(action, contract_address, code_hash)
+    response = etherscan_cache.get(key)
+    if response is None:
+        response = _etherscan_request(
+            {"module": "contract", "action": action, "address": contract_address},
+            priority,
+        )
+        _cache_response(key, response, is_verified(response))
+    return response
+
+
+def _is_verified_source(response: dict) -> bool:
+    result = response.get("result")
+    return (
+        str(response.get("status")) == "1"
+        and isinstance(result, list)
+        and bool(result)
+        and bool(result[0].get("SourceCode"))
+    )
+
+
+def _fetch_contract_creations(
+    addresses: List[str], priority: int = Priority.NORMAL
+) -> Dict[str, dict]:
+    # one request for up to CREATION_BATCH_SIZE addresses, split per address
+    response = _etherscan_request(
+        {
+            "module": "contract",
+            "action": "getcontractcreation",
+            "contractaddresses": ",".join(addresses),
+        },
+        priority,
     )
-    while True:
+    if str(response.get("status")) != "1":
+        return {address: response for address in addresses}
+    entries = {entry["contractAddress"].lower(): entry for entry in response["result"]}
+    return {
+        address: (
+            {**response, "result": [entries[address]]}
+            if address in entries
+            else {**response, "status": "0", "result": "No data found"}
+        )
+        for address in addresses
+    }
+
+
+class CreationBatcher:
+    """Coalesces concurrent contract creation lookups into shared requests
+
+    A lookup waits up to `window` seconds for others, the pending addresses are
+    sent together as soon as `batch_size` of them are queued or the window ends.
+    Lookups of an address already pending share its request.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[List[str]], Dict[str, dict]],
+        batch_size: int = CREATION_BATCH_SIZE,
+        window: float = CREATION_BATCH_WINDOW,
+    ):
+        self.fetch = fetch
+        self.batch_size = batch_size
+        self.window = window
+        self._pending: Dict[str, Future] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def get(self, address: str) -> dict:
+        address = address.lower()
+        batch = None
+        with self._lock:
+            future = self._pending.get(address)
+            if future is None:
+                future = self._pending[address] = Future()
+                if len(self._pending) >= self.batch_size:
+                    batch = self._take()
+                elif self._timer is None:
+                    self._timer = threading.Timer(self.window, self._flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if batch:
+            self._send(batch)
+        return future.result()
+
+    def _take(self) -> Dict[str, Future]:
+        batch, self._pending = self._pending, {}
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush(self):
+        with self._lock:
+            batch = self._take()
+        items = list(batch.items())
+        for start in range(0, len(items), self.batch_size):
+            self._send(dict(items[start : start + self.batch_size]))
+
+    def _send(self, batch: Dict[str, Future]):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            result =  response.json()
-            if int(result["status"]):
-                return result["result"]
-            else:
-                return None
-        except requests.exceptions.RequestException as e:
-            print(e)
-            time.sleep(10)
-            continue
+            results = self.fetch(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+            return
+        for address, future in batch.items():
+            future.set_result(results[address])
+
+
+creation_batcher = CreationBatcher(_fetch_contract_creations)
+
+
+def get_contracts_creation_from_etherscan(
+    contract_addresses: Sequence[str], priority: int = Priority.NORMAL
+) -> Dict[str, dict]:
+    """
+    Get the creation info of many contracts, CREATION_BATCH_SIZE per request
+
+    Returns:
+        Dict[str, dict]: The getcontractcreation response of each address,
+            holding only its entry
+    """
+    code_hashes = get_code_hashes(contract_addresses)
+    results = {}
+    missing = []
+    for address in dict.fromkeys(a.lower() for a in contract_addresses):
+        cached = etherscan_cache.get(
+            _cache_key("getcontractcreation", address, code_hashes[address])
+        )
+        if cached is None:
+            missing.append(address)
+        else:
+            results[address] = cached
+
+    for start in range(0, len(missing), CREATION_BATCH_SIZE):
+        batch = missing[start : start + CREATION_BATCH_SIZE]
+        fetched = _fetch_contract_creations(batch, priority)
+        for address, response in fetched.items():
+            _cache_response(
+                _cache_key("getcontractcreation", address, code_hashes[address]),
+                response,
+                str(response.get("status")) == "1",
+            )
+        results.update(fetched)
+
+    return {address: results[address.lower()] for address in contract_addresses}
+
+
+def get_contract_creation_from_etherscan(contract_address: str) -> dict:
+    code_hash = get_code_hashes([contract_address])[contract_address.lower()]
+    key = _cache_key("getcontractcreation", contract_address, code_hash)
+    response = etherscan_cache.get(key)
+    if response is None:
+        # concurrent lookups, e.g. of several perspectives, share one request
+        response = creation_batcher.get(contract_address)
+        _cache_response(key, response, str(response.get("status")) == "1")
+    return response
+
+
+def get_verified_contract_source_code_from_etherscan(
+    contract_address: str, priority: int = Priority.NORMAL
+) -> dict:
+    return _cached_contract_request(
+        "getsourcecode", contract_address, _is_verified_source, priority
+    )
+
+
+def get_verified_contract_abi_from_etherscan(
+    contract_address: str, priority: int = Priority.NORMAL
+) -> dict:
+    result = _cached_contract_request(
+        "getabi",
+        contract_address,
+        lambda response: str(response.get("status")) == "1",
+        priority,
+    )
+    if int(result["status"]):
+        return result["result"]
+    else:
+        return None
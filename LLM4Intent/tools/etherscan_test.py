@@ -1,4 +1,13 @@
-from LLM4Intent.tools.etherscan import get_verified_contract_abi_from_etherscan
+import threading
+
+import pytest
+
+from LLM4Intent.tools import etherscan
+from LLM4Intent.tools.etherscan import (
+    CreationBatcher,
+    EtherscanError,
+    get_verified_contract_abi_from_etherscan,
+)
 
 
 def test_get_verified_contract_abi_from_etherscan():
@@ -7,4 +16,71 @@ def test_get_verified_contract_abi_from_etherscan():
     print("abi_result", abi_result)
 
     abi_result = get_verified_contract_abi_from_etherscan("0x06012c8cf97bead5deae237070f9587f8e7a266d") # CryptoKitties
-    print("abi_result", abi_result)
\ No newline at end of file
+    print("abi_result", abi_result)
+
+
+def test_CreationBatcher_coalesces_lookups():
+    requests = []
+
+    def fetch(addresses):
+        requests.append(addresses)
+        return {address: {"address": address} for address in addresses}
+
+    batcher = CreationBatcher(fetch, batch_size=5, window=0.2)
+    addresses = ["0x{:040x}".format(i) for i in range(7)]
+    results = {}
+
+    def lookup(address):
+        results[address] = batcher.get(address)
+
+    threads = [threading.Thread(target=lookup, args=(a,)) for a in addresses]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(len(batch) for batch in requests) == [2, 5]
+    assert all(results[address]["address"] == address for address in addresses)
+
+
+
+def test_etherscan_request_retries_rate_limits(monkeypatch, http_response):
+    monkeypatch.setenv("ETHERSCAN_API_KEY", "key")
+    monkeypatch.setattr(etherscan, "backoff_delay", lambda attempt: 0)
+    too_many = http_response(status_code=429, headers={"Retry-After": "0"})
+    responses = [
+        too_many,
+        http_response({"status": "0", "result": "Max calls per sec rate limit"}),
+        http_response({"status": "1", "result": "ok"}),
+    ]
+    monkeypatch.setattr(
+        etherscan.requests, "get", lambda *args, **kwargs: responses.pop(0)
+    )
+    assert etherscan._etherscan_request({"action": "getabi"})["result"] == "ok"
+
+    monkeypatch.setattr(etherscan.requests, "get", lambda *args, **kwargs: too_many)
+    with pytest.raises(EtherscanError):
+        etherscan._etherscan_request({"action": "getabi"})
+
+
+class _TTLRecorder:
+    def __init__(self):
+        self.ttls = {}
+
+    def set(self, key, value, ttl=None):
+        self.ttls[key] = ttl
+
+
+def test_proxy_sources_expire(monkeypatch):
+    cache = _TTLRecorder()
+    monkeypatch.setattr(etherscan, "etherscan_cache", cache)
+
+    def source(proxy):
+        return {
+            "status": "1",
+            "result": [{"SourceCode": "contract A {}", "Proxy": proxy}],
+        }
+
+    etherscan._cache_response("plain", source("0"), verified=True)
+    etherscan._cache_response("proxy", source("1"), verified=True)
+    assert cache.ttls == {"plain": None, "proxy": etherscan.PROXY_SOURCE_TTL}
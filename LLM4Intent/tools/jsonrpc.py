@@ -1,64 +1,707 @@
-from datetime import datetime
+from datetime import datetime, timezone
+import os
+import concurrent.futures
+import heapq
 import string
-from typing import Any, Dict, List, TypedDict, Optional
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Sequence,
+    Tuple,
+    TypedDict,
+    Optional,
+)
+import aiohttp
+from eth_abi import decode
 import requests
 import json
-from web3 import Web3, HTTPProvider
+import collections
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3, HTTPProvider
 from web3.types import (
     TxData,
-    TxReceipt,
     FilterTrace,
     LogReceipt,
-    TxParams,
-    BlockIdentifier,
+    RPCEndpoint,
+    RPCResponse,
+)
+
+from web3._utils.method_formatters import PYTHONIC_RESULT_FORMATTERS
+
+from LLM4Intent.common.disk_cache import CACHE_DIR, get_disk_cache
+from LLM4Intent.common.utils import get_logger
+from LLM4Intent.tools.block_time import BlockTimestamps
+from LLM4Intent.tools.multicall import (
+    AGGREGATE3_CHUNK_SIZE,
+    BALANCE_OF_SELECTOR,
+    GET_ETH_BALANCE_SELECTOR,
+    MULTICALL3_ADDRESS,
+    Call,
+    CallResult,
+    decode_aggregate3,
+    encode_address_argument,
+    encode_aggregate3,
+    is_multicall3_available,
+    selector,
 )
 
 w3 = Web3(HTTPProvider("http://172.28.1.2:8545"))
 # w3 = Web3(HTTPProvider("https://rpc.ankr.com/eth"))
+async_w3 = AsyncWeb3(AsyncHTTPProvider(w3.provider.endpoint_uri))
 
+logger = get_logger("JSONRPC")
 
-# 用于安全地调用智能合约并转换返回值
-def _try_w3_call_fetch_str(
-    transaction: TxParams,
-    block_identifier: Optional[BlockIdentifier] = None,
-) -> str:
-    try:
-        utf8 = w3.eth.call(transaction=transaction, block_identifier=block_identifier)
-        return "".join(
-            filter(lambda x: x in string.printable, Web3.to_text(utf8))
-        ).strip()
-    except Exception as e:
-        print("failed to fetch str", e)
-        return None
 
+####################### FINALITY-AWARE CACHE #######################
 
-def _try_w3_call_fetch_int(
-    transaction: TxParams,
-    block_identifier: Optional[BlockIdentifier] = None,
-) -> int:
+# Data at or below the finalized block never changes, so it is cached on disk
+# (shared by all processes) keyed by method and params.
+rpc_cache = get_disk_cache(
+    "jsonrpc", max_bytes=int(os.getenv("JSONRPC_CACHE_MAX_BYTES", 4 << 30))
+)
+
+# index of the block parameter of the methods answering at an explicit block
+_BLOCK_PARAM_INDEX = {
+    "eth_getBalance": 1,
+    "eth_getCode": 1,
+    "eth_getStorageAt": 2,
+    "eth_getTransactionCount": 1,
+    "eth_call": 1,
+    "eth_getBlockByNumber": 0,
+    "eth_getBlockReceipts": 0,
+    "trace_block": 0,
+}
+
+# methods filtering a fromBlock/toBlock range, final once toBlock is finalized
+_RANGE_METHODS = {"eth_getLogs", "trace_filter"}
+# methods addressed by a hash, their result tells which block they belong to
+_HASH_METHODS = {
+    "eth_getTransactionByHash",
+    "eth_getTransactionReceipt",
+    "eth_getBlockByHash",
+    "trace_transaction",
+}
+
+FINALIZED_BLOCK_TTL = 60
+_finalized = {"number": -1, "fetched_at": 0.0}
+_finalized_lock = threading.Lock()
+
+
+def _to_block_number(value: Any) -> Optional[int]:
+    """Block number of an explicit block parameter, None for tags like 'latest'"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.startswith("0x"):
+        return int(value, 16)
+    return None
+
+
+def _result_block_number(result: Any) -> Optional[int]:
+    # trace_transaction returns a list of traces of the same block
+    if isinstance(result, list):
+        return _result_block_number(result[0]) if result else None
+    if isinstance(result, dict):
+        return _to_block_number(result.get("blockNumber") or result.get("number"))
+    return None
+
+
+def _is_finalized_block_number_fresh() -> bool:
+    return time.monotonic() - _finalized["fetched_at"] < FINALIZED_BLOCK_TTL
+
+
+def _update_finalized_block_number(finalized_block: Any, latest_block_number: Any):
+    if finalized_block:
+        number = int(finalized_block["number"], 16)
+    else:
+        # nodes without the "finalized" tag, assume 64 blocks (2 epochs) of reorg depth
+        number = int(latest_block_number, 16) - 64
+    _finalized.update(number=number, fetched_at=time.monotonic())
+    return number
+
+
+def _fetch_finalized_block_number(make_request: Callable) -> int:
+    with _finalized_lock:
+        if _is_finalized_block_number_fresh():
+            return _finalized["number"]
+
+        response = make_request(RPCEndpoint("eth_getBlockByNumber"), ["finalized", False])
+        if response.get("result"):
+            return _update_finalized_block_number(response["result"], None)
+        response = make_request(RPCEndpoint("eth_blockNumber"), [])
+        return _update_finalized_block_number(None, response["result"])
+
+
+async def _afetch_finalized_block_number(make_request: Callable) -> int:
+    if _is_finalized_block_number_fresh():
+        return _finalized["number"]
+
+    response = await make_request(
+        RPCEndpoint("eth_getBlockByNumber"), ["finalized", False]
+    )
+    if response.get("result"):
+        return _update_finalized_block_number(response["result"], None)
+    response = await make_request(RPCEndpoint("eth_blockNumber"), [])
+    return _update_finalized_block_number(None, response["result"])
+
+
+def get_finalized_block_number_from_jsonrpc() -> int:
+    """The latest finalized block number, refreshed at most every FINALIZED_BLOCK_TTL seconds"""
+    return _fetch_finalized_block_number(w3.provider.make_request)
+
+
+def rpc_cache_key(method: str, params: Any) -> str:
+    return "{}:{}".format(method, json.dumps(params, sort_keys=True, default=str))
+
+
+def is_rpc_request_cacheable(method: str, params: Any) -> bool:
+    """Whether the response may be cached, final check on the result is `is_rpc_result_final`"""
+    if method in _HASH_METHODS:
+        return True
+    if method in _RANGE_METHODS:
+        log_filter = params[0] if params else {}
+        return (
+            "blockHash" in log_filter
+            or _to_block_number(log_filter.get("toBlock")) is not None
+        )
+    index = _BLOCK_PARAM_INDEX.get(method)
+    return (
+        index is not None
+        and len(params) > index
+        and _to_block_number(params[index]) is not None
+    )
+
+
+def is_rpc_result_final(
+    method: str, params: Any, result: Any, finalized_block_number: int
+) -> bool:
+    """Whether a result can no longer change, i.e. it is at or below the finalized block"""
+    if result is None:
+        return False
+    if method in _HASH_METHODS:
+        block_number = _result_block_number(result)
+    elif method in _RANGE_METHODS:
+        log_filter = params[0]
+        if "blockHash" in log_filter:
+            # logs of a reorged block are simply never returned again
+            block_number = _result_block_number(result)
+            if block_number is None:
+                return False
+        else:
+            block_number = _to_block_number(log_filter.get("toBlock"))
+    else:
+        block_number = _to_block_number(params[_BLOCK_PARAM_INDEX[method]])
+
+    return block_number is not None and block_number <= finalized_block_number
+
+
+def rpc_cache_middleware(make_request: Callable, w3: Web3) -> Callable:
+    """web3 middleware answering finalized historical requests from `rpc_cache`"""
+
+    def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        if not is_rpc_request_cacheable(method, params):
+            return make_request(method, params)
+
+        key = rpc_cache_key(method, params)
+        cached = rpc_cache.get(key)
+        if cached is not None:
+            return {"jsonrpc": "2.0", "id": 0, "result": cached}
+
+        response = make_request(method, params)
+        result = response.get("result")
+        if "error" not in response and is_rpc_result_final(
+            method, params, result, _fetch_finalized_block_number(make_request)
+        ):
+            rpc_cache.set(key, result)
+
+        return response
+
+    return middleware
+
+
+async def async_rpc_cache_middleware(make_request: Callable, w3: AsyncWeb3) -> Callable:
+    """Async variant of `rpc_cache_middleware`, sharing the same disk cache"""
+
+    async def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        if not is_rpc_request_cacheable(method, params):
+            return await make_request(method, params)
+
+        key = rpc_cache_key(method, params)
+        cached = rpc_cache.get(key)
+        if cached is not None:
+            return {"jsonrpc": "2.0", "id": 0, "result": cached}
+
+        response = await make_request(method, params)
+        result = response.get("result")
+        if "error" not in response and is_rpc_result_final(
+            method, params, result, await _afetch_finalized_block_number(make_request)
+        ):
+            rpc_cache.set(key, result)
+
+        return response
+
+    return middleware
+
+
+# innermost layer, so the cache sees the raw JSON-RPC results
+w3.middleware_onion.inject(rpc_cache_middleware, name="rpc_cache", layer=0)
+async_w3.middleware_onion.inject(async_rpc_cache_middleware, name="rpc_cache", layer=0)
+
+
+####################### BATCH REQUESTS #######################
+
+# (method, params) of one JSON-RPC call
+RPCCall = Tuple[str, list]
+
+_batch_session = requests.Session()
+
+# calls per batch request, nodes reject larger batches (Erigon allows 100 by
+# default, geth 1000)
+JSONRPC_BATCH_SIZE = int(os.getenv("JSONRPC_BATCH_SIZE", "100"))
+
+
+class RPCBatchError(Exception):
+    pass
+
+
+def format_rpc_result(method: str, result: Any) -> Any:
+    """Format a raw JSON-RPC result the way the matching `w3.eth` method would, as JSON"""
+    formatter = PYTHONIC_RESULT_FORMATTERS.get(method)
+    if formatter is None or result is None:
+        return result
+    return json.loads(Web3.to_json(formatter(result)))
+
+
+def _cached_batch_results(calls: Sequence[RPCCall]) -> Tuple[list, List[int]]:
+    results = [None] * len(calls)
+    pending = []
+    for i, (method, params) in enumerate(calls):
+        if is_rpc_request_cacheable(method, params):
+            cached = rpc_cache.get(rpc_cache_key(method, params))
+            if cached is not None:
+                results[i] = cached
+                continue
+        pending.append(i)
+    return results, pending
+
+
+def _batch_payloads(calls: Sequence[RPCCall], pending: List[int]) -> List[list]:
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": calls[i][0], "params": calls[i][1]}
+        for i in pending
+    ]
+    return [
+        payload[start : start + JSONRPC_BATCH_SIZE]
+        for start in range(0, len(payload), JSONRPC_BATCH_SIZE)
+    ]
+
+
+def _batch_responses(responses: Any) -> list:
+    if isinstance(responses, dict):  # the whole batch was rejected
+        raise RPCBatchError(responses.get("error", responses))
+    return responses
+
+
+def _collect_batch_results(
+    calls: Sequence[RPCCall],
+    pending: List[int],
+    results: list,
+    responses: list,
+    finalized_block_number: Callable[[], int],
+    raise_on_error: bool,
+) -> list:
+    responses_by_id = {response.get("id"): response for response in responses}
+    for i in pending:
+        method, params = calls[i]
+        response = responses_by_id.get(i, {"error": "missing from batch response"})
+        if "error" in response:
+            if raise_on_error:
+                raise RPCBatchError(f"{method} {params} failed: {response['error']}")
+            continue
+
+        result = response.get("result")
+        results[i] = result
+        if is_rpc_request_cacheable(method, params) and is_rpc_result_final(
+            method, params, result, finalized_block_number()
+        ):
+            rpc_cache.set(rpc_cache_key(method, params), result)
+
+    return results
+
+
+def batch_request_from_jsonrpc(
+    calls: Sequence[RPCCall], raise_on_error: bool = True, cached: bool = True
+) -> list:
+    """
+    Send many JSON-RPC calls in batch round trips of at most JSONRPC_BATCH_SIZE calls,
+    finalized results come from the cache
+
+    Args:
+        calls (Sequence[RPCCall]): (method, params) pairs, params already JSON-RPC encoded
+        raise_on_error (bool): raise RPCBatchError on a failed call, otherwise its result is None
+        cached (bool): whether to read and fill the cache, off for data read only
+            once such as bulk ingestion, which would evict everything else
+
+    Returns:
+        list: the raw JSON-RPC results, in the order of the calls
+    """
+    if cached:
+        results, pending = _cached_batch_results(calls)
+    else:
+        results, pending = [None] * len(calls), list(range(len(calls)))
+    if not pending:
+        return results
+
+    responses = []
+    for payload in _batch_payloads(calls, pending):
+        response = _batch_session.post(
+            w3.provider.endpoint_uri, json=payload, timeout=120
+        )
+        response.raise_for_status()
+        responses.extend(_batch_responses(response.json()))
+
+    return _collect_batch_results(
+        calls,
+        pending,
+        results,
+        responses,
+        # with no finalized block (-1) no result is final, so none is cached
+        lambda: (
+            _fetch_finalized_block_number(w3.provider.make_request) if cached else -1
+        ),
+        raise_on_error,
+    )
+
+
+async def abatch_request_from_jsonrpc(
+    calls: Sequence[RPCCall], raise_on_error: bool = True
+) -> list:
+    """Async variant of `batch_request_from_jsonrpc`"""
+    results, pending = _cached_batch_results(calls)
+    if not pending:
+        return results
+
+    responses = []
+    async with aiohttp.ClientSession() as session:
+        for payload in _batch_payloads(calls, pending):
+            async with session.post(
+                async_w3.provider.endpoint_uri,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=120),
+            ) as response:
+                response.raise_for_status()
+                responses.extend(
+                    _batch_responses(await response.json(content_type=None))
+                )
+
+    finalized_block_number = await _afetch_finalized_block_number(
+        async_w3.provider.make_request
+    )
+    return _collect_batch_results(
+        calls,
+        pending,
+        results,
+        responses,
+        lambda: finalized_block_number,
+        raise_on_error,
+    )
+
+
+def _multicall_rpc_calls(calls: Sequence[Call], block_number: int) -> List[RPCCall]:
+    block = hex(block_number)
+    if not is_multicall3_available(block_number):
+        return [
+            ("eth_call", [{"to": target, "data": Web3.to_hex(data)}, block])
+            for target, data in calls
+        ]
+    return [
+        (
+            "eth_call",
+            [
+                {
+                    "to": MULTICALL3_ADDRESS,
+                    "data": encode_aggregate3(calls[i : i + AGGREGATE3_CHUNK_SIZE]),
+                },
+                block,
+            ],
+        )
+        for i in range(0, len(calls), AGGREGATE3_CHUNK_SIZE)
+    ]
+
+
+def _multicall_results(
+    calls: Sequence[Call], block_number: int, raw_results: list
+) -> List[CallResult]:
+    if not is_multicall3_available(block_number):
+        return [
+            (result is not None, Web3.to_bytes(hexstr=result) if result else b"")
+            for result in raw_results
+        ]
+    results = []
+    for i, raw in zip(range(0, len(calls), AGGREGATE3_CHUNK_SIZE), raw_results):
+        chunk_size = len(calls[i : i + AGGREGATE3_CHUNK_SIZE])
+        results.extend(
+            decode_aggregate3(raw) if raw is not None else [(False, b"")] * chunk_size
+        )
+    return results
+
+
+def multicall_from_jsonrpc(calls: Sequence[Call], block_number: int) -> List[CallResult]:
+    """
+    Run many view calls at a block in one round trip, each call may fail on its own
+
+    Uses Multicall3 `aggregate3` when it is deployed at the block, otherwise a
+    batch of plain `eth_call`s.
+
+    Args:
+        calls (Sequence[Call]): (target, calldata) pairs
+        block_number (int): block number
+
+    Returns:
+        List[CallResult]: (success, returned data) in the order of the calls
+    """
+    raw_results = batch_request_from_jsonrpc(
+        _multicall_rpc_calls(calls, block_number), raise_on_error=False
+    )
+    return _multicall_results(calls, block_number, raw_results)
+
+
+####################### LOGS #######################
+
+# blocks per eth_getLogs request to start with, adapted to the log density
+LOGS_CHUNK_SIZE = int(os.getenv("JSONRPC_LOGS_CHUNK_SIZE", "2000"))
+LOGS_MAX_CHUNK_SIZE = 100_000
+# eth_getLogs requests in flight, the ordered output waits for the oldest one
+LOGS_MAX_WORKERS = int(os.getenv("JSONRPC_LOGS_MAX_WORKERS", "8"))
+
+# fragments of the errors nodes return when a range holds too many logs
+# (geth, erigon, alchemy, infura, quicknode, ...) or is too wide
+_TOO_MANY_LOGS_ERRORS = (
+    "query returned more than",
+    "response size exceeded",
+    "too many",
+    "block range",
+    "range is too",
+    "is limited to",
+    "timeout",
+    "timed out",
+)
+
+# shared by the log fetcher and the address scanner
+_rpc_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=LOGS_MAX_WORKERS, thread_name_prefix="jsonrpc"
+)
+
+
+class TooManyLogsError(Exception):
+    pass
+
+
+TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)").hex()
+TRANSFER_SINGLE_TOPIC = Web3.keccak(
+    text="TransferSingle(address,address,address,uint256,uint256)"
+).hex()
+TRANSFER_BATCH_TOPIC = Web3.keccak(
+    text="TransferBatch(address,address,address,uint256[],uint256[])"
+).hex()
+
+
+def _address_topic(address: str) -> str:
+    return "0x" + "0" * 24 + Web3.to_checksum_address(address)[2:].lower()
+
+
+def _is_too_many_logs_error(error: Any) -> bool:
+    message = str(error).lower()
+    return any(fragment in message for fragment in _TOO_MANY_LOGS_ERRORS)
+
+
+def _get_logs_chunk(log_filter: dict, from_block: int, to_block: int) -> list:
+    # through the middlewares, so chunks below the finalized block are cached
     try:
-        raw_bigint = w3.eth.call(
-            transaction=transaction, block_identifier=block_identifier
+        result = w3.manager.request_blocking(
+            RPCEndpoint("eth_getLogs"),
+            [{**log_filter, "fromBlock": hex(from_block), "toBlock": hex(to_block)}],
         )
-        return Web3.to_int(raw_bigint)
-    except Exception as e:
-        print("failed to fetch int", e)
-        return None
+    except requests.exceptions.Timeout as e:
+        raise TooManyLogsError(e)
+    except ValueError as e:
+        if _is_too_many_logs_error(e):
+            raise TooManyLogsError(e)
+        raise
+    return format_rpc_result("eth_getLogs", json.loads(Web3.to_json(result)))
 
 
-def _try_w3_call_fetch_address(
-    transaction: TxParams,
-    block_identifier: Optional[BlockIdentifier] = None,
-) -> str:
+class _ChunkSize:
+    """The block span of the next chunks, halved on "too many results" and grown after successes"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+
+    def shrink(self, size: int):
+        with self._lock:
+            self.size = max(1, min(self.size, size // 2))
+
+    def grow(self):
+        with self._lock:
+            self.size = min(LOGS_MAX_CHUNK_SIZE, self.size * 2)
+
+
+def _get_logs_bisecting(
+    log_filter: dict, from_block: int, to_block: int, chunk_size: _ChunkSize
+) -> list:
     try:
-        raw_address = w3.eth.call(
-            transaction=transaction, block_identifier=block_identifier
+        logs = _get_logs_chunk(log_filter, from_block, to_block)
+    except TooManyLogsError:
+        if from_block == to_block:
+            raise
+        chunk_size.shrink(to_block - from_block + 1)
+        middle = (from_block + to_block) // 2
+        return _get_logs_bisecting(
+            log_filter, from_block, middle, chunk_size
+        ) + _get_logs_bisecting(log_filter, middle + 1, to_block, chunk_size)
+
+    chunk_size.grow()
+    return logs
+
+
+def iter_logs_from_jsonrpc(
+    log_filter: dict,
+    from_block_number: int,
+    to_block_number: int,
+    max_workers: int = LOGS_MAX_WORKERS,
+) -> Iterator[dict]:
+    """
+    Stream the logs of an arbitrarily large block range in order
+
+    The range is fetched in chunks, up to `max_workers` of them concurrently.
+    A chunk the node refuses for holding too many logs is bisected until it
+    fits, and the span of the following chunks adapts to what succeeded, so
+    dense and sparse ranges both take few requests. Only the chunks in flight
+    are held in memory.
+
+    Args:
+        log_filter (dict): the `address`/`topics` of the eth_getLogs filter, JSON-RPC encoded
+        from_block_number (int): the starting block number
+        to_block_number (int): the ending block number, inclusive
+        max_workers (int): the number of chunks fetched concurrently
+
+    Yields:
+        dict: the logs ordered by block number and log index
+    """
+    chunk_size = _ChunkSize(LOGS_CHUNK_SIZE)
+    in_flight = collections.deque()
+    next_block = from_block_number
+
+    while next_block <= to_block_number or in_flight:
+        while next_block <= to_block_number and len(in_flight) < max_workers:
+            chunk_end = min(to_block_number, next_block + chunk_size.size - 1)
+            in_flight.append(
+                _rpc_executor.submit(
+                    _get_logs_bisecting, log_filter, next_block, chunk_end, chunk_size
+                )
+            )
+            next_block = chunk_end + 1
+
+        try:
+            logs = in_flight.popleft().result()
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            raise
+        yield from logs
+
+
+def get_logs_within_block_number_range_from_jsonrpc(
+    log_filter: dict, from_block_number: int, to_block_number: int
+) -> List[dict]:
+    """The logs of `iter_logs_from_jsonrpc` as a list"""
+    return list(iter_logs_from_jsonrpc(log_filter, from_block_number, to_block_number))
+
+
+def _decoded_transfer(log: dict) -> dict:
+    # the same shape as the transfers of the address index
+    return {
+        "address": log["address"],
+        "blockNumber": log["blockNumber"],
+        "transactionHash": log["transactionHash"],
+        "transactionIndex": log["transactionIndex"],
+        "logIndex": log["logIndex"],
+        "decoded": {
+            "from": Web3.to_checksum_address("0x" + log["topics"][1][-40:]),
+            "to": Web3.to_checksum_address("0x" + log["topics"][2][-40:]),
+            "value": int(log["data"], 16) if log["data"] not in ("0x", "") else 0,
+        },
+    }
+
+
+def _decoded_transfers(logs: Iterator[dict]) -> Iterator[dict]:
+    # ERC721 Transfers have the token id as a third indexed topic, skip them
+    return (_decoded_transfer(log) for log in logs if len(log["topics"]) == 3)
+
+
+def get_erc20_transfers_of_address_from_jsonrpc(
+    address: str,
+    from_block_number: int,
+    to_block_number: int,
+    direction: Optional[str] = None,
+) -> List[dict]:
+    """
+    Get the decoded ERC20 transfers sent, received or both by an address, over any range
+
+    Args:
+        address (str): the address
+        from_block_number (int): the starting block number
+        to_block_number (int): the ending block number, inclusive
+        direction (Optional[str]): "from" for the sent transfers, "to" for the
+            received ones, None for both
+
+    Returns:
+        List[dict]: the transfers with their `decoded` from/to/value, in block order
+    """
+    topic = _address_topic(address)
+    filters = []
+    if direction in (None, "from"):
+        filters.append({"topics": [TRANSFER_TOPIC, topic]})
+    if direction in (None, "to"):
+        filters.append({"topics": [TRANSFER_TOPIC, None, topic]})
+
+    streams = [
+        iter_logs_from_jsonrpc(log_filter, from_block_number, to_block_number)
+        for log_filter in filters
+    ]
+    transfers = []
+    previous = None
+    for log in heapq.merge(
+        *streams, key=lambda log: (log["blockNumber"], log["logIndex"])
+    ):
+        # a transfer to oneself matches both filters
+        key = (log["blockNumber"], log["logIndex"])
+        if key != previous and len(log["topics"]) == 3:
+            transfers.append(_decoded_transfer(log))
+        previous = key
+    return transfers
+
+
+def get_erc20_transfers_of_token_from_jsonrpc(
+    token_address: str, from_block_number: int, to_block_number: int
+) -> List[dict]:
+    """The decoded ERC20 transfers of a token contract over any range, in block order"""
+    return list(
+        _decoded_transfers(
+            iter_logs_from_jsonrpc(
+                {
+                    "address": Web3.to_checksum_address(token_address),
+                    "topics": [TRANSFER_TOPIC],
+                },
+                from_block_number,
+                to_block_number,
+            )
         )
-        raw_address = raw_address[-20:]
-        return Web3.to_checksum_address(raw_address)
-    except Exception as e:
-        print("failed to fetch address", e)
-        return None
+    )
 
 
 ####################### TRANSACTION INFO #######################
@@ -91,6 +734,107 @@ def get_transaction_receipt_from_jsonrpc(tx_hash: str) -> dict:
     return json.loads(Web3.to_json(receipt))
 
 
+async def aget_transaction_from_jsonrpc(tx_hash: str) -> dict:
+    """Async variant of `get_transaction_from_jsonrpc`"""
+    return json.loads(Web3.to_json(await async_w3.eth.get_transaction(tx_hash)))
+
+
+async def aget_transaction_receipt_from_jsonrpc(tx_hash: str) -> dict:
+    """Async variant of `get_transaction_receipt_from_jsonrpc`"""
+    receipt = await async_w3.eth.get_transaction_receipt(tx_hash)
+    return json.loads(Web3.to_json(receipt))
+
+
+class TransactionFacts(TypedDict):
+    transaction: dict
+    receipt: dict
+    block_timestamp: int
+    from_address_type: str
+    to_address_type: Optional[str]
+
+
+def _transaction_facts_first_calls(tx_hash: str) -> List[RPCCall]:
+    return [
+        ("eth_getTransactionByHash", [tx_hash]),
+        ("eth_getTransactionReceipt", [tx_hash]),
+    ]
+
+
+def _transaction_facts_second_calls(transaction: dict, receipt: dict) -> List[RPCCall]:
+    block_number = hex(transaction["blockNumber"])
+    # contract creations have no `to`, the created contract takes its place
+    to_address = transaction["to"] or receipt["contractAddress"]
+    return [
+        ("eth_getBlockByNumber", [block_number, False]),
+        ("eth_getCode", [transaction["from"], block_number]),
+        ("eth_getCode", [to_address, block_number]),
+    ]
+
+
+def _address_type_from_code(code: Optional[str]) -> Optional[str]:
+    if code is None:
+        return None
+    return AddressType.EOA if code in ("0x", "") else AddressType.CA
+
+
+def _check_transaction_found(tx_hash: str, first: list):
+    if first[0] is None:
+        raise ValueError(f"Transaction {tx_hash} not found")
+    if first[1] is None:
+        raise ValueError(
+            f"Transaction {tx_hash} is pending, it has no receipt to analyze yet"
+        )
+
+
+def _assemble_transaction_facts(first: list, second: list) -> TransactionFacts:
+    transaction = format_rpc_result("eth_getTransactionByHash", first[0])
+    receipt = format_rpc_result("eth_getTransactionReceipt", first[1])
+    block, from_code, to_code = second
+    return TransactionFacts(
+        transaction=transaction,
+        receipt=receipt,
+        block_timestamp=int(block["timestamp"], 16),
+        from_address_type=_address_type_from_code(from_code),
+        to_address_type=_address_type_from_code(to_code),
+    )
+
+
+def get_transaction_facts_from_jsonrpc(tx_hash: str) -> TransactionFacts:
+    """
+    Get a transaction with its receipt, block timestamp and endpoint address types
+
+    Issues two batched round trips: the transaction and receipt, then the block
+    header and the code of the sender and receiver at that block (their block
+    and addresses are only known from the first).
+
+    Args:
+        tx_hash (str): transaction hash
+
+    Returns:
+        TransactionFacts: transaction, receipt, block timestamp and address types
+    """
+    first = batch_request_from_jsonrpc(_transaction_facts_first_calls(tx_hash))
+    _check_transaction_found(tx_hash, first)
+    transaction = format_rpc_result("eth_getTransactionByHash", first[0])
+    receipt = format_rpc_result("eth_getTransactionReceipt", first[1])
+    second = batch_request_from_jsonrpc(
+        _transaction_facts_second_calls(transaction, receipt)
+    )
+    return _assemble_transaction_facts(first, second)
+
+
+async def aget_transaction_facts_from_jsonrpc(tx_hash: str) -> TransactionFacts:
+    """Async variant of `get_transaction_facts_from_jsonrpc`"""
+    first = await abatch_request_from_jsonrpc(_transaction_facts_first_calls(tx_hash))
+    _check_transaction_found(tx_hash, first)
+    transaction = format_rpc_result("eth_getTransactionByHash", first[0])
+    receipt = format_rpc_result("eth_getTransactionReceipt", first[1])
+    second = await abatch_request_from_jsonrpc(
+        _transaction_facts_second_calls(transaction, receipt)
+    )
+    return _assemble_transaction_facts(first, second)
+
+
 # 交易追踪信息
 def get_transaction_trace_from_jsonrpc(tx_hash: str) -> dict:
     """
@@ -127,13 +871,117 @@ def get_address_eth_balance_at_block_number_from_jsonrpc(
 
 
 # 查询地址交易历史
-@DeprecationWarning
+# full blocks per JSON-RPC batch of the block scan
+SCAN_BLOCKS_PER_BATCH = int(os.getenv("JSONRPC_SCAN_BLOCKS_PER_BATCH", "20"))
+# blocks per trace_filter request
+TRACE_FILTER_CHUNK_SIZE = int(os.getenv("JSONRPC_TRACE_FILTER_CHUNK_SIZE", "10000"))
+
+# whether the node serves trace_filter, None until it was tried
+_trace_filter_supported: Optional[bool] = None
+
+_METHOD_NOT_FOUND_ERRORS = (
+    "-32601",
+    "not found",
+    "does not exist",
+    "not supported",
+    "not available",
+)
+
+
+def _block_ranges(from_block_number: int, to_block_number: int, size: int):
+    return [
+        (start, min(to_block_number, start + size - 1))
+        for start in range(from_block_number, to_block_number + 1, size)
+    ]
+
+
+def _scan_blocks_for_address(address: str, from_block: int, to_block: int) -> list:
+    blocks = batch_request_from_jsonrpc(
+        [
+            ("eth_getBlockByNumber", [hex(block_number), True])
+            for block_number in range(from_block, to_block + 1)
+        ]
+    )
+    # addresses are lowercase in raw JSON-RPC results, one comparison per transaction
+    return [
+        tx
+        for block in blocks
+        if block is not None
+        for tx in block["transactions"]
+        if tx["from"] == address or tx["to"] == address
+    ]
+
+
+def _trace_filter_transaction_hashes(
+    address: str, from_block: int, to_block: int
+) -> list:
+    traces = batch_request_from_jsonrpc(
+        [
+            (
+                "trace_filter",
+                [
+                    {
+                        "fromBlock": hex(from_block),
+                        "toBlock": hex(to_block),
+                        address_field: [address],
+                    }
+                ],
+            )
+            # trace_filter ANDs fromAddress and toAddress, so they are two queries
+            for address_field in ("fromAddress", "toAddress")
+        ]
+    )
+    return [
+        trace["transactionHash"]
+        for trace in traces[0] + traces[1]
+        # only the top-level call of a transaction, not internal calls or rewards
+        if trace.get("transactionHash") and trace.get("traceAddress") == []
+    ]
+
+
+def _get_address_transactions_from_trace_filter(
+    address: str, from_block_number: int, to_block_number: int
+) -> list:
+    tx_hashes = []
+    for chunk_hashes in _rpc_executor.map(
+        lambda block_range: _trace_filter_transaction_hashes(address, *block_range),
+        _block_ranges(from_block_number, to_block_number, TRACE_FILTER_CHUNK_SIZE),
+    ):
+        tx_hashes.extend(chunk_hashes)
+
+    # split into JSONRPC_BATCH_SIZE batches, an active address has thousands
+    txs = batch_request_from_jsonrpc(
+        [
+            ("eth_getTransactionByHash", [tx_hash])
+            for tx_hash in dict.fromkeys(tx_hashes)
+        ]
+    )
+    return sorted(
+        txs, key=lambda tx: (int(tx["blockNumber"], 16), int(tx["transactionIndex"], 16))
+    )
+
+
+def _get_address_transactions_from_blocks(
+    address: str, from_block_number: int, to_block_number: int
+) -> list:
+    txs = []
+    for chunk_txs in _rpc_executor.map(
+        lambda block_range: _scan_blocks_for_address(address, *block_range),
+        _block_ranges(from_block_number, to_block_number, SCAN_BLOCKS_PER_BATCH),
+    ):
+        txs.extend(chunk_txs)
+    return txs
+
+
 def get_address_transactions_within_block_number_range_from_jsonrpc(
     address: str, from_block_number: int, to_block_number: int
 ) -> List[TxData]:
     """
     Get all transactions of an address within a block number range.
 
+    Uses `trace_filter` on nodes that serve it, otherwise scans the full blocks
+    of the range in concurrent JSON-RPC batches.
+
     Args:
         address (str): The Ethereum address to query.
         from_block_number (int): The starting block number.
@@ -143,22 +991,37 @@ def get_address_transactions_within_block_number_range_from_jsonrpc(
         List[TxData]: A list of transactions of the address within the specified block
             number range.
     """
-    address = Web3.to_checksum_address(address)
-    txs = []
-    for block_number in range(from_block_number, to_block_number + 1):
-        for tx_hash in w3.eth.get_block(block_number)["transactions"]:
-            tx = w3.eth.get_transaction(tx_hash)
-            if tx["from"] == address or tx["to"] == address:
-                txs.append(tx)
+    global _trace_filter_supported
+
+    address = Web3.to_checksum_address(address).lower()
+    txs = None
+    if _trace_filter_supported is not False:
+        try:
+            txs = _get_address_transactions_from_trace_filter(
+                address, from_block_number, to_block_number
+            )
+            _trace_filter_supported = True
+        except RPCBatchError as e:
+            message = str(e).lower()
+            if any(fragment in message for fragment in _METHOD_NOT_FOUND_ERRORS):
+                _trace_filter_supported = False
+            else:
+                logger.warning(
+                    f"trace_filter scan of {address} failed, scanning the blocks "
+                    f"{from_block_number}-{to_block_number} instead: {e}"
+                )
+    if txs is None:
+        txs = _get_address_transactions_from_blocks(
+            address, from_block_number, to_block_number
+        )
 
-    return json.loads(Web3.to_json(txs))
+    return [format_rpc_result("eth_getTransactionByHash", tx) for tx in txs]
 
 
 # 查询 ERC20 代币余额和转账历史
-@DeprecationWarning
 def get_address_token_balance_at_block_number_from_jsonrpc(
     address: str, contract_address: str, block_number: int
-) -> int:
+) -> Optional[int]:
     """
     Get the ERC20 token balance of an address at a specific block number.
 
@@ -168,22 +1031,112 @@ def get_address_token_balance_at_block_number_from_jsonrpc(
         block_number (int): The block number to check the balance at.
 
     Returns:
-        int: The ERC20 token balance of the address at the specified block number.
+        int: The ERC20 token balance of the address at the specified block number,
+            None if `balanceOf` failed.
     """
-    address = Web3.to_checksum_address(address)
-    return json.loads(
-        Web3.to_json(
-            w3.eth.call(
-                {
-                    "to": contract_address,
-                    "data": Web3.keccak(text="balanceOf(address)").hex()[:10]
-                    + "0" * 24
-                    + Web3.to_bytes(hexstr=address).hex(),
-                },
-                block_number,
+    return get_balances_at_block_numbers_from_jsonrpc(
+        [(address, contract_address)], [block_number]
+    )[0][0]
+
+
+# the `token` of a holder's ETH balance in get_balances_at_block_numbers_from_jsonrpc
+ETH = "ETH"
+
+
+def _balance_rpc_calls(
+    pairs: Sequence[Tuple[str, str]], block_number: int
+) -> List[RPCCall]:
+    if not is_multicall3_available(block_number):
+        block = hex(block_number)
+        return [
+            (
+                ("eth_getBalance", [holder, block])
+                if token == ETH
+                else (
+                    "eth_call",
+                    [
+                        {
+                            "to": token,
+                            "data": "0x"
+                            + encode_address_argument(BALANCE_OF_SELECTOR, holder).hex(),
+                        },
+                        block,
+                    ],
+                )
             )
+            for holder, token in pairs
+        ]
+    return _multicall_rpc_calls(_balance_calls(pairs), block_number)
+
+
+def _balance_calls(pairs: Sequence[Tuple[str, str]]) -> List[Call]:
+    return [
+        (
+            (MULTICALL3_ADDRESS, encode_address_argument(GET_ETH_BALANCE_SELECTOR, holder))
+            if token == ETH
+            else (token, encode_address_argument(BALANCE_OF_SELECTOR, holder))
         )
-    )
+        for holder, token in pairs
+    ]
+
+
+def _balance_results(
+    pairs: Sequence[Tuple[str, str]], block_number: int, raw_results: list
+) -> List[Optional[int]]:
+    if not is_multicall3_available(block_number):
+        return [
+            int(result, 16) if result not in (None, "0x") else None
+            for result in raw_results
+        ]
+    return [
+        Web3.to_int(data[:32]) if success and len(data) >= 32 else None
+        for success, data in _multicall_results(
+            _balance_calls(pairs), block_number, raw_results
+        )
+    ]
+
+
+def get_balances_at_block_numbers_from_jsonrpc(
+    pairs: Sequence[Tuple[str, str]], block_numbers: Sequence[int]
+) -> List[List[Optional[int]]]:
+    """
+    Get the ETH and ERC20 balances of many (holder, token) pairs at several blocks in one round trip
+
+    Every block is resolved with Multicall3 `getEthBalance`/`balanceOf` calls,
+    all blocks go into the same JSON-RPC batch. Before Multicall3 was deployed
+    the batch holds plain `eth_getBalance`/`eth_call`s instead.
+
+    Args:
+        pairs (Sequence[Tuple[str, str]]): (holder, token) pairs, the token `ETH`
+            stands for the holder's ETH balance
+        block_numbers (Sequence[int]): block numbers, e.g. [block - 1, block]
+
+    Returns:
+        List[List[Optional[int]]]: one row per pair with one balance per block
+            (in wei / the token's smallest unit), None if the balance call failed
+    """
+    pairs = [
+        (
+            Web3.to_checksum_address(holder),
+            token if token == ETH else Web3.to_checksum_address(token),
+        )
+        for holder, token in pairs
+    ]
+
+    rpc_calls = []
+    offsets = []
+    for block_number in block_numbers:
+        block_rpc_calls = _balance_rpc_calls(pairs, block_number)
+        offsets.append((len(rpc_calls), len(rpc_calls) + len(block_rpc_calls)))
+        rpc_calls.extend(block_rpc_calls)
+
+    raw_results = batch_request_from_jsonrpc(rpc_calls, raise_on_error=False)
+
+    columns = [
+        _balance_results(pairs, block_number, raw_results[start:end])
+        for block_number, (start, end) in zip(block_numbers, offsets)
+    ]
+    return [list(row) for row in zip(*columns)]
 
 
 def get_address_token_transfers_within_block_number_range_from_jsonrpc(
@@ -202,20 +1155,10 @@ def get_address_token_transfers_within_block_number_range_from_jsonrpc(
     """
     address = Web3.to_checksum_address(address)
 
-    return json.loads(
-        Web3.to_json(
-            w3.eth.get_logs(
-                {
-                    "fromBlock": from_block_number,
-                    "toBlock": to_block_number,
-                    "topics": [
-                        Web3.keccak(text="Transfer(address,address,uint256)").hex(),
-                        "0x" + "0" * 24 + Web3.to_bytes(hexstr=address).hex(),
-                        # None,
-                    ],
-                }
-            )
-        )
+    return get_logs_within_block_number_range_from_jsonrpc(
+        {"topics": [TRANSFER_TOPIC, _address_topic(address)]},
+        from_block_number,
+        to_block_number,
     )
 
 
@@ -237,20 +1180,10 @@ def get_address_ERC721_NFT_transfers_within_block_number_range_from_jsonrpc(
     """
     address = Web3.to_checksum_address(address)
 
-    return json.loads(
-        Web3.to_json(
-            w3.eth.get_logs(
-                {
-                    "fromBlock": from_block_number,
-                    "toBlock": to_block_number,
-                    "topics": [
-                        Web3.keccak(text="Transfer(address,address,uint256)").hex(),
-                        "0x" + "0" * 24 + Web3.to_bytes(hexstr=address).hex(),
-                        None,
-                    ],
-                }
-            )
-        )
+    return get_logs_within_block_number_range_from_jsonrpc(
+        {"topics": [TRANSFER_TOPIC, _address_topic(address), None]},
+        from_block_number,
+        to_block_number,
     )
 
 
@@ -271,23 +1204,10 @@ def get_address_ERC1155_NFT_single_transfers_within_block_number_range_from_json
         List[FilterTrace]: A list of ERC1155 NFT single transfer logs within the specified block number range.
     """
     address = Web3.to_checksum_address(address)
-    return json.loads(
-        Web3.to_json(
-            w3.eth.get_logs(
-                {
-                    "fromBlock": from_block_number,
-                    "toBlock": to_block_number,
-                    "topics": [
-                        Web3.keccak(
-                            text="TransferSingle(address,address,address,uint256,uint256)"
-                        ).hex(),
-                        "0x" + "0" * 24 + Web3.to_bytes(hexstr=address).hex(),
-                        None,
-                        None,
-                    ],
-                }
-            )
-        )
+    return get_logs_within_block_number_range_from_jsonrpc(
+        {"topics": [TRANSFER_SINGLE_TOPIC, _address_topic(address)]},
+        from_block_number,
+        to_block_number,
     )
 
 
@@ -308,21 +1228,10 @@ def get_address_ERC1155_NFT_batch_transfers_within_block_number_range_from_jsonr
         List[FilterTrace]: A list of ERC1155 NFT batch transfer logs within the specified block number range.
     """
     address = Web3.to_checksum_address(address)
-    return Web3.to_json(
-        w3.eth.get_logs(
-            {
-                "fromBlock": from_block_number,
-                "toBlock": to_block_number,
-                "topics": [
-                    w3.keccak(
-                        text="TransferBatch(address,address,address,uint256[],uint256[])"
-                    ),
-                    w3.to_bytes(address, "address").hex(),
-                    None,
-                    None,
-                ],
-            }
-        )
+    return get_logs_within_block_number_range_from_jsonrpc(
+        {"topics": [TRANSFER_BATCH_TOPIC, _address_topic(address)]},
+        from_block_number,
+        to_block_number,
     )
 
 
@@ -358,22 +1267,15 @@ def get_contract_storage_at_block_number_from_jsonrpc(
 
 
 # 查询合约事件日志
-@DeprecationWarning
 def get_contract_events_within_block_number_range_from_jsonrpc(
     contract_address: str, from_block_number: int, to_block_number: int
 ) -> list:
     contract_address = Web3.to_checksum_address(contract_address)
 
-    return json.loads(
-        Web3.to_json(
-            w3.eth.get_logs(
-                {
-                    "fromBlock": from_block_number,
-                    "toBlock": to_block_number,
-                    "address": contract_address,
-                }
-            )
-        )
+    return get_logs_within_block_number_range_from_jsonrpc(
+        {"address": contract_address},
+        from_block_number,
+        to_block_number,
     )
 
 
@@ -382,10 +1284,57 @@ class AddressType:
     CA = "CA"
 
 
-def get_address_type_from_jsonrpc(address: str) -> str:
-    address = Web3.to_checksum_address(address)
-    code = w3.eth.get_code(address)
-    return AddressType.EOA if code == b"" else AddressType.CA
+# whether an address holds code practically never changes, so its type is kept
+# for the whole process: per block for historical lookups, once for "latest"
+ADDRESS_TYPE_CACHE_SIZE = 100_000
+_address_types: "collections.OrderedDict[Tuple[str, Optional[int]], str]" = (
+    collections.OrderedDict()
+)
+_address_types_lock = threading.Lock()
+
+
+def get_address_types_from_jsonrpc(
+    addresses: Sequence[str], block_number: Optional[int] = None
+) -> Dict[str, str]:
+    """
+    Get the types of many addresses, the uncached ones with one batch of eth_getCode
+
+    Args:
+        addresses (Sequence[str]): addresses, duplicates are resolved once
+        block_number (Optional[int]): the block to check the code at, latest if None
+
+    Returns:
+        Dict[str, str]: `AddressType` keyed by the addresses as given
+    """
+    keys = {address: Web3.to_checksum_address(address).lower() for address in addresses}
+    types = {}
+    with _address_types_lock:
+        for address in set(keys.values()):
+            address_type = _address_types.get((address, block_number))
+            if address_type is not None:
+                _address_types.move_to_end((address, block_number))
+                types[address] = address_type
+
+    missing = [address for address in set(keys.values()) if address not in types]
+    if missing:
+        block = hex(block_number) if block_number is not None else "latest"
+        codes = batch_request_from_jsonrpc(
+            [("eth_getCode", [address, block]) for address in missing]
+        )
+        with _address_types_lock:
+            for address, code in zip(missing, codes):
+                types[address] = _address_type_from_code(code)
+                _address_types[(address, block_number)] = types[address]
+            while len(_address_types) > ADDRESS_TYPE_CACHE_SIZE:
+                _address_types.popitem(last=False)
+
+    return {address: types[key] for address, key in keys.items()}
+
+
+def get_address_type_from_jsonrpc(
+    address: str, block_number: Optional[int] = None
+) -> str:
+    return get_address_types_from_jsonrpc([address], block_number)[address]
 
 
 # 查询各类代币标准(ERC20/721/1155)的转账事件
@@ -394,21 +1343,10 @@ def get_contract_token_transfers_within_block_number_range_from_jsonrpc(
 ) -> list:
     contract_address = Web3.to_checksum_address(contract_address)
 
-    return json.loads(
-        Web3.to_json(
-            w3.eth.get_logs(
-                {
-                    "fromBlock": from_block_number,
-                    "toBlock": to_block_number,
-                    "address": contract_address,
-                    "topics": [
-                        w3.keccak(text="Transfer(address,address,uint256)"),
-                        None,
-                        None,
-                    ],
-                }
-            )
-        )
+    return get_logs_within_block_number_range_from_jsonrpc(
+        {"address": contract_address, "topics": [TRANSFER_TOPIC]},
+        from_block_number,
+        to_block_number,
     )
 
 
@@ -416,21 +1354,10 @@ def get_contract_ERC721_NFT_transfers_within_block_number_range_from_jsonrpc(
     contract_address: str, from_block_number: int, to_block_number: int
 ) -> list:
     contract_address = Web3.to_checksum_address(contract_address)
-    return json.loads(
-        Web3.to_json(
-            w3.eth.get_logs(
-                {
-                    "fromBlock": from_block_number,
-                    "toBlock": to_block_number,
-                    "address": contract_address,
-                    "topics": [
-                        w3.keccak(text="Transfer(address,address,uint256)"),
-                        None,
-                        None,
-                    ],
-                }
-            )
-        )
+    return get_logs_within_block_number_range_from_jsonrpc(
+        {"address": contract_address, "topics": [TRANSFER_TOPIC]},
+        from_block_number,
+        to_block_number,
     )
 
 
@@ -439,22 +1366,10 @@ def get_contract_ERC1155_NFT_single_transfers_within_block_number_range_from_jso
 ) -> list:
     contract_address = Web3.to_checksum_address(contract_address)
 
-    return json.loads(
-        w3.eth.get_logs(
-            {
-                "fromBlock": from_block_number,
-                "toBlock": to_block_number,
-                "address": contract_address,
-                "topics": [
-                    w3.keccak(
-                        text="TransferSingle(address,address,address,uint256,uint256)"
-                    ),
-                    None,
-                    None,
-                    None,
-                ],
-            }
-        )
+    return get_logs_within_block_number_range_from_jsonrpc(
+        {"address": contract_address, "topics": [TRANSFER_SINGLE_TOPIC]},
+        from_block_number,
+        to_block_number,
     )
 
 
@@ -463,22 +1378,10 @@ def get_contract_ERC1155_NFT_batch_transfers_within_block_number_range_from_json
 ) -> list:
     contract_address = Web3.to_checksum_address(contract_address)
 
-    return json.loads(
-        w3.eth.get_logs(
-            {
-                "fromBlock": from_block_number,
-                "toBlock": to_block_number,
-                "address": contract_address,
-                "topics": [
-                    w3.keccak(
-                        text="TransferBatch(address,address,address,uint256[],uint256[])"
-                    ),
-                    None,
-                    None,
-                    None,
-                ],
-            }
-        )
+    return get_logs_within_block_number_range_from_jsonrpc(
+        {"address": contract_address, "topics": [TRANSFER_BATCH_TOPIC]},
+        from_block_number,
+        to_block_number,
     )
 
 
@@ -501,22 +1404,24 @@ class ContractBasicProperties(TypedDict):
     may_self_destructed: bool
 
 
-def check_is_ERC1167_proxy(contract_address: str, block_number: int) -> Optional[str]:
-    """检查合约是否是 EIP-1967 Proxy"""
+ERC1167_PREFIX = "363d3d373d3d3d363d73"
+ERC1167_SUFFIX = "5af43d82803e903d91602b57fd5bf3"
 
-    code = w3.eth.get_code(contract_address, block_identifier=block_number).hex()
+
+def _ERC1167_implementation(code: str) -> Optional[str]:
     code = code.removeprefix("0x")
+    if code.startswith(ERC1167_PREFIX) and code.endswith(ERC1167_SUFFIX):
+        return Web3.to_checksum_address(
+            "0x" + code.removesuffix(ERC1167_SUFFIX).removeprefix(ERC1167_PREFIX)
+        )
+    return None
 
-    # EIP-1967 固定结构的前缀和后缀
-    prefix = "363d3d373d3d3d363d73"
-    suffix = "5af43d82803e903d91602b57fd5bf3"
 
-    if code.startswith(prefix) and code.endswith(suffix):
-        return w3.to_checksum_address(
-            "0x" + code.removesuffix(suffix).removeprefix(prefix)
-        )
-    else:
-        return None
+def check_is_ERC1167_proxy(contract_address: str, block_number: int) -> Optional[str]:
+    """检查合约是否是 EIP-1167 Minimal Proxy"""
+
+    code = w3.eth.get_code(contract_address, block_identifier=block_number).hex()
+    return _ERC1167_implementation(code)
 
 
 # IMPLEMENTATION_SLOT = Web3.keccak(text="eip1967.proxy.implementation") - 1
@@ -525,84 +1430,176 @@ IMPLEMENTATION_SLOT = (
 )
 
 
+def _ERC1967_implementation(code: str, storage_value: str) -> Optional[str]:
+    # 没有 DELEGATECALL 或存储槽数据为空，说明不是 EIP-1967 Proxy
+    if "f4" not in code or int(storage_value, 16) == 0:
+        return None
+
+    # 取存储槽数据的最后 20 字节转换为地址格式
+    return Web3.to_checksum_address("0x" + storage_value[-40:])
+
+
 def check_is_ERC1967_proxy(contract_address: str, block_number: int) -> Optional[str]:
     """检查合约是否是 EIP-1967 Proxy"""
 
-    if (
-        not "f4"
-        in w3.eth.get_code(contract_address, block_identifier=block_number).hex()
-    ):
+    code = w3.eth.get_code(contract_address, block_identifier=block_number).hex()
+    storage_value = w3.eth.get_storage_at(
+        contract_address, IMPLEMENTATION_SLOT, block_identifier=block_number
+    ).hex()
+    return _ERC1967_implementation(code, storage_value)
+
+
+_BASIC_INFO_SELECTORS = [
+    selector("name()"),
+    selector("symbol()"),
+    selector("totalSupply()"),
+    selector("decimals()"),
+    selector("owner()"),
+]
+
+
+def _decode_str(success: bool, data: bytes) -> Optional[str]:
+    if not success or not data:
         return None
+    try:
+        (text,) = decode(["string"], data)
+    except Exception:
+        # some old tokens (e.g. MKR) return bytes32 instead of string
+        text = data[:32].rstrip(b"\x00").decode("utf-8", errors="ignore")
+    return "".join(filter(lambda x: x in string.printable, text)).strip() or None
 
-    storage_value = w3.eth.get_storage_at(contract_address, IMPLEMENTATION_SLOT)
 
-    # 如果存储槽数据为空，说明不是 EIP-1967 Proxy
-    if int(storage_value.hex(), 16) == 0:
+def _decode_int(success: bool, data: bytes) -> Optional[int]:
+    if not success:
         return None
+    return Web3.to_int(data[:32])
 
-    # 取存储槽数据的最后 20 字节转换为地址格式
-    implementation_address = Web3.to_checksum_address(storage_value[-20:].hex())
-    return implementation_address
 
+def _decode_address(success: bool, data: bytes) -> Optional[str]:
+    if not success or len(data) < 20:
+        return None
+    return Web3.to_checksum_address(data[:32][-20:])
 
-def get_contract_basic_info_from_jsonrpc(
-    contract_address: str, block_number: int
-) -> ContractBasicProperties:
-    contract_address = Web3.to_checksum_address(contract_address)
 
-    is_ERC1167_proxy = check_is_ERC1167_proxy(contract_address, block_number)
-    is_ERC1967_proxy = check_is_ERC1967_proxy(contract_address, block_number)
+def get_contracts_basic_info_from_jsonrpc(
+    contract_addresses: List[str], block_number: int
+) -> List[ContractBasicProperties]:
+    """
+    Get the basic properties of many contracts at a block in one batched round trip
 
-    default_name = (
-        "No Name"
-        if not is_ERC1167_proxy
-        else "ERC1167Proxy" if not is_ERC1967_proxy else "ERC1967Proxy"
-    )
+    Every contract's code and EIP-1967 implementation slot is fetched once, and
+    the name/symbol/totalSupply/decimals/owner view calls of all contracts go
+    into one Multicall3 `aggregate3` call where each of them may fail.
 
-    return ContractBasicProperties(
-        name=_try_w3_call_fetch_str(
-            {
-                "to": contract_address,
-                "data": w3.keccak(text="name()").hex()[:10],
-            },
-            block_number,
-        )
-        or default_name,
-        is_proxy=is_ERC1167_proxy or is_ERC1967_proxy,
-        symbol=_try_w3_call_fetch_str(
-            {
-                "to": contract_address,
-                "data": w3.keccak(text="symbol()").hex()[:10],
-            },
-            block_number,
-        )
-        or "Not Proxy",
-        total_supply=_try_w3_call_fetch_int(
-            {
-                "to": contract_address,
-                "data": w3.keccak(text="totalSupply()").hex()[:10],
-            },
-            block_number,
+    Args:
+        contract_addresses (List[str]): contract addresses
+        block_number (int): block number
+
+    Returns:
+        List[ContractBasicProperties]: the properties in the order of the addresses
+    """
+    contract_addresses = [
+        Web3.to_checksum_address(address) for address in contract_addresses
+    ]
+    block = hex(block_number)
+
+    calls = [
+        (address, function_selector)
+        for address in contract_addresses
+        for function_selector in _BASIC_INFO_SELECTORS
+    ]
+    rpc_calls = []
+    for address in contract_addresses:
+        rpc_calls.append(("eth_getCode", [address, block]))
+        rpc_calls.append(
+            ("eth_getStorageAt", [address, hex(IMPLEMENTATION_SLOT), block])
         )
-        or "No Total Supply",
-        decimals=_try_w3_call_fetch_int(
-            {
-                "to": contract_address,
-                "data": w3.keccak(text="decimals()").hex()[:10],
-            },
-            block_number,
+    multicall_rpc_calls = _multicall_rpc_calls(calls, block_number)
+    rpc_calls.extend(multicall_rpc_calls)
+
+    raw_results = batch_request_from_jsonrpc(rpc_calls, raise_on_error=False)
+    call_results = _multicall_results(
+        calls, block_number, raw_results[2 * len(contract_addresses) :]
+    )
+
+    infos = []
+    for i, address in enumerate(contract_addresses):
+        code = raw_results[2 * i] or "0x"
+        storage_value = raw_results[2 * i + 1] or "0x0"
+        name, symbol, total_supply, decimals, owner = call_results[
+            len(_BASIC_INFO_SELECTORS) * i : len(_BASIC_INFO_SELECTORS) * (i + 1)
+        ]
+
+        is_ERC1167_proxy = _ERC1167_implementation(code)
+        is_ERC1967_proxy = _ERC1967_implementation(code, storage_value)
+        default_name = (
+            "No Name"
+            if not is_ERC1167_proxy
+            else "ERC1167Proxy" if not is_ERC1967_proxy else "ERC1967Proxy"
         )
-        or "No Decimals",
-        owner=_try_w3_call_fetch_address(
-            {
-                "to": contract_address,
-                "data": w3.keccak(text="owner()").hex()[:10],
-            },
-            block_number,
+
+        infos.append(
+            ContractBasicProperties(
+                name=_decode_str(*name) or default_name,
+                is_proxy=is_ERC1167_proxy or is_ERC1967_proxy,
+                symbol=_decode_str(*symbol) or "Not Proxy",
+                total_supply=_decode_int(*total_supply) or "No Total Supply",
+                decimals=_decode_int(*decimals) or "No Decimals",
+                owner=_decode_address(*owner) or "No Explicit Owner",
+                may_self_destructed=code == "0x",
+            )
         )
-        or "No Explicit Owner",
-        may_self_destructed=w3.eth.get_code(contract_address, block_number) == b"",
+
+    return infos
+
+
+def get_contract_basic_info_from_jsonrpc(
+    contract_address: str, block_number: int
+) -> ContractBasicProperties:
+    return get_contracts_basic_info_from_jsonrpc([contract_address], block_number)[0]
+
+
+def _fetch_block_timestamps(block_numbers: List[int]) -> List[int]:
+    headers = batch_request_from_jsonrpc(
+        [("eth_getBlockByNumber", [hex(n), False]) for n in block_numbers]
     )
+    for n, header in zip(block_numbers, headers):
+        if header is None:
+            raise ValueError(f"Block {n} does not exist yet")
+    return [int(header["timestamp"], 16) for header in headers]
+
+
+block_timestamps = BlockTimestamps(
+    os.path.join(CACHE_DIR, "block_timestamps.v2.u32"),
+    fetch=_fetch_block_timestamps,
+    finalized=get_finalized_block_number_from_jsonrpc,
+)
+
+
+def get_block_timestamp_from_jsonrpc(block_number: int) -> int:
+    """
+    Get the unix timestamp of a block, from the local block timestamp index once known
+
+    Args:
+        block_number (int): block number
+
+    Returns:
+        int: the unix timestamp of the block
+    """
+    return block_timestamps.get(block_number)
+
+
+def get_block_number_at_time_from_jsonrpc(timestamp: int) -> int:
+    """
+    Get the last block produced at or before a unix timestamp
+
+    Args:
+        timestamp (int): unix timestamp
+
+    Returns:
+        int: the block number
+    """
+    return block_timestamps.block_number_at(timestamp, w3.eth.block_number)
 
 
 def get_transaction_time_from_jsonrpc(transaction_hash: str) -> str:
@@ -615,10 +1612,8 @@ def get_transaction_time_from_jsonrpc(transaction_hash: str) -> str:
         str: The time of the transaction
     """
     tx = get_transaction_from_jsonrpc(transaction_hash)
-    block_number = tx["blockNumber"]
-    block = w3.eth.get_block(block_number)
-    timestamp = block["timestamp"]
+    timestamp = get_block_timestamp_from_jsonrpc(tx["blockNumber"])
 
-    print(timestamp)
-
-    return datetime.fromtimestamp(int(timestamp)).strftime("%Y-%m-%d %H:%M:%S")
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
@@ -51,20 +51,20 @@ def test_get_address_eth_balance_at_block_number_from_json() -> int:
     )
 
 
-# def test_get_address_transactions_within_block_number_range_from_jsonrpc() -> str:
-#     check_jsonable(
-#         get_address_transactions_within_block_number_range_from_jsonrpc(
-#             vitalik_EOA_address, 20_000_000 - 10, 20_000_000
-#         )
-#     )
+def test_get_address_transactions_within_block_number_range_from_jsonrpc() -> str:
+    check_jsonable(
+        get_address_transactions_within_block_number_range_from_jsonrpc(
+            vitalik_EOA_address, 20_000_000 - 10, 20_000_000
+        )
+    )
 
 
-# def test_get_address_ERC20_token_balance_at_block_number_from_jsonrpc() -> int:
-#     check_jsonable(
-#         get_address_token_balance_at_block_number_from_jsonrpc(
-#             vitalik_EOA_address, WETH_contract_address, 20_000_000
-#         )
-#     )
+def test_get_address_ERC20_token_balance_at_block_number_from_jsonrpc() -> int:
+    check_jsonable(
+        get_address_token_balance_at_block_number_from_jsonrpc(
+            vitalik_EOA_address, WETH_contract_address, 20_000_000
+        )
+    )
 
 
 # def test_get_address_ERC20_token_transfers_within_block_number_range_from_jsonrpc() -> (
@@ -209,3 +209,251 @@ def test_get_transaction_time_from_jsonrpc() -> str:
     )
     print(time)
     check_jsonable(time)
+
+
+def test_is_rpc_request_cacheable():
+    assert is_rpc_request_cacheable("eth_getBalance", [vitalik_EOA_address, "0x1312d00"])
+    assert not is_rpc_request_cacheable("eth_getBalance", [vitalik_EOA_address, "latest"])
+    assert is_rpc_request_cacheable("eth_getTransactionByHash", ["0x43a2"])
+    assert is_rpc_request_cacheable("eth_getLogs", [{"fromBlock": "0x1", "toBlock": "0x2"}])
+    assert not is_rpc_request_cacheable("eth_getLogs", [{"fromBlock": "0x1"}])
+    assert not is_rpc_request_cacheable("eth_blockNumber", [])
+
+
+def test_is_rpc_result_final():
+    finalized = 20_000_000
+    assert is_rpc_result_final(
+        "eth_getCode", [WETH_contract_address, hex(finalized)], "0x60", finalized
+    )
+    assert not is_rpc_result_final(
+        "eth_getCode", [WETH_contract_address, hex(finalized + 1)], "0x60", finalized
+    )
+    assert is_rpc_result_final(
+        "eth_getTransactionReceipt", ["0x43a2"], {"blockNumber": hex(finalized)}, finalized
+    )
+    assert not is_rpc_result_final("eth_getTransactionByHash", ["0x43a2"], None, finalized)
+
+
+def test_get_transaction_facts_from_jsonrpc():
+    facts = get_transaction_facts_from_jsonrpc(
+        "0x43a2cb2a2a4fa683a67db6f828d2db99e1253a33a8eb1032915e50f71d85a9f0"
+    )
+    check_jsonable(facts)
+    assert facts["transaction"]["blockNumber"] == facts["receipt"]["blockNumber"]
+    assert facts["from_address_type"] == AddressType.EOA
+
+
+def test_batch_request_from_jsonrpc():
+    code, balance = batch_request_from_jsonrpc(
+        [
+            ("eth_getCode", [WETH_contract_address, "0x1312d00"]),
+            ("eth_getBalance", [vitalik_EOA_address, "0x1312d00"]),
+        ]
+    )
+    assert code != "0x"
+    assert int(balance, 16) > 0
+
+
+def test_batch_request_from_jsonrpc_chunks_batches(monkeypatch, http_response):
+    import LLM4Intent.tools.jsonrpc as jsonrpc
+
+    sizes = []
+
+    def post(url, json, timeout):
+        sizes.append(len(json))
+        return http_response([{"id": call["id"], "result": "0x1"} for call in json])
+
+    monkeypatch.setattr(jsonrpc, "JSONRPC_BATCH_SIZE", 2)
+    monkeypatch.setattr(jsonrpc._batch_session, "post", post)
+    # "latest" is never cached, every call goes to the node
+    calls = [("eth_getBalance", [vitalik_EOA_address, "latest"])] * 5
+    assert batch_request_from_jsonrpc(calls) == ["0x1"] * 5
+    assert sizes == [2, 2, 1]
+
+
+def test_batch_request_from_jsonrpc_uncached(monkeypatch, tmp_path, http_response):
+    import LLM4Intent.tools.jsonrpc as jsonrpc
+    from LLM4Intent.common.disk_cache import DiskCache
+
+    cache = DiskCache(str(tmp_path / "rpc.sqlite3"))
+    monkeypatch.setattr(jsonrpc, "rpc_cache", cache)
+    monkeypatch.setattr(
+        jsonrpc._batch_session,
+        "post",
+        lambda *a, **k: http_response([{"id": 0, "result": "0x1"}]),
+    )
+    # a final block, it would be cached if the cache was used
+    calls = [("eth_getBalance", [vitalik_EOA_address, "0x1"])]
+    assert batch_request_from_jsonrpc(calls, cached=False) == ["0x1"]
+    assert cache.size() == 0
+
+
+def test_address_transactions_from_trace_filter_in_chunks(monkeypatch, http_response):
+    import LLM4Intent.tools.jsonrpc as jsonrpc
+
+    hashes = ["0x%064x" % i for i in range(250)]
+    sizes = []
+
+    def answer(call):
+        if call["method"] == "trace_filter":
+            result = [{"transactionHash": h, "traceAddress": []} for h in hashes]
+        else:
+            i = hashes.index(call["params"][0])
+            result = {
+                "hash": call["params"][0],
+                "blockNumber": hex(100 + i),
+                "transactionIndex": "0x0",
+            }
+        return {"id": call["id"], "result": result}
+
+    def post(url, json, timeout):
+        sizes.append(len(json))
+        return http_response([answer(call) for call in json])
+
+    monkeypatch.setattr(jsonrpc, "_trace_filter_supported", None)
+    # nothing is final, so nothing is cached
+    monkeypatch.setattr(jsonrpc, "_fetch_finalized_block_number", lambda _: 0)
+    monkeypatch.setattr(jsonrpc, "format_rpc_result", lambda method, result: result)
+    monkeypatch.setattr(jsonrpc._batch_session, "post", post)
+    txs = get_address_transactions_within_block_number_range_from_jsonrpc(
+        vitalik_EOA_address, 100, 1000
+    )
+    assert [tx["hash"] for tx in txs] == hashes
+    assert jsonrpc._trace_filter_supported
+    assert sizes == [2, 100, 100, 50]
+
+
+def test_multicall_rpc_calls_before_multicall3():
+    import LLM4Intent.tools.jsonrpc as jsonrpc
+
+    calls = [(WETH_contract_address, s) for s in jsonrpc._BASIC_INFO_SELECTORS]
+    assert jsonrpc._multicall_rpc_calls(calls, 14_000_000) == [
+        ("eth_call", [{"to": WETH_contract_address, "data": data}, hex(14_000_000)])
+        for data in [
+            "0x06fdde03",
+            "0x95d89b41",
+            "0x18160ddd",
+            "0x313ce567",
+            "0x8da5cb5b",
+        ]
+    ]
+
+
+def test_get_contracts_basic_info_from_jsonrpc():
+    infos = get_contracts_basic_info_from_jsonrpc(
+        [WETH_contract_address, vitalik_EOA_address], 20_000_000
+    )
+    check_jsonable(infos)
+    assert infos[0]["symbol"] == "WETH"
+    assert infos[0]["decimals"] == 18
+    assert infos[1]["may_self_destructed"]
+
+
+def test_get_balances_at_block_numbers_from_jsonrpc():
+    rows = get_balances_at_block_numbers_from_jsonrpc(
+        [(vitalik_EOA_address, ETH), (vitalik_EOA_address, WETH_contract_address)],
+        [19_999_999, 20_000_000],
+    )
+    check_jsonable(rows)
+    assert rows[0][1] == get_address_eth_balance_at_block_number_from_jsonrpc(
+        vitalik_EOA_address, 20_000_000
+    )
+    # before Multicall3 the balances come from plain calls
+    old_rows = get_balances_at_block_numbers_from_jsonrpc(
+        [(vitalik_EOA_address, ETH)], [14_000_000]
+    )
+    assert old_rows[0][0] == get_address_eth_balance_at_block_number_from_jsonrpc(
+        vitalik_EOA_address, 14_000_000
+    )
+
+
+def test_iter_logs_from_jsonrpc_bisects_dense_ranges(monkeypatch):
+    import LLM4Intent.tools.jsonrpc as jsonrpc
+
+    # one log per block, ranges of more than 10 blocks are refused
+    def get_logs_chunk(log_filter, from_block, to_block):
+        if to_block - from_block + 1 > 10:
+            raise jsonrpc.TooManyLogsError("query returned more than 10 results")
+        return [{"blockNumber": n} for n in range(from_block, to_block + 1)]
+
+    monkeypatch.setattr(jsonrpc, "_get_logs_chunk", get_logs_chunk)
+    logs = list(iter_logs_from_jsonrpc({}, 100, 1099, max_workers=4))
+    assert [log["blockNumber"] for log in logs] == list(range(100, 1100))
+
+
+def test_get_logs_chunk_caches_finalized_ranges(monkeypatch, tmp_path):
+    import LLM4Intent.tools.jsonrpc as jsonrpc
+    from LLM4Intent.common.disk_cache import DiskCache
+    from web3.providers import BaseProvider
+
+    requests_sent = []
+
+    def make_request(method, params):
+        requests_sent.append(method)
+        if method == "eth_getBlockByNumber":
+            return {"jsonrpc": "2.0", "id": 0, "result": {"number": hex(1000)}}
+        return {"jsonrpc": "2.0", "id": 0, "result": []}
+
+    class Provider(BaseProvider):
+        def make_request(self, method, params):
+            return make_request(method, params)
+
+    # a client of its own with the cache middleware, answered by make_request
+    node = Web3(Provider())
+    node.middleware_onion.inject(jsonrpc.rpc_cache_middleware, layer=0)
+    monkeypatch.setattr(jsonrpc, "w3", node)
+    monkeypatch.setattr(jsonrpc, "rpc_cache", DiskCache(str(tmp_path / "rpc.sqlite3")))
+    monkeypatch.setitem(jsonrpc._finalized, "fetched_at", 0.0)
+    assert jsonrpc._get_logs_chunk({}, 1, 10) == []
+    assert jsonrpc._get_logs_chunk({}, 1, 10) == []
+    assert requests_sent.count("eth_getLogs") == 1
+
+
+def test_get_erc20_transfers_of_address_from_jsonrpc(monkeypatch):
+    import LLM4Intent.tools.jsonrpc as jsonrpc
+
+    address = vitalik_EOA_address
+    topic = jsonrpc._address_topic(address)
+    other = jsonrpc._address_topic(WETH_contract_address)
+
+    def log(block, index, source, target):
+        return {
+            "address": WETH_contract_address,
+            "blockNumber": block,
+            "logIndex": index,
+            "transactionHash": "0x" + "00" * 32,
+            "transactionIndex": 0,
+            "topics": [jsonrpc.TRANSFER_TOPIC, source, target],
+            "data": hex(block),
+        }
+
+    sent = [log(1, 0, topic, other), log(3, 0, topic, topic)]
+    received = [log(2, 5, other, topic), log(3, 0, topic, topic)]
+
+    def get_logs_chunk(log_filter, from_block, to_block):
+        logs = sent if len(log_filter["topics"]) == 2 else received
+        return [l for l in logs if from_block <= l["blockNumber"] <= to_block]
+
+    monkeypatch.setattr(jsonrpc, "_get_logs_chunk", get_logs_chunk)
+    transfers = get_erc20_transfers_of_address_from_jsonrpc(address, 0, 10)
+    # in block order, the transfer to itself once
+    assert [t["blockNumber"] for t in transfers] == [1, 2, 3]
+    assert transfers[1]["decoded"] == {
+        "from": WETH_contract_address,
+        "to": address,
+        "value": 2,
+    }
+    received_only = get_erc20_transfers_of_address_from_jsonrpc(
+        address, 0, 10, direction="to"
+    )
+    assert [t["blockNumber"] for t in received_only] == [2, 3]
+
+
+def test_get_contract_events_within_block_number_range_from_jsonrpc():
+    events = get_contract_events_within_block_number_range_from_jsonrpc(
+        WETH_contract_address, 20_000_000, 20_000_100
+    )
+    check_jsonable(events)
+    assert events == sorted(
+        events, key=lambda log: (log["blockNumber"], log["logIndex"])
+    )
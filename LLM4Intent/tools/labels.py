@@ -0,0 +1,335 @@
+import argparse
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import requests
+
+from LLM4Intent.common.disk_cache import CACHE_DIR
+from LLM4Intent.common.utils import get_logger
+
+LABELS_DATABASE_PATH = os.getenv(
+    "LABELS_DATABASE_PATH", os.path.join(CACHE_DIR, "labels.sqlite3")
+)
+# a label dump (JSON or CSV) to refresh the store from, e.g. a nightly export
+LABELS_DATASET_URL = os.getenv("LABELS_DATASET_URL")
+# how often the dump is checked for changes
+LABELS_REFRESH_INTERVAL = int(os.getenv("LABELS_REFRESH_INTERVAL", 24 * 3600))
+# how long an address without labels is not asked the remote service again
+MISS_TTL = 24 * 3600
+# concurrent remote lookups of one batch
+REMOTE_LOOKUP_WORKERS = 8
+
+logger = get_logger("LabelStore")
+
+
+def _label_entries(data) -> Iterable[dict]:
+    # [{"address", ...}] or {address: label / [labels] / {...}}
+    if isinstance(data, list):
+        yield from (entry for entry in data if isinstance(entry, dict))
+        return
+    for address, labels in data.items():
+        for label in labels if isinstance(labels, list) else [labels]:
+            if isinstance(label, dict):
+                yield {"address": address, **label}
+            else:
+                yield {"address": address, "label": label}
+
+
+def parse_label_dataset(text: str) -> List[dict]:
+    """The entries of a JSON or CSV label dump, each with at least an "address" """
+    stripped = text.lstrip()
+    if stripped.startswith(("[", "{")):
+        entries = _label_entries(json.loads(stripped))
+    else:
+        entries = csv.DictReader(io.StringIO(text))
+    return [dict(entry) for entry in entries if entry.get("address")]
+
+
+def _label_key(entry: dict) -> str:
+    return str(entry.get("label") or entry.get("nameTag") or entry.get("name") or "")
+
+
+class LabelStore:
+    """A local SQLite store of address labels, filled from bulk dumps
+
+    Lookups are primary key reads and take many addresses at once. Once a dump
+    is imported the store answers on its own; before that, addresses it does
+    not know are asked to a remote service and remembered, misses included.
+    The file is only opened on first use, importing this module writes nothing.
+    """
+
+    def __init__(self, path: str = LABELS_DATABASE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # only used with the lock held
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = self._open()
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS labels (
+                address TEXT NOT NULL,
+                label TEXT NOT NULL,
+                data TEXT NOT NULL,
+                source TEXT NOT NULL,
+                PRIMARY KEY (address, label)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS misses (
+                address TEXT PRIMARY KEY,
+                checked_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS datasets (
+                source TEXT PRIMARY KEY,
+                etag TEXT,
+                refreshed_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.commit()
+        return conn
+
+    @staticmethod
+    def _rows(entries: Iterable[dict], source: str) -> List[tuple]:
+        return [
+            (entry["address"].lower(), _label_key(entry), json.dumps(entry), source)
+            for entry in entries
+        ]
+
+    def _upsert(self, rows: List[tuple]) -> int:
+        # with the lock held, returns the number of inserted or updated labels
+        before = self._conn.total_changes
+        self._conn.executemany(
+            "INSERT INTO labels (address, label, data, source) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (address, label) DO UPDATE SET "
+            "data = excluded.data, source = excluded.source "
+            "WHERE data != excluded.data",
+            rows,
+        )
+        changed = self._conn.total_changes - before
+        self._conn.executemany(
+            "DELETE FROM misses WHERE address = ?", [(row[0],) for row in rows]
+        )
+        return changed
+
+    def add(self, entries: Iterable[dict], source: str = "remote") -> int:
+        """Store label entries, rewriting only the ones that changed
+
+        Returns:
+            int: The number of inserted or updated labels
+        """
+        rows = self._rows(entries, source)
+        if not rows:
+            return 0
+        with self._lock:
+            changed = self._upsert(rows)
+            self._conn.commit()
+        return changed
+
+    def import_dataset(self, text: str, source: str, etag: Optional[str] = None) -> int:
+        """Import a JSON or CSV dump, see `parse_label_dataset`
+
+        The dump replaces the previous one of the same `source`: its labels
+        missing from the new dump are deleted.
+
+        Returns:
+            int: The number of inserted, updated and deleted labels
+        """
+        rows = self._rows(parse_label_dataset(text), source)
+        keys = {(row[0], row[1]) for row in rows}
+        with self._lock:
+            changed = self._upsert(rows)
+            stale = [
+                key
+                for key in self._conn.execute(
+                    "SELECT address, label FROM labels WHERE source = ?", (source,)
+                )
+                if key not in keys
+            ]
+            self._conn.executemany(
+                "DELETE FROM labels WHERE address = ? AND label = ?", stale
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO datasets (source, etag, refreshed_at) "
+                "VALUES (?, ?, ?)",
+                (source, etag, time.time()),
+            )
+            self._conn.commit()
+        return changed + len(stale)
+
+    def _dataset(self, source: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT etag, refreshed_at FROM datasets WHERE source = ?", (source,)
+            ).fetchone()
+
+    def has_dataset(self) -> bool:
+        with self._lock:
+            return (
+                self._conn.execute("SELECT 1 FROM datasets LIMIT 1").fetchone()
+                is not None
+            )
+
+    def refresh(self, url: str) -> int:
+        """Re-import the dump at `url` if it changed since the last refresh
+
+        The download is conditional on the ETag of the previous one, and only
+        labels that differ from the stored ones are written.
+        """
+        previous = self._dataset(url)
+        headers = {"If-None-Match": previous[0]} if previous and previous[0] else {}
+        response = requests.get(url, headers=headers, timeout=300)
+        if response.status_code == 304:
+            changed = 0
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE datasets SET refreshed_at = ? WHERE source = ?",
+                    (time.time(), url),
+                )
+                self._conn.commit()
+        else:
+            response.raise_for_status()
+            changed = self.import_dataset(
+                response.text, url, response.headers.get("ETag")
+            )
+        logger.info(f"Refreshed labels from {url}, {changed} changed")
+        return changed
+
+    def refresh_if_stale(self, url: str, interval: float) -> int:
+        """Refresh from `url` if its last refresh is older than `interval`
+
+        Meant for the CLI and the parent process before it starts workers, a
+        failed refresh is logged and the stored labels are kept.
+        """
+        previous = self._dataset(url)
+        if previous is not None and time.time() - previous[1] < interval:
+            return 0
+        try:
+            return self.refresh(url)
+        except Exception as e:
+            logger.error(f"Failed to refresh labels from {url}: {e}")
+            return 0
+
+    def lookup_many(
+        self,
+        addresses: Sequence[str],
+        fetch: Optional[Callable[[str], List[dict]]] = None,
+    ) -> Dict[str, List[dict]]:
+        """The labels of many addresses, an empty list for unlabeled ones
+
+        Args:
+            addresses: The addresses, in any case
+            fetch: Asked for the addresses the store does not know while no
+                dump has been imported, concurrently
+
+        Returns:
+            Dict[str, List[dict]]: The labels keyed by the addresses as given
+        """
+        keys = {address: address.lower() for address in addresses}
+        unique = list(dict.fromkeys(keys.values()))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT address, data FROM labels WHERE address IN ({})".format(
+                    ",".join("?" * len(unique))
+                ),
+                unique,
+            ).fetchall()
+        labels = {address: [] for address in unique}
+        for address, data in rows:
+            labels[address].append(json.loads(data))
+
+        if fetch is not None and not self.has_dataset():
+            missing = [
+                address
+                for address in unique
+                if not labels[address] and not self.is_recent_miss(address)
+            ]
+            if missing:
+                with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=REMOTE_LOOKUP_WORKERS
+                ) as executor:
+                    fetched = list(executor.map(fetch, missing))
+                for address, entries in zip(missing, fetched):
+                    entries = [
+                        {"address": address, **entry}
+                        for entry in entries or []
+                        if isinstance(entry, dict)
+                    ]
+                    if entries:
+                        self.add(entries)
+                        labels[address] = entries
+                    else:
+                        self.add_miss(address)
+
+        return {address: labels[key] for address, key in keys.items()}
+
+    def lookup(
+        self, address: str, fetch: Optional[Callable[[str], List[dict]]] = None
+    ) -> List[dict]:
+        return self.lookup_many([address], fetch)[address]
+
+    def is_recent_miss(self, address: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT checked_at FROM misses WHERE address = ?", (address.lower(),)
+            ).fetchone()
+        return row is not None and time.time() - row[0] < MISS_TTL
+
+    def add_miss(self, address: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO misses (address, checked_at) VALUES (?, ?)",
+                (address.lower(), time.time()),
+            )
+            self._conn.commit()
+
+
+label_store = LabelStore()
+
+
+def refresh_label_dataset() -> int:
+    """Refresh the store from LABELS_DATASET_URL, if set and due"""
+    if not LABELS_DATASET_URL:
+        return 0
+    return label_store.refresh_if_stale(LABELS_DATASET_URL, LABELS_REFRESH_INTERVAL)
+
+
+def start():
+    parser = argparse.ArgumentParser(
+        description="Import address label dumps into the local label store"
+    )
+    parser.add_argument("files", nargs="*", help="JSON or CSV label dumps")
+    parser.add_argument(
+        "--url",
+        default=LABELS_DATASET_URL,
+        help="refresh from a label dump URL (default: $LABELS_DATASET_URL)",
+    )
+    args = parser.parse_args()
+
+    for path in args.files:
+        with open(path) as f:
+            count = label_store.import_dataset(f.read(), os.path.abspath(path))
+        print(f"Imported {count} labels from {path}")
+    if args.url:
+        print(f"Refreshed {label_store.refresh(args.url)} labels from {args.url}")
+
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,58 @@
+from LLM4Intent.tools.labels import LabelStore, parse_label_dataset
+
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+VITALIK = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+
+
+def test_parse_label_dataset():
+    assert parse_label_dataset('{"0xAB": ["a", {"label": "b"}], "0xCD": "c"}') == [
+        {"address": "0xAB", "label": "a"},
+        {"address": "0xAB", "label": "b"},
+        {"address": "0xCD", "label": "c"},
+    ]
+    assert parse_label_dataset("address,label\n0xAB,a\n,empty\n") == [
+        {"address": "0xAB", "label": "a"}
+    ]
+
+
+def test_LabelStore_asks_remote_until_a_dataset_is_imported(tmp_path):
+    path = tmp_path / "labels.sqlite3"
+    store = LabelStore(str(path))
+    assert not path.exists()
+    asked = []
+
+    def fetch(address):
+        asked.append(address)
+        return [{"label": "weth"}] if address == WETH.lower() else []
+
+    labels = store.lookup_many([WETH, VITALIK, WETH], fetch=fetch)
+    assert labels == {WETH: [{"address": WETH.lower(), "label": "weth"}], VITALIK: []}
+    # both the label and the miss are remembered
+    assert store.lookup_many([WETH, VITALIK], fetch=fetch) == labels
+    assert sorted(asked) == sorted([WETH.lower(), VITALIK.lower()])
+
+    dataset = '[{"address": "%s", "label": "vitalik"}]' % VITALIK
+    assert store.import_dataset(dataset, "dump.json") == 1
+    # unchanged labels are not rewritten
+    assert store.import_dataset(dataset, "dump.json") == 0
+    assert store.lookup(VITALIK.lower(), fetch=fetch) == [
+        {"address": VITALIK, "label": "vitalik"}
+    ]
+    assert store.lookup("0x" + "0" * 40, fetch=fetch) == []
+    assert len(asked) == 2
+
+
+def test_LabelStore_dataset_replaces_its_previous_version(tmp_path):
+    store = LabelStore(str(tmp_path / "labels.sqlite3"))
+    store.import_dataset(
+        '{"%s": "weth", "%s": "vitalik"}' % (WETH, VITALIK), "dump.json"
+    )
+    store.import_dataset('{"%s": "other"}' % VITALIK, "other.json")
+
+    # WETH is gone from the new dump, VITALIK got a new label
+    assert store.import_dataset('{"%s": "vitalik.eth"}' % VITALIK, "dump.json") == 3
+    assert store.lookup(WETH) == []
+    assert sorted(label["label"] for label in store.lookup(VITALIK)) == [
+        "other",
+        "vitalik.eth",
+    ]
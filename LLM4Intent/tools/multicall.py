@@ -0,0 +1,60 @@
+from typing import List, Sequence, Tuple
+
+from eth_abi import decode, encode
+from web3 import Web3
+
+# Multicall3 is deployed at the same address on every EVM chain
+# https://github.com/mds1/multicall
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+# the first mainnet block Multicall3 exists at, older blocks need plain eth_calls
+MULTICALL3_DEPLOYED_BLOCK = 14353601
+
+# aggregate3((address target, bool allowFailure, bytes callData)[])
+AGGREGATE3_SELECTOR = Web3.keccak(text="aggregate3((address,bool,bytes)[])")[:4]
+# getEthBalance(address) of Multicall3 itself
+GET_ETH_BALANCE_SELECTOR = Web3.keccak(text="getEthBalance(address)")[:4]
+# balanceOf(address) of ERC20 tokens
+BALANCE_OF_SELECTOR = Web3.keccak(text="balanceOf(address)")[:4]
+# calls per aggregate3, keeps a single eth_call well under the node gas cap
+AGGREGATE3_CHUNK_SIZE = 500
+
+# (target address, calldata) of one call
+Call = Tuple[str, bytes]
+# (success, returned data) of one call
+CallResult = Tuple[bool, bytes]
+
+
+def selector(signature: str) -> bytes:
+    """The 4-byte function selector of a signature like "balanceOf(address)" """
+    return Web3.keccak(text=signature)[:4]
+
+
+def encode_address_argument(function_selector: bytes, address: str) -> bytes:
+    """The calldata of a function taking a single address, e.g. balanceOf(address)"""
+    return function_selector + encode(["address"], [Web3.to_checksum_address(address)])
+
+
+def is_multicall3_available(block_number: int) -> bool:
+    return block_number >= MULTICALL3_DEPLOYED_BLOCK
+
+
+def encode_aggregate3(calls: Sequence[Call]) -> str:
+    """Encode the calldata of an `aggregate3` call, every call is allowed to fail
+
+    Args:
+        calls: (target, calldata) pairs
+
+    Returns:
+        str: The hex calldata to send to MULTICALL3_ADDRESS
+    """
+    encoded = encode(
+        ["(address,bool,bytes)[]"],
+        [[(Web3.to_checksum_address(target), True, data) for target, data in calls]],
+    )
+    return "0x" + (AGGREGATE3_SELECTOR + encoded).hex()
+
+
+def decode_aggregate3(data: str) -> List[CallResult]:
+    """Decode the (success, returned data) results of an `aggregate3` call"""
+    (results,) = decode(["(bool,bytes)[]"], Web3.to_bytes(hexstr=data))
+    return [(success, bytes(returned)) for success, returned in results]
@@ -0,0 +1,15 @@
+from eth_abi import encode
+
+from LLM4Intent.tools.multicall import *
+
+WETH_contract_address = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+
+
+def test_encode_aggregate3():
+    data = encode_aggregate3([(WETH_contract_address, selector("name()"))])
+    assert data.startswith("0x82ad56cb")
+
+
+def test_decode_aggregate3():
+    returned = encode(["(bool,bytes)[]"], [[(True, b"\x01"), (False, b"")]])
+    assert decode_aggregate3("0x" + returned.hex()) == [(True, b"\x01"), (False, b"")]
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+from web3 import Web3
+
+from LLM4Intent.common.disk_cache import CACHE_DIR
+
+SIGNATURE_DATABASE_PATH = os.getenv(
+    "SIGNATURE_DATABASE_PATH", os.path.join(CACHE_DIR, "signatures.sqlite3")
+)
+# a "<hex>,<text>" line of a dump, the separator is the one right after the hex
+_HEX_LINE = re.compile(r"^(0x[0-9a-fA-F]+)[,\t ](.+)$")
+# how long a hex signature unknown to the remote database is not asked again
+MISS_TTL = 24 * 3600
+
+
+class SignatureKind:
+    FUNCTION = "function"
+    EVENT = "event"
+    ERROR = "error"
+
+
+def canonical_type(param: dict) -> str:
+    """The type of an ABI parameter as it appears in signatures, tuples spelled out"""
+    if param["type"].startswith("tuple"):
+        components = ",".join(canonical_type(c) for c in param.get("components", []))
+        return "({}){}".format(components, param["type"][len("tuple") :])
+    return param["type"]
+
+
+def abi_item_signature(item: dict) -> str:
+    """The text signature of an ABI function/event/error, e.g. "transfer(address,uint256)" """
+    return "{}({})".format(
+        item["name"], ",".join(canonical_type(p) for p in item.get("inputs", []))
+    )
+
+
+def signature_hex(text: str, kind: str) -> str:
+    """The selector of a function or error, the topic0 of an event"""
+    digest = Web3.keccak(text=text).hex().removeprefix("0x")
+    return "0x" + (digest if kind == SignatureKind.EVENT else digest[:8])
+
+
+def signature_text(item: Union[str, dict]) -> Optional[str]:
+    """The text of a signature database entry, which may be a string or a dict"""
+    if isinstance(item, str):
+        return item
+    return item.get("text") or item.get("name") or item.get("signature")
+
+
+def abi_signatures(abi: Union[str, list, None]) -> List[Dict[str, str]]:
+    """The {"hex", "text"} entries of the functions, events and errors of an ABI
+
+    Args:
+        abi: The ABI as a list or a JSON string, e.g. from Etherscan
+    """
+    if isinstance(abi, str):
+        try:
+            abi = json.loads(abi)
+        except json.JSONDecodeError:
+            return []
+    return [
+        {
+            "hex": signature_hex(abi_item_signature(item), item["type"]),
+            "text": abi_item_signature(item),
+        }
+        for item in abi or []
+        if isinstance(item, dict)
+        and item.get("type")
+        in (SignatureKind.FUNCTION, SignatureKind.EVENT, SignatureKind.ERROR)
+        and item.get("name")
+    ]
+
+
+class SignatureDatabase:
+    """A local SQLite store of 4-byte function/error selectors and 32-byte event topics
+
+    It is filled by bulk imports of public signature dumps (`import_signatures`)
+    and by hashing every ABI the tools fetch (`add_abi`). Lookups are primary
+    key reads returning [{"hex", "text"}], several texts may share a hex. The
+    file is only opened on first use, importing this module writes nothing.
+    """
+
+    def __init__(self, path: str = SIGNATURE_DATABASE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # only used with the lock held
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = self._open()
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                hex TEXT NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (hex, text)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS misses (
+                hex TEXT PRIMARY KEY,
+                checked_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.commit()
+        return conn
+
+    def add(self, entries: Iterable[Dict[str, str]]) -> int:
+        """Store {"hex", "text"} entries, returns how many were given"""
+        rows = [(entry["hex"].lower(), entry["text"]) for entry in entries]
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO signatures (hex, text) VALUES (?, ?)", rows
+            )
+            self._conn.executemany(
+                "DELETE FROM misses WHERE hex = ?", [(row[0],) for row in rows]
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def add_abi(self, abi: Union[str, list, None]) -> List[Dict[str, str]]:
+        """Hash the functions, events and errors of an ABI locally and store them"""
+        entries = abi_signatures(abi)
+        self.add(entries)
+        return entries
+
+    def lookup(self, hex_signature: str) -> List[Dict[str, str]]:
+        return self.lookup_many([hex_signature])[hex_signature]
+
+    def lookup_many(
+        self, hex_signatures: Sequence[str]
+    ) -> Dict[str, List[Dict[str, str]]]:
+        """The known texts of many hex signatures, an empty list for unknown ones"""
+        results = {hex_signature: [] for hex_signature in hex_signatures}
+        keys = {
+            hex_signature.lower(): hex_signature for hex_signature in hex_signatures
+        }
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT hex, text FROM signatures WHERE hex IN ({})".format(
+                    ",".join("?" * len(keys))
+                ),
+                list(keys),
+            ).fetchall()
+        for hex_signature, text in sorted(rows):
+            results[keys[hex_signature]].append({"hex": hex_signature, "text": text})
+        return results
+
+    def is_recent_miss(self, hex_signature: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT checked_at FROM misses WHERE hex = ?", (hex_signature.lower(),)
+            ).fetchone()
+        return row is not None and time.time() - row[0] < MISS_TTL
+
+    def add_miss(self, hex_signature: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO misses (hex, checked_at) VALUES (?, ?)",
+                (hex_signature.lower(), time.time()),
+            )
+            self._conn.commit()
+
+    def import_signatures(
+        self, lines: Iterable[str], batch_size: int = 100_000
+    ) -> int:
+        """Bulk import a signature dump, one signature per line
+
+        A line is either "<hex>,<text>" / "<hex>\\t<text>" (e.g. 4byte.directory
+        exports) or a bare text signature, which is hashed as a function and as
+        an event.
+
+        Returns:
+            int: The number of stored entries
+        """
+        total = 0
+        batch = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            match = _HEX_LINE.match(line)
+            if match and match.group(2).strip():
+                batch.append({"hex": match.group(1), "text": match.group(2).strip()})
+            else:
+                for kind in (SignatureKind.FUNCTION, SignatureKind.EVENT):
+                    batch.append({"hex": signature_hex(line, kind), "text": line})
+            if len(batch) >= batch_size:
+                total += self.add(batch)
+                batch = []
+        return total + self.add(batch)
+
+    def import_json(self, mapping: Dict[str, Union[str, list]]) -> int:
+        """Bulk import a {hex: text or [texts]} dump"""
+        return self.add(
+            {"hex": hex_signature, "text": signature_text(text)}
+            for hex_signature, texts in mapping.items()
+            for text in (texts if isinstance(texts, list) else [texts])
+            if signature_text(text)
+        )
+
+
+signature_database = SignatureDatabase()
+
+
+def start():
+    parser = argparse.ArgumentParser(
+        description="Import signature dumps into the local signature database"
+    )
+    parser.add_argument(
+        "files", nargs="+", help="text/CSV/TSV dumps or JSON mappings"
+    )
+    args = parser.parse_args()
+
+    for path in args.files:
+        with open(path) as f:
+            if path.endswith(".json"):
+                count = signature_database.import_json(json.load(f))
+            else:
+                count = signature_database.import_signatures(f)
+        print(f"Imported {count} signatures from {path}")
+
+
+if __name__ == "__main__":
+    start()
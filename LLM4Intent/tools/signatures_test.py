@@ -0,0 +1,67 @@
+from LLM4Intent.tools.signatures import SignatureDatabase, abi_signatures
+
+ERC20_TRANSFER_ABI = [
+    {
+        "type": "function",
+        "name": "transfer",
+        "inputs": [{"type": "address"}, {"type": "uint256"}],
+    },
+    {
+        "type": "event",
+        "name": "Transfer",
+        "inputs": [{"type": "address"}, {"type": "address"}, {"type": "uint256"}],
+    },
+]
+
+
+def test_abi_signatures():
+    assert abi_signatures(ERC20_TRANSFER_ABI) == [
+        {"hex": "0xa9059cbb", "text": "transfer(address,uint256)"},
+        {
+            "hex": "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef",
+            "text": "Transfer(address,address,uint256)",
+        },
+    ]
+
+    aggregate3 = {
+        "type": "function",
+        "name": "aggregate3",
+        "inputs": [
+            {
+                "type": "tuple[]",
+                "components": [
+                    {"type": "address"},
+                    {"type": "bool"},
+                    {"type": "bytes"},
+                ],
+            }
+        ],
+    }
+    assert abi_signatures([aggregate3])[0]["hex"] == "0x82ad56cb"
+
+
+def test_SignatureDatabase(tmp_path):
+    path = tmp_path / "signatures.sqlite3"
+    database = SignatureDatabase(str(path))
+    assert not path.exists()
+    database.add_abi(ERC20_TRANSFER_ABI)
+    database.import_signatures(
+        [
+            "0x095ea7b3,approve(address,uint256)",
+            "0x23b872dd\ttransferFrom(address,address,uint256)",
+            "balanceOf(address)",
+        ]
+    )
+
+    assert database.lookup("0xA9059CBB") == [
+        {"hex": "0xa9059cbb", "text": "transfer(address,uint256)"}
+    ]
+    assert database.lookup("0x095ea7b3")[0]["text"] == "approve(address,uint256)"
+    assert database.lookup("0x23b872dd")[0]["text"] == (
+        "transferFrom(address,address,uint256)"
+    )
+    assert database.lookup("0x70a08231")[0]["text"] == "balanceOf(address)"
+    assert database.lookup("0x12345678") == []
+
+    database.add_miss("0x12345678")
+    assert database.is_recent_miss("0x12345678")
@@ -0,0 +1,348 @@
+import bisect
+import collections
+import json
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from LLM4Intent.common.rate_limit import Priority
+from LLM4Intent.tools.etherscan import (
+    get_code_hashes,
+    get_verified_contract_source_code_from_etherscan,
+)
+from LLM4Intent.tools.signatures import (
+    SignatureKind,
+    abi_item_signature,
+    signature_hex,
+)
+
+# a definition longer than this is cut, the model can search the rest
+MAX_DEFINITION_CHARS = 6000
+# longest source line returned by a search
+MAX_LINE_CHARS = 200
+# parsed indexes kept per process, keyed by address and code hash
+SOURCE_INDEX_CACHE_SIZE = 256
+
+_CONTRACT = re.compile(r"\b(contract|interface|library)\s+(\w+)")
+_MEMBER = re.compile(
+    r"\b(?:(function|modifier|event)\s+(\w+)|(constructor|fallback|receive))\s*[(]"
+    r"|\b(modifier)\s+(\w+)"
+)
+
+
+def _mask(source: str) -> str:
+    """The source with comments and string literals blanked, offsets unchanged"""
+    masked = list(source)
+    i, n = 0, len(source)
+    while i < n:
+        if source.startswith("//", i):
+            end = source.find("\n", i)
+            end = n if end == -1 else end
+        elif source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+        elif source[i] in "\"'":
+            end = i + 1
+            while end < n and source[end] not in (source[i], "\n"):
+                end += 2 if source[end] == "\\" else 1
+            end = min(end + 1, n)
+        else:
+            i += 1
+            continue
+        for j in range(i, end):
+            if masked[j] != "\n":
+                masked[j] = " "
+        i = end
+    return "".join(masked)
+
+
+def _definition_end(masked: str, start: int) -> int:
+    """The end of a definition: its `;` or the brace closing its body"""
+    depth = 0
+    i = start
+    while i < len(masked):
+        char = masked[i]
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif depth == 0 and char == ";":
+            return i + 1
+        elif depth == 0 and char == "{":
+            braces = 0
+            for j in range(i, len(masked)):
+                if masked[j] == "{":
+                    braces += 1
+                elif masked[j] == "}":
+                    braces -= 1
+                    if braces == 0:
+                        return j + 1
+            return len(masked)
+        i += 1
+    return len(masked)
+
+
+def _parameter_count(masked: str, open_paren: int) -> int:
+    depth = 0
+    commas = 0
+    for i in range(open_paren, len(masked)):
+        char = masked[i]
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                params = masked[open_paren + 1 : i].strip()
+                return commas + 1 if params else 0
+        elif char == "," and depth == 1:
+            commas += 1
+    return 0
+
+
+def _with_doc_comment(source: str, line_starts: List[int], line: int) -> int:
+    # move the start up over the NatSpec/comment lines right above a definition
+    while line > 0:
+        previous = source[line_starts[line - 1] : line_starts[line]].strip()
+        if not previous.startswith(("///", "/**", "*", "//")):
+            break
+        line -= 1
+    return line
+
+
+def parse_source_files(result: dict) -> Dict[str, str]:
+    """The files of an Etherscan getsourcecode result, {path: content}
+
+    SourceCode is either a single flattened file, a {path: {"content"}} JSON
+    object, or a standard JSON input wrapped in an extra pair of braces.
+    """
+    source = result.get("SourceCode") or ""
+    if source.startswith("{"):
+        try:
+            parsed = json.loads(source[1:-1] if source.startswith("{{") else source)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict):
+            files = parsed.get("sources", parsed)
+            return {
+                path: file["content"]
+                for path, file in files.items()
+                if isinstance(file, dict) and "content" in file
+            }
+    if not source:
+        return {}
+    return {"{}.sol".format(result.get("ContractName") or "Contract"): source}
+
+
+class SourceIndex:
+    """The definitions of verified contract source, to read a piece at a time
+
+    Every file is split into contracts (contracts, interfaces and libraries),
+    then into their functions, modifiers and events, with their lines. The
+    ABI of the Etherscan result maps function selectors to names.
+    """
+
+    def __init__(self, result: dict):
+        self.contract_name = result.get("ContractName", "")
+        self.compiler_version = result.get("CompilerVersion", "")
+        self.implementation = (
+            result.get("Implementation") if result.get("Proxy") == "1" else None
+        )
+        self.files = parse_source_files(result)
+        self.definitions: List[dict] = []
+        for path, content in self.files.items():
+            self._index_file(path, content)
+        self.selectors = self._abi_selectors(result.get("ABI"))
+
+    @staticmethod
+    def _abi_selectors(abi) -> Dict[str, Tuple[str, int]]:
+        try:
+            abi = json.loads(abi) if isinstance(abi, str) else abi
+        except ValueError:
+            return {}
+        return {
+            signature_hex(abi_item_signature(item), SignatureKind.FUNCTION): (
+                item["name"],
+                len(item.get("inputs", [])),
+            )
+            for item in abi or []
+            if isinstance(item, dict) and item.get("type") == SignatureKind.FUNCTION
+        }
+
+    def _index_file(self, path: str, content: str):
+        masked = _mask(content)
+        line_starts = [0] + [m.end() for m in re.finditer("\n", content)]
+
+        def line_of(offset: int) -> int:
+            return bisect.bisect_right(line_starts, offset) - 1
+
+        def definition(kind, name, contract, start, end, **extra):
+            first = _with_doc_comment(content, line_starts, line_of(start))
+            return {
+                "kind": kind,
+                "name": name,
+                "contract": contract,
+                "file": path,
+                "start": line_starts[first],
+                "end": end,
+                "start_line": first + 1,
+                "end_line": line_of(end - 1) + 1,
+                **extra,
+            }
+
+        contracts = []
+        for match in _CONTRACT.finditer(masked):
+            end = _definition_end(masked, match.end())
+            contracts.append((match.start(), end, match.group(2)))
+            kind = match.group(1)
+            if masked[max(0, match.start() - 64) : match.start()].rstrip().endswith(
+                "abstract"
+            ):
+                kind = "abstract contract"
+            self.definitions.append(
+                definition(kind, match.group(2), None, match.start(), end)
+            )
+
+        for match in _MEMBER.finditer(masked):
+            kind = match.group(1) or match.group(4) or match.group(3)
+            name = match.group(2) or match.group(5) or match.group(3)
+            contract = next(
+                (c for start, end, c in contracts if start <= match.start() < end),
+                None,
+            )
+            # scan from the opening parenthesis, if any, so it is balanced
+            opening = match.end() - (masked[match.end() - 1] == "(")
+            end = _definition_end(masked, opening)
+            extra = {}
+            if kind in ("function", "constructor", "fallback", "receive"):
+                extra["parameters"] = _parameter_count(masked, match.end() - 1)
+            self.definitions.append(
+                definition(kind, name, contract, match.start(), end, **extra)
+            )
+
+    def _code(self, item: dict) -> str:
+        code = self.files[item["file"]][item["start"] : item["end"]]
+        if len(code) > MAX_DEFINITION_CHARS:
+            code = code[:MAX_DEFINITION_CHARS] + "\n// ... truncated"
+        return code
+
+    def _public(self, item: dict) -> dict:
+        return {k: v for k, v in item.items() if k not in ("start", "end")}
+
+    def overview(self) -> dict:
+        """The files and the contracts with the names of their members, no code"""
+        members = collections.defaultdict(lambda: collections.defaultdict(list))
+        for item in self.definitions:
+            if item["contract"] is None:
+                continue
+            # constructor, fallback and receive are listed with the functions
+            kind = "function" if "parameters" in item else item["kind"]
+            group = "{}s".format(kind)
+            names = members[(item["file"], item["contract"])][group]
+            if item["name"] not in names:
+                names.append(item["name"])
+        return {
+            "contract_name": self.contract_name,
+            "compiler_version": self.compiler_version,
+            "implementation": self.implementation,
+            "files": [
+                {"path": path, "lines": content.count("\n") + 1}
+                for path, content in self.files.items()
+            ],
+            "contracts": [
+                {
+                    "name": item["name"],
+                    "kind": item["kind"],
+                    "file": item["file"],
+                    **members[(item["file"], item["name"])],
+                }
+                for item in self.definitions
+                if item["contract"] is None
+            ],
+        }
+
+    def get_definitions(
+        self, name: str, contract: Optional[str] = None
+    ) -> List[dict]:
+        """The code of the members (or contracts) named `name` or with selector `name`
+
+        Matches of the verified contract itself come first, then those of the
+        contracts it inherits from or uses.
+        """
+        parameters = None
+        if re.fullmatch(r"0x[0-9a-fA-F]{8}", name):
+            if name.lower() not in self.selectors:
+                return []
+            name, parameters = self.selectors[name.lower()]
+        matches = [
+            item
+            for item in self.definitions
+            if item["name"] == name
+            and (contract is None or item["contract"] == contract)
+            and (parameters is None or item.get("parameters") == parameters)
+        ]
+        matches.sort(key=lambda item: item["contract"] != self.contract_name)
+        return [{**self._public(item), "code": self._code(item)} for item in matches]
+
+    def _enclosing(self, path: str, offset: int) -> Optional[str]:
+        enclosing = None
+        for item in self.definitions:
+            if item["file"] == path and item["start"] <= offset < item["end"]:
+                if enclosing is None or item["start"] >= enclosing["start"]:
+                    enclosing = item
+        if enclosing is None:
+            return None
+        if enclosing["contract"] is None:
+            return enclosing["name"]
+        return "{}.{}".format(enclosing["contract"], enclosing["name"])
+
+    def search(self, term: str, limit: int = 20) -> dict:
+        """The lines containing `term`, case-insensitive, with their definition"""
+        needle = term.lower()
+        matches = []
+        total = 0
+        for path, content in self.files.items():
+            offset = 0
+            for number, line in enumerate(content.split("\n"), start=1):
+                if needle in line.lower():
+                    total += 1
+                    if len(matches) < limit:
+                        matches.append(
+                            {
+                                "file": path,
+                                "line": number,
+                                "text": line.strip()[:MAX_LINE_CHARS],
+                                "in": self._enclosing(path, offset),
+                            }
+                        )
+                offset += len(line) + 1
+        return {"term": term, "total": total, "matches": matches}
+
+
+_indexes: "collections.OrderedDict[Tuple[str, str], Optional[SourceIndex]]" = (
+    collections.OrderedDict()
+)
+_indexes_lock = threading.Lock()
+
+
+def get_source_index(contract_address: str) -> Optional[SourceIndex]:
+    """The index of the verified source of a contract, None if it is not verified"""
+    address = contract_address.lower()
+    key = (address, get_code_hashes([address])[address])
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+
+    response = get_verified_contract_source_code_from_etherscan(
+        contract_address, priority=Priority.HIGH
+    )
+    result = response.get("result")
+    index = None
+    if isinstance(result, list) and result and result[0].get("SourceCode"):
+        index = SourceIndex(result[0])
+
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > SOURCE_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,94 @@
+import json
+
+from LLM4Intent.tools.source_index import SourceIndex, parse_source_files
+
+VAULT_SOURCE = """// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+interface IERC20 {
+    function transfer(address to, uint256 amount) external returns (bool);
+    event Transfer(address indexed from, address indexed to, uint256 value);
+}
+
+abstract contract Ownable {
+    address owner;
+    modifier onlyOwner {
+        require(msg.sender == owner, "not { owner");
+        _;
+    }
+}
+
+contract Vault is Ownable {
+    /* } not a brace */
+    /// @dev sends ETH to the owner
+    function withdraw(uint256 amount) external onlyOwner {
+        if (amount > 0) { payable(owner).transfer(amount); }
+    }
+    function withdraw(uint256 amount, address to) external onlyOwner {}
+    receive() external payable {}
+}
+"""
+WITHDRAW_ABI = [
+    {
+        "type": "function",
+        "name": "withdraw",
+        "inputs": [{"type": "uint256", "name": "amount"}],
+    }
+]
+
+
+def vault_index():
+    return SourceIndex(
+        {
+            "SourceCode": "{"
+            + json.dumps({"sources": {"src/Vault.sol": {"content": VAULT_SOURCE}}})
+            + "}",
+            "ContractName": "Vault",
+            "ABI": json.dumps(WITHDRAW_ABI),
+        }
+    )
+
+
+def test_parse_source_files():
+    assert parse_source_files({"SourceCode": "contract A {}", "ContractName": "A"}) == {
+        "A.sol": "contract A {}"
+    }
+    assert list(vault_index().files) == ["src/Vault.sol"]
+    assert parse_source_files({"SourceCode": ""}) == {}
+
+
+def test_SourceIndex_overview():
+    contracts = vault_index().overview()["contracts"]
+    assert [(c["name"], c["kind"]) for c in contracts] == [
+        ("IERC20", "interface"),
+        ("Ownable", "abstract contract"),
+        ("Vault", "contract"),
+    ]
+    assert contracts[0]["events"] == ["Transfer"]
+    assert contracts[1]["modifiers"] == ["onlyOwner"]
+    assert contracts[2]["functions"] == ["withdraw", "receive"]
+
+
+def test_SourceIndex_get_definitions():
+    index = vault_index()
+    # the selector of withdraw(uint256) picks the one-parameter overload
+    (withdraw,) = index.get_definitions("0x2e1a7d4d")
+    assert withdraw["contract"] == "Vault"
+    assert (withdraw["start_line"], withdraw["end_line"]) == (19, 22)
+    assert withdraw["code"].startswith("    /// @dev sends ETH to the owner")
+    assert withdraw["code"].endswith("transfer(amount); }\n    }")
+
+    (modifier,) = index.get_definitions("onlyOwner")
+    assert modifier["code"].endswith("_;\n    }")
+    assert index.get_definitions("withdraw", contract="Ownable") == []
+
+
+def test_SourceIndex_search():
+    result = vault_index().search("OWNER", limit=2)
+    assert result["total"] == 7
+    assert result["matches"][1] == {
+        "file": "src/Vault.sol",
+        "line": 11,
+        "text": "modifier onlyOwner {",
+        "in": "Ownable.onlyOwner",
+    }
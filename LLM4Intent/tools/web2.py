@@ -1,17 +1,79 @@
+import hashlib
 import os
-from typing import List
+import string
+import unicodedata
+import urllib.parse
+from typing import List, Optional
 import requests
 from tavily import TavilyClient
 from web3 import Web3
 
+from LLM4Intent.common.disk_cache import get_disk_cache
+from LLM4Intent.common.single_flight import SingleFlight
 from LLM4Intent.tools.etherscan import get_verified_contract_abi_from_etherscan
+from LLM4Intent.tools.signatures import (
+    SignatureKind,
+    signature_text,
+    signature_database,
+)
 
 # Step 1. Instantiating your TavilyClient
 tavily_client = TavilyClient(api_key=os.environ.get("TAVILY_API_KEY"))
 
+# paid Tavily calls are cached: searches for a few hours as news moves on,
+# page extractions for a week
+tavily_cache = get_disk_cache(
+    "tavily", max_bytes=int(os.getenv("TAVILY_CACHE_MAX_BYTES", 1 << 30))
+)
+TAVILY_SEARCH_TTL = int(os.getenv("TAVILY_SEARCH_TTL", 6 * 3600))
+TAVILY_EXTRACT_TTL = int(os.getenv("TAVILY_EXTRACT_TTL", 7 * 24 * 3600))
+
+_tavily_flight = SingleFlight()
+
+# full extracted pages, the tools hand out their relevant passages and a handle
+webpage_cache = get_disk_cache(
+    "webpages", max_bytes=int(os.getenv("WEBPAGE_CACHE_MAX_BYTES", 1 << 30))
+)
+
+
+def normalize_search_query(query: str) -> str:
+    """A cache key for queries differing only in case, spacing or punctuation
+
+    Word order and repeated words are kept, they can change the results.
+    """
+    words = (
+        word.strip(string.punctuation)
+        for word in unicodedata.normalize("NFKC", query).lower().split()
+    )
+    return " ".join(word for word in words if word)
+
+
+def normalize_url(url: str) -> str:
+    """A cache key for a URL, without its fragment and with a lowercase host"""
+    parts = urllib.parse.urlsplit(url.strip())
+    return urllib.parse.urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, "")
+    )
+
+
+def _extracted_by_url(response: dict) -> dict:
+    return {
+        normalize_url(result["url"]): result for result in response.get("results", [])
+    }
+
 
 def search_webpages_from_tavily(query) -> dict:
-    response = tavily_client.search(query)
+    key = "search:" + normalize_search_query(query)
+    response = tavily_cache.get(key)
+    if response is None:
+
+        def search():
+            response = tavily_client.search(query)
+            tavily_cache.set(key, response, ttl=TAVILY_SEARCH_TTL)
+            return response
+
+        # concurrent analyzers asking the same thing share one paid call
+        response = _tavily_flight.do(key, search)
 
     print("Search Response:", response)
 
@@ -19,33 +81,101 @@ def search_webpages_from_tavily(query) -> dict:
 
 
 def extract_webpage_info_by_urls_from_tavily(urls: List[str]) -> dict:
-    response = tavily_client.extract(urls)
+    # every page is cached on its own, only the unknown ones are extracted
+    keys = {url: "extract:" + normalize_url(url) for url in urls}
+    results = {url: tavily_cache.get(key) for url, key in keys.items()}
+    missing = sorted({url for url, result in results.items() if result is None})
+    failed_results = []
+    # pages returned under another URL, e.g. after a redirect, are kept uncached
+    unmatched = []
+    if missing:
+
+        def extract():
+            response = tavily_client.extract(missing)
+            extracted = _extracted_by_url(response)
+            for url in missing:
+                result = extracted.get(normalize_url(url))
+                if result is not None:
+                    tavily_cache.set(keys[url], result, ttl=TAVILY_EXTRACT_TTL)
+            return response
+
+        response = _tavily_flight.do(("extract", tuple(missing)), extract)
+        extracted = _extracted_by_url(response)
+        for url in missing:
+            results[url] = extracted.pop(normalize_url(url), None)
+        unmatched = list(extracted.values())
+        failed_results = response.get("failed_results", [])
+
+    response = {
+        "results": [results[url] for url in urls if results[url] is not None]
+        + unmatched,
+        "failed_results": failed_results,
+    }
 
     print("Extract Response:", response)
 
     return response
 
 
-def get_function_signatures_from_signature_database(hex_signature: str) -> dict:
-    response = requests.get(
-        "https://evmlookup.vercel.app/api/keccak256/function?query={query}".format(
-            query=hex_signature
-        )
+def store_webpage(result: dict) -> str:
+    """Keep an extracted page and return the handle to read it back with"""
+    digest = hashlib.sha1(normalize_url(result["url"]).encode()).hexdigest()
+    handle = "page-" + digest[:16]
+    webpage_cache.set(
+        handle,
+        {"url": result["url"], "raw_content": result.get("raw_content") or ""},
+        ttl=TAVILY_EXTRACT_TTL,
     )
-    result = response.json()
+    return handle
+
 
-    return result["data"]
+def load_webpage(handle: str) -> Optional[dict]:
+    return webpage_cache.get(handle)
 
 
-def get_event_signatures_from_signature_database(hex_signature: str) -> dict:
+def _get_signatures(kind: str, hex_signature: str) -> List[dict]:
+    # the local database first, evmlookup only for signatures it has not seen
+    signatures = signature_database.lookup(hex_signature)
+    if signatures or signature_database.is_recent_miss(hex_signature):
+        return signatures
+
     response = requests.get(
-        "https://evmlookup.vercel.app/api/keccak256/event?query={query}".format(
-            query=hex_signature
-        )
+        "https://evmlookup.vercel.app/api/keccak256/{kind}?query={query}".format(
+            kind=kind, query=hex_signature
+        ),
+        timeout=30,
     )
-    result = response.json()
+    # errors propagate, only a successful answer without a match is a miss
+    response.raise_for_status()
+    try:
+        result = response.json()
+    except ValueError as e:
+        raise ValueError(
+            f"Invalid signature service response for {hex_signature}: {e}"
+        ) from e
+    if not isinstance(result, dict):
+        raise ValueError(
+            f"Invalid signature service response for {hex_signature}: {result!r}"
+        )
 
-    return result["data"]
+    signatures = [
+        {"hex": hex_signature.lower(), "text": signature_text(item)}
+        for item in result.get("data") or []
+        if signature_text(item)
+    ]
+    if signatures:
+        signature_database.add(signatures)
+    else:
+        signature_database.add_miss(hex_signature)
+    return signatures
+
+
+def get_function_signatures_from_signature_database(hex_signature: str) -> List[dict]:
+    return _get_signatures(SignatureKind.FUNCTION, hex_signature)
+
+
+def get_event_signatures_from_signature_database(hex_signature: str) -> List[dict]:
+    return _get_signatures(SignatureKind.EVENT, hex_signature)
 
 
 def get_contract_ABI_from_whatsabi(contract_address: str) -> dict:
@@ -59,10 +189,14 @@ def get_contract_ABI_from_whatsabi(contract_address: str) -> dict:
     return result.get("data", {}).get("abi")
 
 
+# one pooled connection to the label service instead of a handshake per address
+_labels_session = requests.Session()
+
+
 def get_address_labels_from_github_repo(address: str) -> list:
     address = Web3.to_checksum_address(address)
     url = f"https://eth-labels-production.up.railway.app/labels/{address}"
 
-    response = requests.get(url)
+    response = _labels_session.get(url, timeout=30)
 
     return response.json()
@@ -1,5 +1,15 @@
+import pytest
+import requests
+
+from LLM4Intent.common.disk_cache import DiskCache
+from LLM4Intent.tools import web2
 from LLM4Intent.tools.annotated import get_function_signature
-from LLM4Intent.tools.web2 import get_address_labels_from_github_repo
+from LLM4Intent.tools.signatures import SignatureDatabase
+from LLM4Intent.tools.web2 import (
+    get_address_labels_from_github_repo,
+    normalize_search_query,
+    normalize_url,
+)
 
 
 def test_get_address_labels_from_github_repo():
@@ -11,3 +21,71 @@ def test_get_function_signature():
     signatures = get_function_signature("0x44087E105137a5095c008AaB6a6530182821F2F0", "0xc71e393f1527f71ce01b78ea87c9bd4fca84f1482359ce7ac9b73f358c61b1e1")
     print(signatures)
     assert signatures == []
+
+
+def test_normalize_search_query():
+    assert normalize_search_query("  Euler Finance exploit, March 2023? ") == (
+        normalize_search_query("euler finance  EXPLOIT march 2023")
+    )
+    # word order and repeated words are part of the query
+    assert normalize_search_query("euler exploit") != (
+        normalize_search_query("exploit euler")
+    )
+    assert normalize_search_query("euler euler") == "euler euler"
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://Rekt.news/euler-rekt/#top") == (
+        "https://rekt.news/euler-rekt/"
+    )
+
+
+def test_get_signatures_records_only_real_misses(tmp_path, monkeypatch, http_response):
+    database = SignatureDatabase(str(tmp_path / "signatures.sqlite3"))
+    monkeypatch.setattr(web2, "signature_database", database)
+
+    for response in (
+        http_response({}, status_code=503),
+        http_response(content=b"<html>not json</html>"),
+    ):
+        monkeypatch.setattr(web2.requests, "get", lambda *a, **k: response)
+        with pytest.raises((requests.HTTPError, ValueError)):
+            web2.get_function_signatures_from_signature_database("0x12345678")
+        assert not database.is_recent_miss("0x12345678")
+
+    monkeypatch.setattr(
+        web2.requests, "get", lambda *a, **k: http_response({"data": []})
+    )
+    assert web2.get_function_signatures_from_signature_database("0x12345678") == []
+    assert database.is_recent_miss("0x12345678")
+
+
+class FakeTavily:
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def extract(self, urls):
+        self.calls.append(urls)
+        return {"results": self.results, "failed_results": []}
+
+
+def test_extract_keeps_pages_returned_under_another_url(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        web2, "tavily_cache", DiskCache(str(tmp_path / "tavily.sqlite3"))
+    )
+    page = {"url": "https://rekt.news/euler-rekt/", "raw_content": "euler"}
+    redirected = {"url": "https://www.example.com/b", "raw_content": "b"}
+    tavily = FakeTavily([page, redirected])
+    monkeypatch.setattr(web2, "tavily_client", tavily)
+
+    urls = ["https://rekt.news/euler-rekt/", "http://example.com/a"]
+    assert web2.extract_webpage_info_by_urls_from_tavily(urls)["results"] == [
+        page,
+        redirected,
+    ]
+    # only the page matching its URL is cached
+    assert web2.extract_webpage_info_by_urls_from_tavily(urls[:1])["results"] == [
+        page
+    ]
+    assert tavily.calls == [sorted(urls)]